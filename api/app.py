@@ -0,0 +1,388 @@
+# api/app.py
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from urllib.parse import parse_qsl
+import asyncio
+import hmac
+import os
+import re
+import sqlite3
+import sys
+
+import orjson
+from pydantic import ValidationError
+
+from api.multipart import MultipartError, MultipartParser, boundary_of
+from utils import bulk, filestore, intake, jobs, jurisdiction, metrics, repository, search, validation
+from utils.db import DB_PATH, get_pool
+from utils.db_init import init_db
+from utils.evidence import get_registry
+
+# JSON API анкеты для клиентов без Streamlit (мобильные приложения, боты).
+# Голое ASGI-приложение: запуск — python -m api.app или uvicorn api.app:app.
+#   POST /cases                             анкета (поля — как в utils/bulk.py) -> 201 {"id"}
+#   GET  /cases/{id}                        дело, доказательства, документы, задачи
+#   POST /cases/{id}/evidence/{evidence_id} файл доказательства, multipart/form-data (поле file)
+#   GET  /cases/{id}/deadlines              сроки по делу
+#   GET  /cases/search?q=...&field=&limit=  поиск по ответчику и описанию (utils/search.py)
+#   GET  /opponents?min_cases=2&limit=50    повторяющиеся ответчики
+#   GET  /jurisdiction?category=&amount=&city=&region=&doc_type=claim
+#                                           подсудность, суд и госпошлина (utils/jurisdiction.py)
+#   GET  /health
+# Правила анкеты — utils/validation.py, сохранение — utils/intake.py (как у формы).
+# Запросы к SQLite идут в потоках (asyncio.to_thread) через общий пул соединений,
+# поэтому цикл событий не ждёт БД; файл пишется в хранилище по мере получения.
+# APP_API_TOKEN: если задан, нужен заголовок Authorization: Bearer <токен>.
+
+MAX_JSON_BYTES = 256 * 1024
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_PAGE = 200  # limit в запросах списков
+API_TOKEN = os.environ.get("APP_API_TOKEN") or None
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, error: str, **extra: object) -> None:
+        super().__init__(error)
+        self.status = status
+        self.payload = {"error": error, **extra}
+
+
+@dataclass
+class Request:
+    scope: dict
+    receive: Callable[[], Awaitable[dict]]
+    params: dict = field(default_factory=dict)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {k.decode("latin-1"): v.decode("latin-1") for k, v in self.scope["headers"]}
+
+    @property
+    def query(self) -> dict[str, str]:
+        return dict(parse_qsl(self.scope.get("query_string", b"").decode("latin-1")))
+
+    def int_param(self, name: str, default: int, low: int = 1, high: int = MAX_PAGE) -> int:
+        try:
+            value = int(self.query.get(name, default))
+        except ValueError:
+            raise HTTPError(400, f"{name}: ожидается целое число") from None
+        if not low <= value <= high:
+            raise HTTPError(400, f"{name}: от {low} до {high}")
+        return value
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "клиент разорвал соединение")
+            if message.get("body"):
+                yield message["body"]
+            if not message.get("more_body"):
+                return
+
+    async def json(self) -> object:
+        body = bytearray()
+        async for chunk in self.stream():
+            body += chunk
+            if len(body) > MAX_JSON_BYTES:
+                raise HTTPError(413, "слишком большой запрос")
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise HTTPError(400, f"некорректный JSON: {e}") from None
+
+
+@dataclass(frozen=True)
+class Response:
+    status: int
+    payload: object
+    headers: tuple[tuple[bytes, bytes], ...] = ()
+
+
+def _pool():
+    return get_pool(DB_PATH)
+
+
+def _case_or_404(conn: sqlite3.Connection, case_id: int) -> sqlite3.Row:
+    case = repository.get_case(conn, case_id)
+    if case is None:
+        raise HTTPError(404, "дело не найдено")
+    return case
+
+
+# =========================
+# Обработчики
+# =========================
+def _save_case(record: bulk.CaseRecord) -> int:
+    try:
+        with _pool().transaction() as conn:
+            return intake.save_case(conn, *record.payloads(get_registry()))
+    except sqlite3.IntegrityError as e:
+        # court_id не из справочника — нарушение внешнего ключа
+        if "FOREIGN KEY" in str(e):
+            raise HTTPError(422, "анкета не прошла проверку", errors={"court_idx": "Суда нет в справочнике."})
+        raise
+
+
+async def create_case(request: Request) -> Response:
+    body = await request.json()
+    if not isinstance(body, dict):
+        raise HTTPError(400, "ожидается объект с полями анкеты")
+    try:
+        record = bulk.CaseRecord.model_validate(body, context={"rules": validation.make_context()})
+    except ValidationError as e:
+        raise HTTPError(422, "анкета не прошла проверку", errors=bulk.errors_of(e)) from None
+    case_id = await asyncio.to_thread(_save_case, record)
+    return Response(201, {"id": case_id, "status": "draft"}, ((b"location", f"/cases/{case_id}".encode()),))
+
+
+def _read_case(case_id: int) -> dict:
+    with _pool().connection() as conn:
+        case = _case_or_404(conn, case_id)
+        return {
+            **dict(case),
+            "evidence": repository.list_case_evidence(conn, case_id),
+            "documents": [
+                {k: d[k] for k in ("id", "doc_type", "mime_type", "file_size", "created_at")}
+                for d in repository.list_documents(conn, case_id)
+            ],
+            "jobs": [dict(j) for j in jobs.list_case_jobs(conn, case_id)],
+        }
+
+
+async def get_case(request: Request) -> Response:
+    return Response(200, await asyncio.to_thread(_read_case, int(request.params["case_id"])))
+
+
+def _check_evidence(case_id: int, evidence_id: str) -> None:
+    with _pool().connection() as conn:
+        case = _case_or_404(conn, case_id)
+    if get_registry().item(case["category"], case["doc_type"], evidence_id) is None:
+        raise HTTPError(422, f"доказательство {evidence_id} не предусмотрено для этого дела")
+
+
+def _attach_evidence(case_id: int, evidence_id: str, stored: filestore.StoredFile, mime_type: Optional[str]) -> int:
+    with _pool().transaction() as conn:
+        _case_or_404(conn, case_id)
+        repository.insert_documents(conn, [{
+            "case_id": case_id,
+            "doc_type": f"evidence:{evidence_id}",
+            "file_path": stored.file_path,
+            "mime_type": mime_type,
+            "file_size": stored.file_size,
+        }])
+        repository.insert_case_evidence(conn, case_id, {evidence_id: 1})
+        return conn.execute(
+            "SELECT document_id FROM CaseEvidence WHERE case_id = ? AND evidence_id = ?",
+            (case_id, evidence_id),
+        ).fetchone()[0]
+
+
+async def upload_evidence(request: Request) -> Response:
+    case_id, evidence_id = int(request.params["case_id"]), request.params["evidence_id"]
+    headers = request.headers
+    boundary = boundary_of(headers.get("content-type", ""))
+    if boundary is None:
+        raise HTTPError(415, "ожидается multipart/form-data")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "content-length: ожидается целое число") from None
+    if length > MAX_UPLOAD_BYTES:
+        raise HTTPError(413, "файл больше допустимого размера")
+    await asyncio.to_thread(_check_evidence, case_id, evidence_id)
+
+    parser = MultipartParser(boundary)
+    writer: Optional[filestore.BlobWriter] = None
+    stored: Optional[filestore.StoredFile] = None
+    mime_type = None
+    current = None
+    try:
+        async for chunk in request.stream():
+            for event, value in parser.feed(chunk):
+                if event == "part":
+                    current = value
+                    if value["name"] == "file" and stored is None and writer is None:
+                        mime_type = value["content_type"]
+                        writer = await asyncio.to_thread(filestore.BlobWriter)
+                elif event == "data" and writer is not None and current["name"] == "file":
+                    if writer.size + len(value) > MAX_UPLOAD_BYTES:
+                        raise HTTPError(413, "файл больше допустимого размера")
+                    await asyncio.to_thread(writer.write, value)
+                elif event == "end" and writer is not None and current["name"] == "file":
+                    stored = await asyncio.to_thread(writer.commit)
+                    writer = None
+    except MultipartError as e:
+        raise HTTPError(400, str(e)) from None
+    finally:
+        if writer is not None:
+            writer.abort()
+    if stored is None or not parser.done:
+        raise HTTPError(400, "в запросе нет файла (поле file)")
+    document_id = await asyncio.to_thread(_attach_evidence, case_id, evidence_id, stored, mime_type)
+    return Response(201, {
+        "document_id": document_id,
+        "evidence_id": evidence_id,
+        "file_size": stored.file_size,
+        "sha256": stored.sha256,
+    })
+
+
+def _read_deadlines(case_id: int) -> list[dict]:
+    with _pool().connection() as conn:
+        _case_or_404(conn, case_id)
+        return [
+            {k: d[k] for k in ("id", "title", "due_date", "status", "source")}
+            for d in repository.list_deadlines(conn, case_id)
+        ]
+
+
+async def list_deadlines(request: Request) -> Response:
+    return Response(200, {"deadlines": await asyncio.to_thread(_read_deadlines, int(request.params["case_id"]))})
+
+
+def _find_cases(query: str, field: Optional[str], limit: int) -> list[dict]:
+    with _pool().connection() as conn:
+        return search.search_cases(conn, query, field, limit)
+
+
+async def find_cases(request: Request) -> Response:
+    params = request.query
+    query, field = params.get("q", "").strip(), params.get("field") or None
+    if not query:
+        raise HTTPError(400, "нужен параметр q")
+    if field is not None and field not in search.FIELDS:
+        raise HTTPError(400, f"field: одно из {', '.join(search.FIELDS)}")
+    limit = request.int_param("limit", search.LIMIT)
+    return Response(200, {"cases": await asyncio.to_thread(_find_cases, query, field, limit)})
+
+
+def _list_opponents(min_cases: int, limit: int) -> list[dict]:
+    with _pool().connection() as conn:
+        return search.top_opponents(conn, min_cases, limit)
+
+
+async def list_opponents(request: Request) -> Response:
+    min_cases = request.int_param("min_cases", search.MIN_CASES, high=sys.maxsize)
+    limit = request.int_param("limit", 50)
+    return Response(200, {"opponents": await asyncio.to_thread(_list_opponents, min_cases, limit)})
+
+
+async def suggest_jurisdiction(request: Request) -> Response:
+    params = request.query
+    category, categories = params.get("category", ""), jurisdiction.get_rules().categories
+    if category not in categories:
+        raise HTTPError(400, f"category: одна из {', '.join(categories)}")
+    found = await asyncio.to_thread(
+        jurisdiction.suggest, category, params.get("amount"), params.get("city", ""),
+        params.get("region", ""), params.get("doc_type", "claim"), DB_PATH,
+    )
+    if found is None:
+        raise HTTPError(400, "amount: ожидается сумма больше нуля")
+    return Response(200, asdict(found))
+
+
+async def health(request: Request) -> Response:
+    return Response(200, {"status": "ok"})
+
+
+ROUTES: tuple[tuple[str, re.Pattern, Callable[[Request], Awaitable[Response]]], ...] = (
+    ("POST", re.compile(r"/cases"), create_case),
+    ("GET", re.compile(r"/cases/search"), find_cases),
+    ("GET", re.compile(r"/cases/(?P<case_id>\d+)"), get_case),
+    ("POST", re.compile(r"/cases/(?P<case_id>\d+)/evidence/(?P<evidence_id>[a-z][a-z0-9_]*)"), upload_evidence),
+    ("GET", re.compile(r"/cases/(?P<case_id>\d+)/deadlines"), list_deadlines),
+    ("GET", re.compile(r"/opponents"), list_opponents),
+    ("GET", re.compile(r"/jurisdiction"), suggest_jurisdiction),
+    ("GET", re.compile(r"/health"), health),
+)
+
+
+# =========================
+# ASGI
+# =========================
+async def _send(send, response: Response) -> None:
+    body = orjson.dumps(response.payload)
+    await send({
+        "type": "http.response.start",
+        "status": response.status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *response.headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _startup() -> None:
+    # Схему доводим до актуальной версии один раз при старте процесса
+    with _pool().connection() as conn:
+        init_db(conn)
+    metrics.start_exporter()
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(_startup)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _route(method: str, path: str) -> tuple[Callable[[Request], Awaitable[Response]], dict]:
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        m = pattern.fullmatch(path)
+        if m:
+            if route_method == method:
+                return handler, m.groupdict()
+            allowed = True
+    raise HTTPError(405 if allowed else 404, "метод не поддерживается" if allowed else "не найдено")
+
+
+async def app(scope: dict, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    request = Request(scope, receive)
+    try:
+        # Сравнение за постоянное время; по байтам заголовка — compare_digest не принимает
+        # str не из ASCII
+        authorization = request.headers.get("authorization", "").encode("latin-1")
+        if API_TOKEN and not hmac.compare_digest(authorization, f"Bearer {API_TOKEN}".encode()):
+            raise HTTPError(401, "нужен токен доступа")
+        handler, request.params = _route(scope["method"], scope["path"].rstrip("/") or "/")
+        with metrics.timer(f"api.{handler.__name__}"):
+            response = await handler(request)
+    except HTTPError as e:
+        response = Response(e.status, e.payload)
+    await _send(send, response)
+
+
+def main(argv: list[str]) -> None:
+    # python -m api.app [--host 127.0.0.1] [--port 8000] [--workers 1]
+    opts = dict(zip(argv[::2], argv[1::2]))
+    if len(argv) % 2 or set(opts) - {"--host", "--port", "--workers"}:
+        raise SystemExit("usage: python -m api.app [--host HOST] [--port PORT] [--workers N]")
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("нужен ASGI-сервер: pip install uvicorn") from None
+    uvicorn.run(
+        "api.app:app",
+        host=opts.get("--host", "127.0.0.1"),
+        port=int(opts.get("--port", 8000)),
+        workers=int(opts.get("--workers", 1)),
+        lifespan="on",
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
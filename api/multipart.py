@@ -0,0 +1,101 @@
+# api/multipart.py
+from __future__ import annotations
+from typing import Iterator, Optional
+import re
+
+# Потоковый разбор multipart/form-data: тело приходит кусками (ASGI receive), части
+# отдаются событиями по мере чтения, поэтому файл не держится в памяти целиком.
+#   ("part", {"name": ..., "filename": ..., "content_type": ...})
+#   ("data", bytes)   — очередной кусок содержимого текущей части
+#   ("end", None)     — конец части
+
+MAX_HEADER_BYTES = 16 * 1024
+
+_PARAM_RE = re.compile(r';\s*([\w-]+)="?([^";]*)"?')
+
+
+class MultipartError(ValueError):
+    pass
+
+
+def boundary_of(content_type: str) -> Optional[bytes]:
+    # 'multipart/form-data; boundary=----abc' -> b'----abc'
+    kind, _, params = content_type.partition(";")
+    if kind.strip().lower() != "multipart/form-data":
+        return None
+    for key, value in _PARAM_RE.findall(";" + params):
+        if key.lower() == "boundary" and value:
+            return value.encode("latin-1")
+    return None
+
+
+def _part_headers(raw: bytes) -> dict:
+    headers = {}
+    for line in raw.decode("utf-8", "replace").split("\r\n"):
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+    params = dict((k.lower(), v) for k, v in _PARAM_RE.findall(headers.get("content-disposition", "")))
+    return {
+        "name": params.get("name"),
+        "filename": params.get("filename"),
+        "content_type": headers.get("content-type"),
+    }
+
+
+class MultipartParser:
+    def __init__(self, boundary: bytes) -> None:
+        # Разделитель частей — CRLF--boundary; CRLF в начале буфера позволяет
+        # найти первый разделитель тем же поиском
+        self.delimiter = b"\r\n--" + boundary
+        self.buffer = b"\r\n"
+        self.state = "preamble"  # preamble -> next -> headers -> body -> next ... -> done
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+    def feed(self, chunk: bytes) -> Iterator[tuple[str, object]]:
+        self.buffer += chunk
+        keep = len(self.delimiter) - 1  # хвост, в котором может начинаться разделитель
+        while True:
+            if self.state == "preamble":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    self.buffer = self.buffer[-keep:]
+                    return
+                self.buffer = self.buffer[idx + len(self.delimiter):]
+                self.state = "next"
+            elif self.state == "next":
+                if len(self.buffer) < 2:
+                    return
+                if self.buffer.startswith(b"--"):
+                    self.state = "done"
+                    self.buffer = b""
+                    return
+                if not self.buffer.startswith(b"\r\n"):
+                    raise MultipartError("некорректный разделитель частей")
+                self.buffer = self.buffer[2:]
+                self.state = "headers"
+            elif self.state == "headers":
+                idx = self.buffer.find(b"\r\n\r\n")
+                if idx < 0:
+                    if len(self.buffer) > MAX_HEADER_BYTES:
+                        raise MultipartError("слишком длинные заголовки части")
+                    return
+                yield "part", _part_headers(self.buffer[:idx])
+                self.buffer = self.buffer[idx + 4:]
+                self.state = "body"
+            elif self.state == "body":
+                idx = self.buffer.find(self.delimiter)
+                if idx < 0:
+                    if len(self.buffer) > keep:
+                        yield "data", self.buffer[:-keep]
+                        self.buffer = self.buffer[-keep:]
+                    return
+                if idx:
+                    yield "data", self.buffer[:idx]
+                yield "end", None
+                self.buffer = self.buffer[idx + len(self.delimiter):]
+                self.state = "next"
+            else:
+                return
@@ -1,451 +1,518 @@
 import streamlit as st
-import sqlite3
+import importlib
+import os
+import sys
+import threading
+from dataclasses import dataclass
 from datetime import date
 from pathlib import Path
+from typing import Optional
 
 APP_DIR = Path(__file__).resolve().parent
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # /mnt/.../digital_attorney
-DB_PATH = BASE_DIR / "db" / "app.sqlite"
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+# Сразу грузится только то, что нужно для формы. Документы (docxtpl, lxml),
+# индекс норм и LLM (numpy), календарь (ics) — при первом обращении через
+# st.cache_resource и заранее в фоне после первой отрисовки (warm_up).
+# Бюджет импорта проверяет python -m bench.importtime.
+from utils import courts, deadlines, filestore, intake, jobs, jurisdiction, metrics, repository, validation
+from utils.db import DB_PATH, get_pool
+from utils.db_init import init_db
+from utils.evidence import get_registry
 
 @st.cache_resource
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+def get_db():
+    # Пул соединений общий на процесс; каждое соединение — одному потоку за раз.
+    # Схему доводим до актуальной версии один раз при старте процесса.
+    pool = get_pool(DB_PATH)
+    with pool.connection() as conn:
+        init_db(conn)
+    # APP_METRICS=1: замеры в процессе, выгрузка — APP_METRICS_PORT / APP_METRICS_FILE
+    metrics.start_exporter()
+    # Статусы сроков: основной проход — задача deadlines воркера utils.jobs
+    with pool.transaction() as conn:
+        deadlines.sweep_overdue(conn)
+    return pool
 
-LOGO_PATH = APP_DIR / "logo_lawyer.png"
-
-st.set_page_config(page_title="Цифровой правозащитник", page_icon=str(LOGO_PATH) if LOGO_PATH.exists() else None)
+@st.cache_resource
+def get_llm():
+    # Один процесс с моделью на сервер: сессии только ставят запросы в общую очередь,
+    # поэтому модель не грузится на каждого пользователя и не блокирует UI
+    from llm.service import LLMService
+    return LLMService()
 
-EVIDENCE_SCHEMA = {
-    "return_goods": {
-        "claim": {  # Иск о возврате товара
-            "required": [
-                {"id": "purchase_doc", "label": "Документ о покупке товара (чек/квитанция/договор/заказ/выписка)"},
-                {"id": "claim", "label": "Претензия о возврате товара и денег"},
-                {"id": "claim_send_proof", "label": "Доказательство направления претензии продавцу"},
-                {"id": "return_proof", "label": "Доказательство возврата товара продавцу"},
-            ],
-            "optional": [
-                {"id": "photos_before", "label": "Фото/видео товара перед возвратом"},
-                {"id": "chat_with_seller", "label": "Переписка с продавцом"},
-                {"id": "seller_reply", "label": "Ответ продавца на претензию"},
-                {"id": "delivery_cost_docs", "label": "Документы об оплате доставки"},
-                {"id": "witnesses", "label": "Свидетельские показания"},
-            ],
-        },
-    },
-
-    "housing_utilities": {
-        "claim": {  # Иск о компенсации/возмещении расходов за услуги ЖКХ
-            "required": [
-                {"id": "utility_contracts", "label": "Квитанции/счета/договоры на услуги ЖКХ"},
-                {"id": "payment_docs", "label": "Платёжные документы (чеки/выписки)"},
-                {"id": "ownership_or_rent", "label": "Договор собственности или найма жилого помещения"},
-                {"id": "pretrial_claim", "label": "Претензия в адрес УК/поставщика"},
-                {"id": "claim_send_proof", "label": "Подтверждение отправки претензии"},
-                {"id": "compensation_calc", "label": "Расчёт суммы компенсации"},
-            ],
-            "optional": [
-                {"id": "inspection_acts", "label": "Акты обследования/фиксации нарушений"},
-                {"id": "issue_photos", "label": "Фото/видео неисправностей"},
-                {"id": "chat_with_uk", "label": "Переписка с УК/поставщиком услуг"},
-                {"id": "expert_reports", "label": "Заключения экспертов/техотчёты"},
-                {"id": "witnesses", "label": "Показания свидетелей (соседей)"},
-                {"id": "loss_docs", "label": "Документы о понесённых убытках"},
-            ],
-        },
-        "motion": {  # Ходатайство по делу о ЖКХ
-            "required": [
-                {"id": "motion_text", "label": "Само ходатайство с обоснованием"},
-                {"id": "motion_support_docs", "label": "Документы, подтверждающие необходимость экспертизы/проверки/истребования"},
-                {"id": "motion_copy_proof", "label": "Подтверждение направления копии другой стороне"},
-            ],
-            "optional": [
-                {"id": "motion_acts_photos", "label": "Акты и фото, на которые ссылается заявитель"},
-                {"id": "uk_replies", "label": "Ответы или отказы от УК / РСО"},
-                {"id": "collective_claims", "label": "Коллективные обращения жильцов"},
-                {"id": "independent_expert", "label": "Заключение независимого специалиста"},
-            ],
-        },
-        "objection": {  # Возражение на иск по делу о ЖКХ
-            "required": [
-                {"id": "utility_contract", "label": "Договор на оказание ЖКХ-услуг"},
-                {"id": "billing_calc", "label": "Расчёты начислений и оплаты"},
-                {"id": "acts_done", "label": "Акты выполненных работ"},
-                {"id": "claim_answers", "label": "Ответы на претензии"},
-                {"id": "finance_docs", "label": "Финансовые документы (выписки, счета)"},
-            ],
-            "optional": [
-                {"id": "emergency_logs", "label": "Журналы аварийных выездов, отчёты диспетчерской"},
-                {"id": "network_photos", "label": "Фотофиксация состояния сетей"},
-                {"id": "service_quality_exam", "label": "Экспертиза качества услуг"},
-                {"id": "uk_staff_witnesses", "label": "Показания сотрудников УК"},
-                {"id": "internal_docs", "label": "Переписка и внутренние акты реагирования"},
-            ],
-        },
-    },
-
-    "minor_injury": {
-        "claim": {  # Иск о возмещении лёгкого вреда здоровью
-            "required": [
-                {"id": "med_docs", "label": "Медицинские документы (справки/выписки/диагноз)"},
-                {"id": "er_certificate", "label": "Справка из травмпункта/больницы"},
-                {"id": "causality_proof", "label": "Доказательства причинной связи (акт/фото/свидетели)"},
-                {"id": "treatment_payments", "label": "Чеки/квитанции на лечение/лекарства/транспорт"},
-                {"id": "pretrial_claim", "label": "Претензия или досудебное обращение (при наличии)"},
-                {"id": "passport", "label": "Документ о личности истца (паспорт)"},
-            ],
-            "optional": [
-                {"id": "incident_act", "label": "Акт о несчастном случае/происшествии"},
-                {"id": "incident_media", "label": "Фото/видео с места происшествия"},
-                {"id": "witnesses", "label": "Свидетельские показания"},
-                {"id": "forensic_exam", "label": "Судебно-медицинская экспертиза"},
-                {"id": "chat_with_insurer", "label": "Переписка с ответчиком/страховой"},
-                {"id": "sick_leave", "label": "Больничный лист"},
-                {"id": "income_before", "label": "Справка о доходах до травмы"},
-                {"id": "psych_report", "label": "Психологическое заключение"},
-            ],
-        },
-        "motion": {  # Ходатайство по делу о вреде здоровью
-            "required": [
-                {"id": "motion_text", "label": "Само ходатайство с обоснованием"},
-                {"id": "motion_support_docs", "label": "Документы, подтверждающие необходимость экспертизы или вызова свидетелей"},
-                {"id": "motion_copy_proof", "label": "Подтверждение направления копии другой стороне"},
-            ],
-            "optional": [
-                {"id": "med_extracts", "label": "Медицинские выписки, подтверждающие необходимость экспертизы"},
-                {"id": "incident_scheme", "label": "Акт происшествия, схема места события"},
-                {"id": "org_answers", "label": "Ответы органов/организаций (например, отказ выдать акт)"},
-                {"id": "witness_claims", "label": "Свидетельские показания, коллективные обращения"},
-            ],
-        },
-        "objection": {  # Возражение на иск по вреду здоровью
-            "required": [
-                {"id": "no_causality_acts", "label": "Акты проверок об отсутствии причинной связи"},
-                {"id": "good_faith_docs", "label": "Доказательства добросовестности ответчика (меры безопасности и т.п.)"},
-                {"id": "other_med_docs", "label": "Медицинские документы об иных причинах травмы"},
-                {"id": "plaintiff_notifications", "label": "Переписка или уведомления истца"},
-                {"id": "defendant_witnesses", "label": "Свидетельские показания в пользу ответчика"},
-            ],
-            "optional": [
-                {"id": "place_inspection_acts", "label": "Акты осмотра места происшествия"},
-                {"id": "good_state_media", "label": "Фото/видео, подтверждающие исправное состояние"},
-                {"id": "independent_expert", "label": "Заключение независимого эксперта"},
-                {"id": "training_docs", "label": "Документы о проведении инструктажей и предупреждений"},
-                {"id": "internal_check_protocols", "label": "Протоколы внутренней проверки, служебные записки"},
-            ],
-        },
-    },
-}
+# Модули, которые прогреваются в фоне; APP_WARMUP=0 — не прогревать
+# (меньше памяти у простаивающего процесса, первое обращение медленнее)
+WARMUP_MODULES = ("utils.docgen", "llm.prompts", "llm.service", "ics")
 
+@st.cache_resource
+def warm_up() -> threading.Thread | None:
+    # Один поток на процесс; импорт потокобезопасен, поэтому сессия, которой
+    # модуль понадобился раньше, просто дождётся его загрузки
+    if os.environ.get("APP_WARMUP", "1") == "0":
+        return None
+    thread = threading.Thread(
+        target=lambda: [importlib.import_module(m) for m in WARMUP_MODULES],
+        name="app-warmup",
+        daemon=True,
+    )
+    thread.start()
+    return thread
 
+LOGO_PATH = APP_DIR / "logo_lawyer.png"
 
-if LOGO_PATH.exists():
-    st.image(str(LOGO_PATH))
-else:
-    st.warning(f"Логотип не найден: {LOGO_PATH}. Поместите файл сюда или поменяйте путь.")
-
-st.header("Анкета дела — общие данные")
-
-
-courts = [
-    {"id": 1, "name": "Мировой судья участка №1, г. Москва", "address": "ул. Примерная, 1"},
-    {"id": 2, "name": "Районный суд Центрального района, г. Самара", "address": "пр. Судебный, 10"},
-    {"id": 3, "name": "Ленинский районный суд, г. Казань", "address": "ул. Правовая, 5"},
-]
-court_labels = [c["name"] for c in courts]
-
-CATEGORY_LABELS = {
-    "Возврат товара": "return_goods",
-    "Компенсация услуг ЖКХ": "housing_utilities",
-    "Мелкий вред здоровью": "minor_injury",
-}#мелкий аред здоровью пока есть, но впоследствии будет только 2 категории.
-
-DOC_TYPE_LABELS = {
-    "return_goods": {
-        "Иск о возврате товара": "claim",
-    },
-    "housing_utilities": {
-        "Иск о компенсации за услуги ЖКХ": "claim",
-        "Ходатайство по делу о ЖКХ": "motion",
-        "Возражение на иск по делу о ЖКХ": "objection",
-    },
-    "minor_injury": {
-        "Иск о возмещении вреда здоровью (лёгкий вред)": "claim",
-        "Ходатайство по делу о вреде здоровью": "motion",
-        "Возражение на иск по вреду здоровью": "objection",
-    },
-}
+st.set_page_config(page_title="Цифровой правозащитник", page_icon=str(LOGO_PATH) if LOGO_PATH.exists() else None)
 
+# Категории, типы документов и доказательства — kb/evidence_schema.yaml.
+# Реестр компилируется один раз на процесс и перечитывается при изменении файла.
+REGISTRY = get_registry()
 
-st.subheader("Выбор категории спора")
+CATEGORY_PLACEHOLDER = "— Выберите категорию —"
+DOC_TYPE_PLACEHOLDER = "— Выберите тип документа —"
 
-CATEGORY_LABELS = {
-    "Возврат товара": "return_goods",
-    "Компенсация услуг ЖКХ": "housing_utilities",
-    "Мелкий вред здоровью": "minor_injury",
+CASE_STATUS_LABELS = {
+    "draft": "черновик, ожидает анализа",
+    "analysis": "анализ и подготовка документов",
+    "docs_ready": "документы готовы",
+    "scheduled": "назначено заседание",
 }
-
-category_label = st.selectbox(
-    "Категория спора *",
-    ["— Выберите категорию —"] + list(CATEGORY_LABELS.keys()),
-    key="category_label",
-)
-
-internal_cat = CATEGORY_LABELS.get(category_label) if category_label in CATEGORY_LABELS else None
-
-doc_label = None
-internal_doc_type = None
-
-if internal_cat:
-    st.subheader("Тип документа")
-    doc_options = list(DOC_TYPE_LABELS[internal_cat].keys())
-    doc_label = st.selectbox(
-        "Тип документа *",
-        ["— Выберите тип документа —"] + doc_options,
-        key="doc_label",
+JOB_LABELS = {"analyze": "Анализ описания", "docgen": "Документ по шаблону", "deadlines": "Сроки"}
+JOB_STATUS_LABELS = {"queued": "в очереди", "running": "выполняется", "done": "готово", "failed": "ошибка"}
+JOB_POLL_SECONDS = 2
+
+
+@dataclass
+class CaseSession:
+    # Состояние страницы между перезапусками скрипта — один объект на сессию.
+    # Значения полей ввода остаются в st.session_state под ключами виджетов.
+    category: Optional[str] = None   # 'return_goods' / 'housing_utilities' / 'minor_injury'
+    doc_type: Optional[str] = None   # 'claim' / 'motion' / 'objection'
+    court: Optional[dict] = None     # выбранный суд из справочника
+    last_case_id: Optional[int] = None
+    draft_text: Optional[str] = None
+
+    @classmethod
+    def current(cls) -> "CaseSession":
+        return st.session_state.setdefault("case_session", cls())
+
+    @property
+    def doc_schema(self):
+        return REGISTRY.doc_type(self.category, self.doc_type)
+
+
+@st.cache_data
+def load_logo(path: str) -> Optional[bytes]:
+    # Файл читается один раз на процесс, а не при каждом перезапуске скрипта
+    logo = Path(path)
+    return logo.read_bytes() if logo.exists() else None
+
+
+def collect_evidence(internal_cat: str, internal_doc_type: str) -> tuple[dict, list]:
+    # Отметки (id доказательства -> 0/1) и загруженные файлы [(id доказательства, файл)];
+    # пока категория и тип документа не выбраны — пусто
+    schema = REGISTRY.doc_type(internal_cat, internal_doc_type)
+    flags = {}
+    uploads = []
+    for item in schema.items.values() if schema else ():
+        flags[item.id] = int(bool(st.session_state.get(item.widget_key)))
+        uploaded = st.session_state.get(item.file_key)
+        if uploaded is not None:
+            uploads.append((item.id, uploaded))
+    return flags, uploads
+
+
+def store_upload(evidence_id: str, uploaded) -> dict:
+    # Файл пишем в хранилище до транзакции, чтобы не держать блокировку БД на время I/O;
+    # одинаковые файлы хранятся один раз
+    uploaded.seek(0)
+    stored = filestore.put(uploaded)
+    return {
+        "doc_type": f"evidence:{evidence_id}",
+        "file_path": stored.file_path,
+        "mime_type": uploaded.type or None,
+        "file_size": stored.file_size,
+    }
+
+
+@metrics.timed("app.save_case")
+def save_case(
+    users_payload: dict,
+    cases_payload: dict,
+    evidence_flags: dict | None = None,
+    documents: list | None = None,
+) -> int:
+    # Дело, доказательства, сроки и задача анализа — одна транзакция (utils/intake.py)
+    with get_db().transaction() as conn:
+        return intake.save_case(conn, users_payload, cases_payload, evidence_flags, documents)
+
+
+# =========================
+# Разделы страницы. Каждый — st.fragment: действие внутри раздела перезапускает
+# только его функцию, а не весь скрипт. Полный перезапуск (st.rerun) — только
+# когда меняется то, что показывают другие разделы.
+# Раздел читает только свои виджеты; через границу разделов передаются:
+#   category_section  -> session.category/doc_type: всем ниже (при смене — st.rerun);
+#   evidence_section  -> отметки и файлы доказательств: форме при отправке;
+#   court_section     -> region, city, amount, суд и ручной ввод суда: форме при отправке;
+#   case_form_section -> session.last_case_id: разделам дела (после сохранения — st.rerun).
+# Значения, которые форма читает при отправке, уже в st.session_state: виджеты вне
+# st.form отправляют значение сразу после ввода.
+# =========================
+@st.fragment
+@metrics.timed("app.category_section")
+def category_section(session: CaseSession) -> None:
+    st.subheader("Выбор категории спора")
+    category_label = st.selectbox(
+        "Категория спора *",
+        [CATEGORY_PLACEHOLDER] + list(REGISTRY.category_by_label),
+        key="category_label",
     )
-    if doc_label in DOC_TYPE_LABELS[internal_cat]:
-        internal_doc_type = DOC_TYPE_LABELS[internal_cat][doc_label]
-
-# Показать список доказательств только если выбраны и категория, и тип документа
-if internal_cat and internal_doc_type:
-    schema = EVIDENCE_SCHEMA.get(internal_cat, {}).get(internal_doc_type, {})
+    category = REGISTRY.category_by_label.get(category_label)
+
+    doc_type = None
+    if category:
+        st.subheader("Тип документа")
+        doc_type_by_label = REGISTRY.categories[category].doc_type_by_label
+        doc_label = st.selectbox(
+            "Тип документа *",
+            [DOC_TYPE_PLACEHOLDER] + list(doc_type_by_label),
+            key="doc_label",
+        )
+        doc_type = doc_type_by_label.get(doc_label)
+
+    shown = (session.category, session.doc_type)
+    session.category, session.doc_type = category, doc_type
+    # Доказательства и суд зависят от пары «категория, тип документа»
+    if (category, doc_type) != shown:
+        st.rerun()
+
+
+@st.fragment
+@metrics.timed("app.evidence_section")
+def evidence_section(session: CaseSession) -> None:
+    # Показать список доказательств только если выбраны и категория, и тип документа
+    schema = session.doc_schema
+    if schema is None:
+        return
     st.subheader("Доказательства по выбранному документу")
 
-    if schema.get("required"):
+    if schema.required:
         st.markdown("**Необходимые доказательства**")
-        for item in schema["required"]:
-            st.checkbox(
-                item["label"],
-                key=f"ev_{internal_cat}_{internal_doc_type}_{item['id']}",
-            )
+        for item in schema.required:
+            st.checkbox(item.label, key=item.widget_key)
             st.file_uploader(
                 "Файл (опционально)",
-                key=f"file_{internal_cat}_{internal_doc_type}_{item['id']}",
+                key=item.file_key,
                 label_visibility="collapsed",
             )
             st.divider()
+        checked = sum(bool(st.session_state.get(i.widget_key)) for i in schema.required)
+        st.caption(f"Отмечено обязательных: {checked} из {len(schema.required)}")
 
-    if schema.get("optional"):
+    if schema.optional:
         st.markdown("**Желательные доказательства**")
-        for item in schema["optional"]:
-            st.checkbox(
-                item["label"],
-                key=f"ev_{internal_cat}_{internal_doc_type}_{item['id']}",
-            )
+        for item in schema.optional:
+            st.checkbox(item.label, key=item.widget_key)
             st.file_uploader(
                 "Файл (опционально)",
-                key=f"file_{internal_cat}_{internal_doc_type}_{item['id']}",
+                key=item.file_key,
                 label_visibility="collapsed",
             )
             st.divider()
 
-def save_case(users_payload: dict, cases_payload: dict) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-
-    # Users
-    cur.execute(
-        """
-        INSERT INTO Users (fio, email, phone,
-                           resident_region, resident_city, resident_address)
-        VALUES (:fio, :email, :phone,
-                :resident_region, :resident_city, :resident_address)
-        """,
-        users_payload,
-    )
-    user_id = cur.lastrowid
-
-    # Привязываем дело к пользователю
-    cases_payload = dict(cases_payload)  # на всякий случай копия
-    cases_payload["user_id"] = user_id
-
-    cur.execute(
-        """
-        INSERT INTO Cases (user_id, court_id, category, description,
-                           opponent_name, opponent_address,
-                           amount, event_date, status,
-                           court_name_override, court_address_override)
-        VALUES (:user_id, :court_id, :category, :description,
-                :opponent_name, :opponent_address,
-                :amount, :event_date, :status,
-                :court_name_override, :court_address_override)
-        """,
-        cases_payload,
-    )
-    case_id = cur.lastrowid
-    conn.commit()
-    return case_id
-
 
-with st.form("case_form"):
-    st.subheader("Данные истца")
-    fio = st.text_input("ФИО истца *", placeholder="Иванов Иван Иванович", key="fio")
+@st.fragment
+@metrics.timed("app.court_section")
+def court_section(session: CaseSession) -> None:
+    # Суд выбирается вне формы: подсказки обновляются сразу после ввода запроса
+    # (по Enter/уходу из поля), а не только по кнопке «Сохранить черновик».
+    # Регион, город истца и цена иска — здесь же: по ним фильтруются суды и
+    # считаются подсудность и пошлина; форма читает их при отправке.
+    st.subheader("Место жительства истца и цена иска")
     col1, col2, col3 = st.columns(3)
     with col1:
         region = st.text_input("Регион истца *", placeholder="Московская область", key="region")
     with col2:
         city = st.text_input("Город истца *", placeholder="Москва", key="city")
     with col3:
-        address = st.text_input("Адрес истца *", placeholder="ул. Пушкина, д. 10, кв. 5", key="address")
-
-    colc1, colc2 = st.columns(2)
-    with colc1:
-        email = st.text_input("Email (опц.)", placeholder="name@example.com", key="email")
-    with colc2:
-        phone = st.text_input("Телефон (опц.)", placeholder="+7 900 000-00-00", key="phone")
+        amount = st.number_input("Сумма требований (руб.) *", min_value=0, step=100, key="amount")
 
     st.subheader("Суд")
-    court_idx = st.selectbox("Суд *", options=range(len(court_labels)), format_func=lambda i: court_labels[i], key="court_idx")
-    override = st.checkbox("Переопределить название/адрес суда вручную?")
-    court_name_override = ""
-    court_address_override = ""
-    if override:
-        court_name_override = st.text_input("Название суда (ручной ввод)", key="court_name_override")
-        court_address_override = st.text_input("Адрес суда (ручной ввод)", key="court_address_override")
-
-    st.subheader("Ответчик")
-    opponent_name = st.text_input("Ответчик: наименование *", key="opponent_name", placeholder="ООО «Ромашка» / Петров П.П.")
-    opponent_address = st.text_input("Ответчик: адрес (желательно)", key="opponent_address", placeholder="г. Москва, ...")
-
-    st.subheader("Детали спора")
-    amount = st.number_input("Сумма требований (руб.) *", min_value=0, step=100, key="amount")
-    event_date = st.date_input("Дата события *", value=date.today(), key="event_date")
-    description = st.text_area(
-        "Описание ситуации (3–6 предложений) *",
-        height=150,
-        placeholder="Кратко опишите, что произошло...",
-        key="description",
+    court_query = st.text_input(
+        "Поиск суда по названию, городу или адресу",
+        placeholder="Ленинский районный суд, Казань",
+        key="court_query",
     )
+    court_options = courts.search_courts(court_query, region=region, city=city)
+    # Подсудность и пошлина — по скомпилированным таблицам (на перезапуске из БД читается только версия справочника судов);
+    # рекомендованный суд идёт первым в списке
+    suggestion = jurisdiction.suggest(
+        session.category, amount, city, region, session.doc_type or "claim"
+    )
+    if suggestion is not None:
+        st.caption(f"Подсудность: {suggestion.level_note}")
+        fee = f"{suggestion.fee:,}".replace(",", " ")
+        st.caption(f"Госпошлина: {fee} руб. — {suggestion.fee_note}")
+        if suggestion.court_id is not None:
+            suggested = next((c for c in court_options if c["id"] == suggestion.court_id), None)
+            if suggested is None:
+                with get_db().connection() as conn:
+                    suggested = courts.get_court(conn, suggestion.court_id)
+            if suggested is not None:
+                court_options = [suggested] + [c for c in court_options if c["id"] != suggested["id"]]
+    recommended = suggestion.court_id if suggestion is not None else None
+    courts_by_id = {c["id"]: c for c in court_options}
+    if court_options:
+        court_id = st.selectbox(
+            "Суд *",
+            options=list(courts_by_id),
+            format_func=lambda i: (
+                f"{courts_by_id[i]['name']} — {courts_by_id[i]['address'] or ''}"
+                + (" (рекомендуется)" if i == recommended else "")
+            ),
+            key="court_id",
+        )
+    else:
+        court_id = None
+        st.caption("Суды не найдены: уточните запрос или укажите суд вручную.")
+    session.court = courts_by_id.get(court_id)
+    if st.checkbox("Переопределить название/адрес суда вручную?", key="court_override"):
+        st.text_input("Название суда (ручной ввод)", key="court_name_override")
+        st.text_input("Адрес суда (ручной ввод)", key="court_address_override")
+
+
+@st.fragment
+@metrics.timed("app.case_form_section")
+def case_form_section(session: CaseSession) -> None:
+    with st.form("case_form"):
+        st.subheader("Данные истца")
+        col1, col2 = st.columns(2)
+        with col1:
+            fio = st.text_input("ФИО истца *", placeholder="Иванов Иван Иванович", key="fio")
+        with col2:
+            address = st.text_input("Адрес истца *", placeholder="ул. Пушкина, д. 10, кв. 5", key="address")
+
+        colc1, colc2 = st.columns(2)
+        with colc1:
+            email = st.text_input("Email (опц.)", placeholder="name@example.com", key="email")
+        with colc2:
+            phone = st.text_input("Телефон (опц.)", placeholder="+7 900 000-00-00", key="phone")
+
+        st.subheader("Ответчик")
+        opponent_name = st.text_input("Ответчик: наименование *", key="opponent_name", placeholder="ООО «Ромашка» / Петров П.П.")
+        opponent_address = st.text_input("Ответчик: адрес (желательно)", key="opponent_address", placeholder="г. Москва, ...")
+
+        st.subheader("Детали спора")
+        event_date = st.date_input("Дата события *", value=date.today(), key="event_date")
+        description = st.text_area(
+            "Описание ситуации (3–6 предложений) *",
+            height=150,
+            placeholder="Кратко опишите, что произошло...",
+            key="description",
+        )
+
+        submitted = st.form_submit_button("Сохранить черновик")
+
+    if not submitted:
+        return
+
+    # Поля раздела «Суд» (court_section)
+    region = st.session_state.get("region", "")
+    city = st.session_state.get("city", "")
+    amount = st.session_state.get("amount", 0)
+    override = st.session_state.get("court_override", False)
+    court_name_override = st.session_state.get("court_name_override", "") if override else ""
+    court_address_override = st.session_state.get("court_address_override", "") if override else ""
+    evidence_flags, uploads = collect_evidence(session.category, session.doc_type)
+    # Правила анкеты — utils/validation.py (те же, что у импорта и API)
+    errors = validation.validate({
+        "fio": fio, "region": region, "city": city, "address": address,
+        "court_id": session.court["id"] if session.court else None,
+        "court_name_override": court_name_override,
+        "opponent_name": opponent_name, "amount": amount, "event_date": event_date,
+        "description": description, "category": session.category, "doc_type": session.doc_type,
+        "evidence": evidence_flags,
+    }, validation.make_context(REGISTRY))
+
+    if errors:
+        st.error("Пожалуйста, исправьте ошибки в форме.")
+        for message in errors.values():
+            st.caption(f"❌ {message}")
+        return
 
-    
-
-    # Показать список доказательств по выбранной категории
-    
-
-
-
-    submitted = st.form_submit_button("Сохранить черновик")
-
-
-
-    if submitted:
-        errors = {}
-
-        if not fio.strip():
-            errors["fio"] = "Укажите ФИО истца."
-        if not region.strip():
-            errors["region"] = "Укажите регион истца."
-        if not city.strip():
-            errors["city"] = "Укажите город истца."
-        if not address.strip():
-            errors["address"] = "Укажите адрес истца."
-
-        if court_idx is None or court_idx < 0 or court_idx >= len(courts):
-            errors["court_idx"] = "Выберите суд из справочника."
-
-        if not opponent_name.strip():
-            errors["opponent_name"] = "Укажите наименование ответчика."
-
-        if amount is None or amount <= 0:
-            errors["amount"] = "Сумма требований должна быть больше 0."
-
-        if event_date is None:
-            errors["event_date"] = "Укажите дату события."
-        elif event_date > date.today():
-            errors["event_date"] = "Дата события не может быть в будущем."
-
-        if not description.strip():
-            errors["description"] = "Опишите ситуацию (минимум 1–2 предложения)."
-        
-        if category_label == "— Выберите категорию —":
-            errors["category"] = "Выберите категорию спора."
-
-        
-
-        category_label = st.session_state.get("category_label")
-        doc_label = st.session_state.get("doc_label")
-
-        # Категория и тип документа обязательны
-        if not category_label or category_label == "— Выберите категорию —":
-            errors["category"] = "Выберите категорию спора."
-
-        internal_cat = CATEGORY_LABELS.get(category_label) if category_label in CATEGORY_LABELS else None
-        internal_doc_type = None
-
-        if internal_cat:
-            if not doc_label or doc_label == "— Выберите тип документа —":
-                errors["doc_type"] = "Выберите тип документа."
-            else:
-                internal_doc_type = DOC_TYPE_LABELS[internal_cat].get(doc_label)
-
-        # Обязательные доказательства: должна стоять галочка
-        if internal_cat and internal_doc_type:
-            schema = EVIDENCE_SCHEMA.get(internal_cat, {}).get(internal_doc_type, {})
-            for item in schema.get("required", []):
-                if not st.session_state.get(f"ev_{internal_cat}_{internal_doc_type}_{item['id']}"):
-                    errors[f"ev_required_{item['id']}"] = (
-                        f"Обязательное доказательство не отмечено: «{item['label']}»."
-                    )
-
-
-
-        if errors:
-            st.error("Пожалуйста, исправьте ошибки в форме.")
-
-            if "category" in errors: st.caption(f"❌ {errors['category']}")
-            if "fio" in errors: st.caption(f"❌ {errors['fio']}")
-            if "region" in errors: st.caption(f"❌ {errors['region']}")
-            if "city" in errors: st.caption(f"❌ {errors['city']}")
-            if "address" in errors: st.caption(f"❌ {errors['address']}")
-            if "court_idx" in errors: st.caption(f"❌ {errors['court_idx']}")
-            if "opponent_name" in errors: st.caption(f"❌ {errors['opponent_name']}")
-            if "amount" in errors: st.caption(f"❌ {errors['amount']}")
-            if "event_date" in errors: st.caption(f"❌ {errors['event_date']}")
-            if "description" in errors: st.caption(f"❌ {errors['description']}")
-            if "category" in errors:
-                st.caption(f"❌ {errors['category']}")
-            if "doc_type" in errors:
-                st.caption(f"❌ {errors['doc_type']}")
-
-            for k, v in errors.items():
-                if k.startswith("ev_required_"):
-                    st.caption(f"❌ {v}")
-
-
-    
-        else:
-            selected_court = courts[court_idx]
-
-            # Users
-            users_payload = {
-                "fio": fio.strip(),
-                "resident_region": region.strip(),
-                "resident_city": city.strip(),
-                "resident_address": address.strip(),
-                "email": (email or "").strip() or None,
-                "phone": (phone or "").strip() or None,
-            }
-
-            # internal_cat и internal_doc_type мы уже посчитали выше в этом же if submitted
-            # (из category_label и doc_label)
-            cases_payload = {
-                "court_id": None,
-                "court_name_override": (court_name_override or "").strip() or None,
-                "court_address_override": (court_address_override or "").strip() or None,
-                "opponent_name": opponent_name.strip(),
-                "opponent_address": (opponent_address or "").strip() or None,
-                "amount": float(amount),
-                "event_date": event_date.isoformat(),
-                "description": description.strip(),
-                "status": "draft",
-                "category": internal_cat,          # 'return_goods' / 'housing_utilities' / 'minor_injury'
+    # Users
+    users_payload = {
+        "fio": fio.strip(),
+        "resident_region": region.strip(),
+        "resident_city": city.strip(),
+        "resident_address": address.strip(),
+        "email": (email or "").strip() or None,
+        "phone": (phone or "").strip() or None,
+    }
+    cases_payload = {
+        "court_id": session.court["id"] if session.court else None,
+        "court_name_override": (court_name_override or "").strip() or None,
+        "court_address_override": (court_address_override or "").strip() or None,
+        "opponent_name": opponent_name.strip(),
+        "opponent_address": (opponent_address or "").strip() or None,
+        "amount": float(amount),
+        "event_date": event_date.isoformat(),
+        "description": description.strip(),
+        "status": "draft",
+        "category": session.category,
+        "doc_type": session.doc_type,
+    }
+    documents = [store_upload(ev_id, f) for ev_id, f in uploads]
+    session.last_case_id = save_case(users_payload, cases_payload, evidence_flags, documents)
+    session.draft_text = None
+    # Сроки и проект документа ниже относятся к новому делу
+    st.rerun()
+
+
+def case_has_pending_jobs(case_id: int) -> bool:
+    with get_db().connection() as conn:
+        return jobs.has_pending(conn, case_id)
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+@metrics.timed("app.job_progress_section")
+def job_progress_section(session: CaseSession) -> None:
+    # Опрос очереди только пока по делу есть незавершённые задачи: когда всё готово,
+    # полный перезапуск показывает документы, и раздел больше не вызывается
+    with get_db().connection() as conn:
+        case_jobs = jobs.list_case_jobs(conn, session.last_case_id)
+    st.subheader("Обработка дела")
+    st.dataframe(
+        [
+            {
+                "Этап": JOB_LABELS.get(j["kind"], j["kind"]),
+                "Статус": JOB_STATUS_LABELS.get(j["status"], j["status"]),
+                "Попытка": j["attempts"],
             }
-            case_id = save_case(users_payload, cases_payload)
-            st.success(f"Черновик сохранён в базе данных (дело ID = {case_id}).")
-
-
+            for j in case_jobs
+        ],
+        hide_index=True,
+    )
+    if not any(j["status"] in jobs.PENDING for j in case_jobs):
+        st.rerun()
+
+
+@st.fragment
+@metrics.timed("app.case_documents_section")
+def case_documents_section(session: CaseSession) -> None:
+    case_id = session.last_case_id
+    if not case_id:
+        return
+    st.success(f"Черновик сохранён в базе данных (дело ID = {case_id}).")
+
+    with get_db().connection() as conn:
+        case = repository.get_case(conn, case_id)
+        case_deadlines = repository.list_deadlines(conn, case_id)
+        prepared = next((
+            d for d in reversed(repository.list_documents(conn, case_id))
+            if d["render_key"] is not None and d["doc_type"] == case["doc_type"]
+        ), None)
+        failed = [j for j in jobs.list_case_jobs(conn, case_id) if j["status"] == "failed"]
+    st.caption(f"Статус дела: {CASE_STATUS_LABELS.get(case['status'], case['status'])}")
+    for j in failed:
+        st.warning(f"{JOB_LABELS.get(j['kind'], j['kind'])}: не выполнено ({j['error']}).")
+    if case_deadlines:
+        st.subheader("Сроки по делу")
+        st.dataframe(
+            [{"Срок": d["due_date"], "Этап": d["title"], "Статус": d["status"]} for d in case_deadlines],
+            hide_index=True,
+        )
+        st.download_button(
+            "Добавить в календарь (.ics)",
+            deadlines.to_ics(case_deadlines),
+            file_name=f"case_{case_id}.ics",
+            mime="text/calendar",
+            key="deadlines_ics",
+        )
+
+    # Текст документа генерируется по сохранённому делу; токены выводятся по мере готовности
+    st.subheader("Проект документа")
+    # .docx по шаблону готовит воркер (задача docgen); кнопка — если воркер ещё не успел.
+    # Если дело и шаблон не менялись, отдаётся уже готовый файл.
+    from utils import docgen
+
+    if prepared is not None:
+        with filestore.open_blob(prepared["file_path"]) as f:
+            st.download_button(
+                "Скачать документ (.docx)",
+                f.read(),
+                file_name=f"case_{case_id}.docx",
+                mime=docgen.DOCX_MIME,
+                key="docgen_prepared",
+            )
+    elif st.button("Сформировать документ (.docx)", key="docgen_generate"):
+        generated = docgen.generate(case_id, db_path=DB_PATH)
+        if generated is None:
+            st.error("Для дела не выбран тип документа.")
+        else:
+            with filestore.open_blob(generated.file_path) as f:
+                st.download_button(
+                    "Скачать документ",
+                    f.read(),
+                    file_name=f"case_{case_id}.docx",
+                    mime=docgen.DOCX_MIME,
+                    key="docgen_download",
+                )
+    if st.button("Сгенерировать текст документа", key="llm_generate"):
+        with get_db().connection() as conn:
+            case = repository.get_case(conn, case_id)
+            court = courts.get_court(conn, case["court_id"]) if case["court_id"] else None
+        from llm import prompts
+        from llm.service import LLMBusy, LLMError
+
+        prefix_key, prefix, prompt = prompts.build_prompt(case, court)
+        try:
+            session.draft_text = st.write_stream(
+                get_llm().generate(prompt, prefix=prefix, prefix_key=prefix_key)
+            )
+        except LLMBusy:
+            st.warning("Сервис генерации сейчас загружен. Попробуйте через минуту.")
+        except LLMError as e:
+            st.error(f"Не удалось сгенерировать текст: {e}")
+    elif session.draft_text:
+        st.markdown(session.draft_text)
+
+
+def debug_panel() -> None:
+    # Скрытая панель: ?debug=metrics в адресе страницы при APP_METRICS=1
+    with st.expander("Метрики процесса", expanded=True):
+        st.dataframe(metrics.snapshot(), hide_index=True)
+        st.download_button("metrics.prom", metrics.render(), file_name="metrics.prom", key="debug_metrics")
+
+
+# =========================
+# Страница
+# =========================
+session = CaseSession.current()
+
+# Полный перезапуск скрипта; перезапуски отдельных разделов замеряются в app.<раздел>
+with metrics.timer("app.rerun"):
+    logo = load_logo(str(LOGO_PATH))
+    if logo is not None:
+        st.image(logo)
+    else:
+        st.warning(f"Логотип не найден: {LOGO_PATH}. Поместите файл сюда или поменяйте путь.")
+
+    st.header("Анкета дела — общие данные")
+
+    category_section(session)
+    evidence_section(session)
+    court_section(session)
+    case_form_section(session)
+    if session.last_case_id and case_has_pending_jobs(session.last_case_id):
+        job_progress_section(session)
+    case_documents_section(session)
+
+if metrics.ENABLED and st.query_params.get("debug") == "metrics":
+    debug_panel()
+
+# Форма уже отрисована — тяжёлые модули грузим, пока пользователь её заполняет
+warm_up()
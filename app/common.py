@@ -0,0 +1,20 @@
+# app/common.py
+from __future__ import annotations
+
+import streamlit as st
+
+from utils.db import DB_PATH, get_pool
+from utils.db_init import init_db
+
+# Общее для страниц app/pages/ (импорт: from common import ...)
+
+STATUS_LABELS = {"draft": "черновик", "analysis": "анализ", "docs_ready": "документы готовы", "scheduled": "назначено"}
+
+
+@st.cache_resource
+def get_db():
+    # Тот же пул, что и у анкеты (один на файл БД в процессе); схема — актуальная
+    pool = get_pool(DB_PATH)
+    with pool.connection() as conn:
+        init_db(conn)
+    return pool
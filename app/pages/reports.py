@@ -0,0 +1,76 @@
+import streamlit as st
+import io
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1]
+BASE_DIR = APP_DIR.parent
+for path in (BASE_DIR, APP_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from utils import analytics
+from utils.evidence import get_registry
+
+from common import STATUS_LABELS, get_db
+
+st.set_page_config(page_title="Отчёты по делам")
+
+REGISTRY = get_registry()
+DIMENSION_LABELS = {"category": "Категория", "status": "Статус", "court": "Суд", "month": "Месяц"}
+
+st.header("Отчёты по делам")
+st.caption("Сводки строятся по агрегатам CaseStats, которые обновляются при каждом сохранении дела.")
+
+with get_db().connection() as conn:
+    all_months = analytics.months(conn)
+
+by = st.multiselect(
+    "Разрез", list(DIMENSION_LABELS), default=["category", "status"],
+    format_func=DIMENSION_LABELS.get, key="report_by",
+)
+categories = st.multiselect(
+    "Категории", list(REGISTRY.categories),
+    format_func=lambda c: REGISTRY.categories[c].label, key="report_categories",
+)
+statuses = st.multiselect("Статусы", list(STATUS_LABELS), format_func=STATUS_LABELS.get, key="report_statuses")
+since, until = (None, None)
+if len(all_months) > 1:
+    since, until = st.select_slider("Период", all_months, value=(all_months[0], all_months[-1]), key="report_period")
+
+with get_db().connection() as conn:
+    df = analytics.summary(conn, by, categories, statuses, since, until)
+
+total = int(df["cases"].sum()) if not df.empty else 0
+col_cases, col_amount, col_p = st.columns(3)
+col_cases.metric("Дел", total)
+col_amount.metric("Сумма требований, руб.", f"{df['amount_sum'].sum():,.0f}".replace(",", " ") if total else "0")
+if total and "p_success_avg" in df and df["p_success_avg"].notna().any():
+    weights = df["cases"].where(df["p_success_avg"].notna())
+    col_p.metric("Средняя p_success", f"{(df['p_success_avg'] * weights).sum() / weights.sum():.2f}")
+
+view = df.copy()
+if "category" in view:
+    view["category"] = view["category"].map(lambda c: REGISTRY.categories[c].label if c in REGISTRY.categories else c or "—")
+if "status" in view:
+    view["status"] = view["status"].map(lambda s: STATUS_LABELS.get(s, s or "—"))
+view = view.rename(columns={
+    **DIMENSION_LABELS, "court_name": "Наименование суда", "cases": "Дел",
+    "amount_sum": "Сумма, руб.", "amount_avg": "Средняя сумма, руб.", "p_success_avg": "Средняя p_success",
+})
+st.dataframe(view, hide_index=True)
+
+if by and total:
+    st.bar_chart(view, x=DIMENSION_LABELS[by[0]], y="Дел", color=DIMENSION_LABELS[by[1]] if len(by) > 1 else None)
+
+csv_col, parquet_col = st.columns(2)
+csv_col.download_button(
+    "Скачать CSV", df.to_csv(index=False).encode("utf-8-sig"),
+    file_name="cases_report.csv", mime="text/csv", key="report_csv",
+)
+parquet = io.BytesIO()
+df.to_parquet(parquet, index=False)
+parquet_col.download_button(
+    "Скачать Parquet", parquet.getvalue(),
+    file_name="cases_report.parquet", mime="application/vnd.apache.parquet", key="report_parquet",
+)
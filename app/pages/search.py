@@ -0,0 +1,82 @@
+import streamlit as st
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1]
+BASE_DIR = APP_DIR.parent
+for path in (BASE_DIR, APP_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from utils import search
+from utils.evidence import get_registry
+
+from common import STATUS_LABELS, get_db
+
+st.set_page_config(page_title="Поиск по делам")
+
+REGISTRY = get_registry()
+FIELD_LABELS = {"": "Везде", "opponent": "Ответчик", "description": "Описание"}
+DESCRIPTION_CHARS = 160
+
+
+def show_cases(cases: list[dict]) -> None:
+    rows = [{
+        "№": c["id"],
+        "Ответчик": c["opponent_name"],
+        "Категория": REGISTRY.categories[c["category"]].label if c["category"] in REGISTRY.categories else c["category"] or "—",
+        "Статус": STATUS_LABELS.get(c["status"], c["status"] or "—"),
+        "Сумма, руб.": c["amount"],
+        "Создано": c["created_at"],
+        **({"Описание": (c["description"] or "")[:DESCRIPTION_CHARS]} if "description" in c else {}),
+    } for c in cases]
+    st.dataframe(rows, hide_index=True)
+
+
+st.header("Поиск по делам")
+st.caption("Слова ищутся в любой форме: «Ромашки» находит «ООО «Ромашка»», «протечку» — «протечка».")
+
+query_col, field_col = st.columns([3, 1])
+query = query_col.text_input("Ответчик или слова из описания", key="search_query", placeholder="ООО «Ромашка»")
+field = field_col.selectbox("Где искать", list(FIELD_LABELS), format_func=FIELD_LABELS.get, key="search_field")
+if query.strip():
+    with get_db().connection() as conn:
+        found = search.search_cases(conn, query, field or None)
+    if found:
+        note = ""
+        if len(found) >= search.LIMIT:
+            ranked = found[0]["score"] is not None
+            note = " (первые по релевантности)" if ranked else " (в запросе частые слова — сначала новые дела)"
+        st.caption(f"Найдено дел: {len(found)}{note}")
+        show_cases(found)
+    else:
+        st.info("Ничего не найдено.")
+
+st.subheader("Похожие дела")
+case_id = st.number_input("Номер дела", min_value=0, step=1, key="similar_case_id")
+if case_id:
+    with get_db().connection() as conn:
+        case = conn.execute("SELECT description FROM Cases WHERE id = ?", (int(case_id),)).fetchone()
+        similar = search.similar_cases(conn, case["description"] or "", exclude=int(case_id)) if case else None
+    if case is None:
+        st.warning("Дело не найдено.")
+    elif similar:
+        show_cases(similar)
+    else:
+        st.info("Похожих дел нет.")
+
+st.subheader("Повторяющиеся ответчики")
+min_cases = st.number_input("Не меньше дел", min_value=2, value=search.MIN_CASES, step=1, key="opponents_min")
+with get_db().connection() as conn:
+    opponents = search.top_opponents(conn, int(min_cases))
+if opponents:
+    st.dataframe(
+        [{"Ответчик": o["name"], "Дел": o["cases"], "Сумма требований, руб.": round(o["amount_sum"], 2)} for o in opponents],
+        hide_index=True,
+    )
+    keys = {o["opponent_key"]: o["name"] for o in opponents}
+    chosen = st.selectbox("Дела против ответчика", list(keys), format_func=keys.get, key="opponent_key")
+    with get_db().connection() as conn:
+        show_cases(search.opponent_cases(conn, chosen))
+else:
+    st.info("Ответчиков с таким числом дел нет.")
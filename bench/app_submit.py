@@ -0,0 +1,74 @@
+# bench/app_submit.py
+from __future__ import annotations
+from pathlib import Path
+import json
+import os
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+# Одна сессия анкеты через AppTest: выбор категории, суда, заполнение формы и
+# сохранение n раз подряд, плюс отправка с ошибками (только проверка полей).
+# Запускается отдельным процессом (bench/run.py): приложение берёт путь к базе
+# из APP_DB_PATH при импорте. Печатает JSON с замерами в секундах.
+
+ROOT = Path(__file__).resolve().parents[1]
+APP_PATH = ROOT / "app" / "app.py"
+SUBMIT_KEY = "FormSubmitter:case_form-Сохранить черновик"
+TIMEOUT = 60
+
+
+def fill_form(at: AppTest, session_no: int) -> None:
+    at.selectbox(key="category_label").set_value("Возврат товара").run(timeout=TIMEOUT)
+    at.selectbox(key="doc_label").set_value("Иск о возврате товара").run(timeout=TIMEOUT)
+    for checkbox in at.checkbox:
+        if checkbox.key and checkbox.key.startswith("ev_"):
+            checkbox.check()
+    at.text_input(key="court_query").input("Казань").run(timeout=TIMEOUT)
+    at.text_input(key="fio").input(f"Нагрузочный Тест {session_no}")
+    at.text_input(key="region").input("Республика Татарстан")
+    at.text_input(key="city").input("Казань")
+    at.text_input(key="address").input("ул. Баумана, д. 1")
+    at.text_input(key="email").input(f"bench{session_no}@example.ru")
+    at.text_input(key="opponent_name").input("ООО «Ромашка»")
+    at.number_input(key="amount").set_value(15000)
+    at.text_area(key="description").input(
+        "Купил товар, он не подошёл. Продавец отказался принять его обратно и вернуть деньги."
+    )
+
+
+def run_session(session_no: int, submits: int) -> dict:
+    started = time.perf_counter()
+    at = AppTest.from_file(str(APP_PATH), default_timeout=TIMEOUT).run()
+    first_render = time.perf_counter() - started
+    fill_form(at, session_no)
+
+    # Ошибки проверки: без ФИО дело не сохраняется
+    at.text_input(key="fio").input("")
+    started = time.perf_counter()
+    at.button(key=SUBMIT_KEY).click().run()
+    invalid = time.perf_counter() - started
+    if not at.error:
+        raise RuntimeError("ожидались ошибки проверки формы")
+    at.text_input(key="fio").input(f"Нагрузочный Тест {session_no}")
+
+    latencies = []
+    for _ in range(submits):
+        started = time.perf_counter()
+        at.button(key=SUBMIT_KEY).click().run()
+        latencies.append(time.perf_counter() - started)
+        if at.exception or not at.success:
+            raise RuntimeError(f"сохранение не удалось: {at.exception or [e.value for e in at.error]}")
+    return {"first_render": first_render, "invalid_submit": invalid, "submits": latencies}
+
+
+def main(argv: list[str]) -> None:
+    # APP_DB_PATH=... python -m bench.app_submit SESSION_NO N_SUBMITS
+    if len(argv) != 2 or not os.environ.get("APP_DB_PATH"):
+        raise SystemExit("usage: APP_DB_PATH=DB python -m bench.app_submit SESSION_NO N_SUBMITS")
+    print(json.dumps(run_session(int(argv[0]), int(argv[1]))))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,71 @@
+# bench/compare.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator
+import json
+import sys
+
+# Сравнение двух прогонов bench/run.py: задержки (*_ms) и пропускная способность
+# (*_per_second). Регрессия — ухудшение больше THRESHOLD; с --fail код выхода 1,
+# чтобы прогон можно было поставить в CI.
+
+THRESHOLD = 0.10
+
+
+def flatten(node: object, prefix: str = "") -> Iterator[tuple[str, float]]:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, list):
+        # Точки роста сопоставляются по номеру шага
+        for i, value in enumerate(node):
+            yield from flatten(value, f"{prefix}[{i}]")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+
+def _direction(metric: str) -> int:
+    # +1 — чем больше, тем хуже (задержки, размер); -1 — чем больше, тем лучше; 0 — не сравниваем
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf == "max_ms":
+        return 0  # единичный выброс, по нему регрессию не определить
+    if leaf.endswith("_ms") or leaf in ("bytes_per_case", "insert_seconds"):
+        return 1
+    if leaf.endswith("_per_second"):
+        return -1
+    return 0
+
+
+def compare(old: dict, new: dict, threshold: float = THRESHOLD) -> list[tuple[str, float, float, float, bool]]:
+    # -> (метрика, было, стало, изменение, регрессия)
+    before = dict(flatten(old["results"]))
+    rows = []
+    for metric, value in flatten(new["results"]):
+        direction = _direction(metric)
+        if not direction or metric not in before or not before[metric]:
+            continue
+        change = (value - before[metric]) / before[metric]
+        rows.append((metric, before[metric], value, change, change * direction > threshold))
+    return rows
+
+
+def main(argv: list[str]) -> None:
+    # python -m bench.compare OLD.json NEW.json [--fail]
+    paths = [a for a in argv if a != "--fail"]
+    if len(paths) != 2:
+        raise SystemExit("usage: python -m bench.compare OLD.json NEW.json [--fail]")
+    old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in paths)
+    if old["params"]["cases"] != new["params"]["cases"]:
+        print(f"внимание: разный объём базы ({old['params']['cases']} и {new['params']['cases']} дел)")
+    rows = compare(old, new)
+    width = max((len(r[0]) for r in rows), default=10)
+    for metric, before, after, change, regressed in rows:
+        print(f"{metric:<{width}}  {before:>12.3f}  {after:>12.3f}  {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(r[4] for r in rows)
+    print(f"{old['commit']} -> {new['commit']}: {regressions} regressions (> {THRESHOLD:.0%})")
+    if regressions and "--fail" in argv:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+# bench/importtime.py
+from __future__ import annotations
+from pathlib import Path
+import ast
+import os
+import re
+import subprocess
+import sys
+
+# Бюджет импорта страницы: импорты верхнего уровня app/app.py выполняются в чистом
+# процессе с python -X importtime. Тяжёлые библиотеки (FORBIDDEN) на пути формы
+# загружаться не должны — они подгружаются при первом обращении и в фоне (warm_up).
+# Бюджет — на наш код без самого streamlit: его время от нас не зависит.
+
+ROOT = Path(__file__).resolve().parents[1]
+ENTRY = ROOT / "app" / "app.py"
+
+BUDGET_MS = 250.0
+REPEATS = 3
+FORBIDDEN = (
+    "pandas", "numpy", "scipy", "sklearn", "joblib", "pyarrow",
+    "docx", "docxtpl", "lxml", "jinja2", "ics", "llama_cpp",
+)
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def entry_imports(path: Path = ENTRY) -> str:
+    # Импорты верхнего уровня файла (без импортов внутри функций) -> код для python -c
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    return "\n".join(
+        ast.unparse(node) for node in tree.body
+        if isinstance(node, ast.Import)
+        or (isinstance(node, ast.ImportFrom) and node.module != "__future__")
+    )
+
+
+def parse(stderr: str) -> list[tuple[str, int, float, float]]:
+    # -> [(модуль, уровень вложенности, собственное мс, с вложенными мс)]
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            rows.append((m[4], (len(m[3]) - 1) // 2, int(m[1]) / 1000, int(m[2]) / 1000))
+    return rows
+
+
+def _run(code: str) -> list[tuple[str, int, float, float]]:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    return parse(subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stderr)
+
+
+def measure(code: str) -> dict:
+    # Лучший из REPEATS прогонов; модули, которые грузит сам интерпретатор
+    # при старте (site, encodings, ...), не считаются
+    startup = {name for name, *_ in _run("pass")}
+    best = None
+    for _ in range(REPEATS):
+        rows = [r for r in _run(code) if r[0] not in startup]
+        top = [(name, cum) for name, level, _, cum in rows if level == 0]
+        total = sum(cum for _, cum in top)
+        if best is None or total < best["total_ms"]:
+            streamlit_ms = sum(cum for name, cum in top if name.split(".")[0] == "streamlit")
+            loaded = {name for name, *_ in rows}
+            best = {
+                "total_ms": round(total, 1),
+                "streamlit_ms": round(streamlit_ms, 1),
+                "app_ms": round(total - streamlit_ms, 1),
+                "modules": len(rows),
+                "forbidden": sorted(f for f in FORBIDDEN if f in loaded),
+                "slowest": [
+                    (name, round(cum, 1)) for name, cum in sorted(top, key=lambda t: -t[1])[:10]
+                ],
+            }
+    return best
+
+
+def main(argv: list[str]) -> None:
+    # python -m bench.importtime [--budget-ms 250]
+    if argv and (len(argv) != 2 or argv[0] != "--budget-ms"):
+        raise SystemExit("usage: python -m bench.importtime [--budget-ms MS]")
+    budget = float(argv[1]) if argv else BUDGET_MS
+    report = measure(entry_imports())
+    for name, ms in report["slowest"]:
+        print(f"{name:<40} {ms:>8.1f} ms")
+    print(
+        f"total {report['total_ms']} ms (streamlit {report['streamlit_ms']} ms, "
+        f"app {report['app_ms']} ms, budget {budget:g} ms), {report['modules']} modules"
+    )
+    failed = False
+    if report["forbidden"]:
+        print(f"heavy modules on the form path: {', '.join(report['forbidden'])}")
+        failed = True
+    if report["app_ms"] > budget:
+        print("import budget exceeded")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
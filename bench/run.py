@@ -0,0 +1,274 @@
+# bench/run.py
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Sequence
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench import importtime, synth
+from utils import analytics, courts, deadlines, intake, jobs, repository, search
+from utils.db import get_pool
+
+# Нагрузочный прогон на синтетической базе:
+#   growth  — наполнение базы шагами, размер файла и байт на дело;
+#   lookups — задержки типовых запросов страницы и отчётов на наполненной базе;
+#   writes  — сохранение анкеты (utils/intake.py) из N потоков-сессий одновременно;
+#   app     — полный цикл анкеты через AppTest в N процессах одновременно;
+#   imports — время импорта страницы (bench/importtime.py), база не нужна.
+# Результат — JSON в bench/results/ (сравнение: python -m bench.compare OLD NEW).
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS_DIR = ROOT / "bench" / "results"
+SCENARIOS = ("growth", "lookups", "writes", "app", "imports")
+
+LOOKUP_REPEATS = 300
+WRITES_PER_SESSION = 200
+APP_SUBMITS_PER_SESSION = 5
+
+
+def percentiles(samples: Sequence[float]) -> dict:
+    # Миллисекунды: p50/p95/p99 и максимум
+    ordered = sorted(samples)
+    at = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000  # noqa: E731
+    return {
+        "n": len(ordered),
+        "p50_ms": round(at(0.5), 3),
+        "p95_ms": round(at(0.95), 3),
+        "p99_ms": round(at(0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def db_size(db_path: Path) -> int:
+    # Файл базы + WAL: до контрольной точки новые страницы живут в WAL
+    return sum(p.stat().st_size for p in (db_path, Path(f"{db_path}-wal")) if p.exists())
+
+
+# =========================
+# Сценарии
+# =========================
+def bench_growth(db_path: Path, n_cases: int, steps: int, seed: int) -> dict:
+    points = []
+    per_step = max(1, n_cases // steps)
+    for step in range(steps):
+        totals = synth.populate(db_path, per_step, seed=seed + step)
+        with get_pool(db_path).connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cases = conn.execute("SELECT count(*) FROM Cases").fetchone()[0]
+        size = db_size(db_path)
+        points.append({
+            "cases": cases,
+            "db_bytes": size,
+            "bytes_per_case": round(size / cases),
+            "insert_seconds": totals["seconds"],
+            "cases_per_second": round(per_step / totals["seconds"]) if totals["seconds"] else None,
+            "rows": {k: v for k, v in totals.items() if k != "seconds"},
+        })
+    return {"points": points}
+
+
+def _lookup_queries(conn: sqlite3.Connection, rng: random.Random) -> dict[str, Callable[[], object]]:
+    max_case = conn.execute("SELECT max(id) FROM Cases").fetchone()[0]
+    max_user = conn.execute("SELECT max(id) FROM Users").fetchone()[0]
+    return {
+        "get_case": lambda: repository.get_case(conn, rng.randint(1, max_case)),
+        "list_cases_by_user": lambda: repository.list_cases_by_user(conn, rng.randint(1, max_user)),
+        "list_case_evidence": lambda: repository.list_case_evidence(conn, rng.randint(1, max_case)),
+        "list_documents": lambda: repository.list_documents(conn, rng.randint(1, max_case)),
+        "list_deadlines": lambda: repository.list_deadlines(conn, rng.randint(1, max_case)),
+        "jobs_has_pending": lambda: jobs.has_pending(conn, rng.randint(1, max_case)),
+        "user_by_email": lambda: conn.execute(
+            "SELECT id FROM Users WHERE email_key = ?", (f"user{rng.randint(1, max_user)}@example.ru",)
+        ).fetchone(),
+        "courts_suggest": lambda: courts.suggest(conn, rng.choice(("казань", "москва", "район", "мировой"))),
+        "search_cases": lambda: search.search_cases(
+            conn, rng.choice(("Ромашка", "ТСЖ Березка", "претензия без ответа", "протечка", "Орлов"))
+        ),
+        "search_top_opponents": lambda: search.top_opponents(conn),
+        "analytics_summary": lambda: analytics.summary(conn, ("category", "status")),
+        "analytics_by_court_month": lambda: analytics.summary(conn, ("court", "month")),
+        "deadlines_sweep": lambda: deadlines.sweep_overdue(conn),
+    }
+
+
+def bench_lookups(db_path: Path, repeats: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = {}
+    with get_pool(db_path).connection() as conn:
+        for name, query in _lookup_queries(conn, rng).items():
+            query()  # прогрев кеша страниц
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                query()
+                samples.append(time.perf_counter() - started)
+            results[name] = percentiles(samples)
+    return results
+
+
+def _payload(rng: random.Random, session_no: int, n: int) -> tuple[dict, dict, dict]:
+    category = "return_goods"
+    user = {
+        "fio": f"Сессия {session_no}", "email": f"session{session_no}@example.ru", "phone": None,
+        "resident_region": "г. Москва", "resident_city": "Москва", "resident_address": "ул. Ленина, 1",
+    }
+    case = {
+        "court_id": None, "court_name_override": "Мировой судья участка №1",
+        "court_address_override": None, "category": category, "doc_type": "claim",
+        "description": " ".join(rng.sample(synth.SENTENCES[category], 4)),
+        "opponent_name": rng.choice(synth.OPPONENTS[category]), "opponent_address": None,
+        "amount": round(rng.lognormvariate(10, 1), 2),
+        "event_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "status": "draft",
+    }
+    evidence = {"purchase_doc": 1, "claim": 1, "claim_send_proof": 1, "return_proof": 1, "witnesses": n % 2}
+    return user, case, evidence
+
+
+def bench_writes(db_path: Path, sessions: Sequence[int], per_session: int, seed: int) -> dict:
+    # Каждый поток — отдельная сессия Streamlit: своя транзакция на сохранение,
+    # общий пул соединений процесса
+    pool = get_pool(db_path)
+    results = {}
+    for n in sessions:
+        latencies: list[float] = []
+        lock = threading.Lock()
+
+        def session(session_no: int) -> None:
+            rng = random.Random(seed * 1000 + session_no)
+            own = []
+            for i in range(per_session):
+                user, case, evidence = _payload(rng, session_no, i)
+                started = time.perf_counter()
+                with pool.transaction() as conn:
+                    intake.save_case(conn, user, case, evidence)
+                own.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(own)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(n) as executor:
+            list(executor.map(session, range(n)))
+        elapsed = time.perf_counter() - started
+        results[f"sessions_{n}"] = {
+            "saves_per_second": round(len(latencies) / elapsed, 1),
+            **percentiles(latencies),
+        }
+    return results
+
+
+def bench_app(db_path: Path, sessions: Sequence[int], submits: int) -> dict:
+    # AppTest однопоточен, поэтому сессии — отдельные процессы bench.app_submit
+    env = {**os.environ, "APP_DB_PATH": str(db_path), "PYTHONPATH": str(ROOT)}
+    env.setdefault("APP_FILESTORE_DIR", tempfile.mkdtemp(prefix="bench_fs_"))
+    results = {}
+    for n in sessions:
+        started = time.perf_counter()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-m", "bench.app_submit", str(1000 * n + k), str(submits)],
+                cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+            for k in range(n)
+        ]
+        outputs = [p.communicate()[0] for p in procs]
+        elapsed = time.perf_counter() - started
+        failed = [p.returncode for p in procs if p.returncode]
+        if failed:
+            raise RuntimeError(f"bench.app_submit завершился с ошибкой: {failed}")
+        runs = [json.loads(o) for o in outputs]
+        submit_latencies = [s for r in runs for s in r["submits"][1:]]  # первое сохранение — прогрев
+        results[f"sessions_{n}"] = {
+            "submits_per_second": round(n * submits / elapsed, 2),
+            "first_render": percentiles([r["first_render"] for r in runs]),
+            "invalid_submit": percentiles([r["invalid_submit"] for r in runs]),
+            "submit": percentiles(submit_latencies or [r["submits"][0] for r in runs]),
+        }
+    return results
+
+
+# =========================
+# Прогон
+# =========================
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    scenarios: Sequence[str],
+    n_cases: int,
+    steps: int,
+    sessions: Sequence[int],
+    db_path: Path | None = None,
+    seed: int = 0,
+) -> dict:
+    db_path = db_path or Path(tempfile.mkdtemp(prefix="bench_")) / "app.sqlite"
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "params": {"cases": n_cases, "steps": steps, "sessions": list(sessions), "seed": seed,
+                   "scenarios": list(scenarios), "db_path": str(db_path)},
+        "results": {},
+    }
+    if "imports" in scenarios:
+        imports = importtime.measure(importtime.entry_imports())
+        report["results"]["imports"] = {k: v for k, v in imports.items() if k != "slowest"}
+    if set(scenarios) <= {"imports"}:
+        return report
+    # Наполнение нужно остальным сценариям, поэтому выполняется всегда
+    growth = bench_growth(db_path, n_cases, steps if "growth" in scenarios else 1, seed)
+    if "growth" in scenarios:
+        report["results"]["growth"] = growth
+    if "lookups" in scenarios:
+        report["results"]["lookups"] = bench_lookups(db_path, LOOKUP_REPEATS, seed)
+    if "writes" in scenarios:
+        report["results"]["writes"] = bench_writes(db_path, sessions, WRITES_PER_SESSION, seed)
+    if "app" in scenarios:
+        report["results"]["app"] = bench_app(db_path, sessions, APP_SUBMITS_PER_SESSION)
+    return report
+
+
+def main(argv: list[str]) -> None:
+    # python -m bench.run [--cases 10000] [--steps 4] [--sessions 1,4,16]
+    #                     [--only growth,lookups,writes,app,imports] [--db PATH] [--seed 0] [--out FILE.json]
+    usage = ("usage: python -m bench.run [--cases N] [--steps K] [--sessions 1,4,16] "
+             "[--only SCENARIO,...] [--db PATH] [--seed S] [--out FILE.json]")
+    opts = dict(zip(argv[::2], argv[1::2]))
+    if len(argv) % 2 or set(opts) - {"--cases", "--steps", "--sessions", "--only", "--db", "--seed", "--out"}:
+        raise SystemExit(usage)
+    scenarios = opts.get("--only", ",".join(SCENARIOS)).split(",")
+    if set(scenarios) - set(SCENARIOS):
+        raise SystemExit(usage)
+    report = run(
+        scenarios,
+        n_cases=int(opts.get("--cases", 10_000)),
+        steps=int(opts.get("--steps", 4)),
+        sessions=[int(s) for s in opts.get("--sessions", "1,4,16").split(",")],
+        db_path=Path(opts["--db"]) if "--db" in opts else None,
+        seed=int(opts.get("--seed", 0)),
+    )
+    out = Path(opts.get("--out") or RESULTS_DIR / f"{report['started_at'][:19].replace(':', '')}-{report['commit'] or 'nogit'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(out)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
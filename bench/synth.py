@@ -0,0 +1,247 @@
+# bench/synth.py
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+import hashlib
+import random
+import sys
+import time
+
+from utils import deadlines
+from utils.courts import load_courts
+from utils.db import get_pool
+from utils.db_init import init_db
+from utils.evidence import get_registry
+from utils.text import SEARCH_COLUMNS, search_columns
+
+# Синтетическая база для нагрузочных замеров: пользователи, суды, дела,
+# доказательства, документы, сроки и задачи в пропорциях рабочей базы.
+# Строки пишутся пачками по CHUNK дел в одной транзакции; триггеры
+# (CaseStats, Blobs, CasesFts) работают как при обычном сохранении.
+# Один seed -> одна и та же база.
+
+CHUNK = 5000
+CASES_PER_USER = 1.3
+COURTS_PER_CITY = 12
+DAYS_BACK = 1000        # даты событий — последние ~3 года
+CREATED_DAYS_BACK = 730  # дела заведены за последние 2 года
+
+CATEGORY_WEIGHTS = {"return_goods": 0.5, "housing_utilities": 0.3, "minor_injury": 0.2}
+DOC_TYPE_WEIGHTS = {"claim": 0.7, "motion": 0.15, "objection": 0.15}
+STATUS_WEIGHTS = {"draft": 0.25, "analysis": 0.1, "docs_ready": 0.55, "scheduled": 0.1}
+REQUIRED_PRESENT = 0.85
+OPTIONAL_PRESENT = 0.4
+UPLOAD_SHARE = 0.3  # доля отмеченных доказательств с загруженным файлом
+
+CITIES = (
+    ("г. Москва", "Москва"), ("г. Санкт-Петербург", "Санкт-Петербург"),
+    ("Новосибирская область", "Новосибирск"), ("Свердловская область", "Екатеринбург"),
+    ("Республика Татарстан", "Казань"), ("Нижегородская область", "Нижний Новгород"),
+    ("Челябинская область", "Челябинск"), ("Самарская область", "Самара"),
+    ("Омская область", "Омск"), ("Ростовская область", "Ростов-на-Дону"),
+    ("Республика Башкортостан", "Уфа"), ("Красноярский край", "Красноярск"),
+    ("Пермский край", "Пермь"), ("Воронежская область", "Воронеж"),
+    ("Волгоградская область", "Волгоград"), ("Краснодарский край", "Краснодар"),
+)
+DISTRICTS = ("Ленинский", "Центральный", "Октябрьский", "Кировский", "Советский", "Железнодорожный")
+SURNAMES = ("Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков", "Морозов")
+NAMES = ("Иван", "Пётр", "Алексей", "Сергей", "Андрей", "Мария", "Анна", "Елена", "Ольга", "Наталья")
+OPPONENTS = {
+    "return_goods": ("ООО «Ромашка»", "ИП Сидоров С.С.", "ООО «ТехноМир»", "АО «Электросила»", "ООО «Мебель-Опт»"),
+    "housing_utilities": ("ООО «УК Жилсервис»", "АО «Теплосеть»", "ТСЖ «Берёзка»", "ООО «Водоканал»"),
+    "minor_injury": ("Петров П.П.", "ООО «Стройка»", "ИП Орлов О.О.", "ООО «ТЦ Галерея»"),
+}
+SENTENCES = {
+    "return_goods": (
+        "Купил товар в магазине ответчика и оплатил его полностью.",
+        "Товар не подошёл по размеру, упаковка и ярлыки сохранены.",
+        "В течение четырнадцати дней обратился к продавцу с требованием о возврате денег.",
+        "Продавец отказался принять товар и вернуть уплаченную сумму.",
+        "Претензия направлена заказным письмом, ответа не последовало.",
+        "Чек и переписка с продавцом сохранены.",
+    ),
+    "housing_utilities": (
+        "Управляющая компания начисляет плату за услуги, которые не оказывались.",
+        "В квартире несколько недель отсутствовала горячая вода.",
+        "Составлен акт обследования с участием соседей.",
+        "Претензия о перерасчёте направлена в управляющую компанию.",
+        "Перерасчёт не произведён, переплата не возвращена.",
+        "Квитанции и платёжные документы за период приложены.",
+    ),
+    "minor_injury": (
+        "Упал на неубранной лестнице у входа в торговый центр.",
+        "В травмпункте диагностирован ушиб и растяжение связок.",
+        "Понёс расходы на лечение и лекарства, чеки сохранены.",
+        "Был на больничном две недели и потерял заработок.",
+        "Досудебная претензия о возмещении вреда оставлена без ответа.",
+        "Есть свидетели падения и фотографии места происшествия.",
+    ),
+}
+
+
+def _pick(rng: random.Random, weights: dict[str, float]) -> str:
+    return rng.choices(list(weights), list(weights.values()))[0]
+
+
+def _sha(rng: random.Random) -> str:
+    return hashlib.sha256(rng.getrandbits(64).to_bytes(8, "little")).hexdigest()
+
+
+def synth_courts() -> Iterator[dict]:
+    for region, city in CITIES:
+        for k in range(COURTS_PER_CITY):
+            if k < len(DISTRICTS):
+                name, level = f"{DISTRICTS[k]} районный суд, г. {city}", "районный"
+            else:
+                name, level = f"Мировой судья участка №{k}, г. {city}", "мировой"
+            yield {"name": name, "court_level": level, "region": region, "city": city,
+                   "address": f"ул. Судебная, {k + 1}", "jurisdiction_notes": None}
+
+
+def synth_users(rng: random.Random, first_id: int, n: int) -> list[tuple]:
+    rows = []
+    for user_id in range(first_id, first_id + n):
+        region, city = rng.choice(CITIES)
+        email = f"user{user_id}@example.ru"
+        phone = f"+79{user_id:09d}"
+        rows.append((
+            user_id, f"{rng.choice(SURNAMES)} {rng.choice(NAMES)}", email, phone,
+            region, city, f"ул. Ленина, д. {rng.randint(1, 200)}, кв. {rng.randint(1, 300)}",
+            email, phone,
+        ))
+    return rows
+
+
+def synth_cases(
+    rng: random.Random, first_id: int, n: int, max_user_id: int, court_ids: list[int], today: date
+) -> tuple[list[tuple], list[tuple], list[tuple], list[tuple], list[tuple]]:
+    # -> Cases, CaseEvidence, Documents, Deadlines, Jobs
+    registry = get_registry()
+    cases, evidence, documents, case_deadlines, case_jobs = [], [], [], [], []
+    now = time.time()
+    for case_id in range(first_id, first_id + n):
+        category = _pick(rng, CATEGORY_WEIGHTS)
+        doc_types = registry.categories[category].doc_types
+        doc_type = _pick(rng, {d: w for d, w in DOC_TYPE_WEIGHTS.items() if d in doc_types})
+        status = _pick(rng, STATUS_WEIGHTS)
+        event_date = (today - timedelta(days=rng.randint(0, DAYS_BACK))).isoformat()
+        created_at = datetime.combine(
+            today - timedelta(days=rng.randint(0, CREATED_DAYS_BACK)), datetime.min.time()
+        ) + timedelta(seconds=rng.randint(0, 86399))
+        description = " ".join(rng.sample(SENTENCES[category], rng.randint(3, 6)))
+        row = (
+            case_id, rng.randint(1, max_user_id), rng.choice(court_ids), category, doc_type,
+            description, rng.choice(OPPONENTS[category]), f"г. Москва, ул. Торговая, {rng.randint(1, 99)}",
+            round(rng.lognormvariate(10, 1), 2), event_date,
+            round(rng.random(), 3) if status != "draft" else None, status,
+            created_at.isoformat(" "), created_at.isoformat(" "),
+        )
+        search = search_columns(row[6], row[5])
+        cases.append(row + tuple(search[c] for c in SEARCH_COLUMNS))
+        schema = doc_types[doc_type]
+        for item in schema.items.values():
+            present = rng.random() < (REQUIRED_PRESENT if item.required else OPTIONAL_PRESENT)
+            evidence.append((case_id, item.id, int(present)))
+            if present and rng.random() < UPLOAD_SHARE:
+                documents.append((case_id, f"evidence:{item.id}", None, f"synthetic/{_sha(rng)}",
+                                  "application/pdf", rng.randint(50_000, 3_000_000), None, None))
+        if status in ("docs_ready", "scheduled"):
+            documents.append((case_id, doc_type, f"{doc_type}.docx@synthetic", f"synthetic/{_sha(rng)}",
+                              "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                              rng.randint(20_000, 60_000), '["ст. 18 ЗоЗПП"]', _sha(rng)))
+        for d in deadlines.compute(category, event_date):
+            state = "overdue" if d["due_date"] < today.isoformat() else "planned"
+            if state == "overdue" and rng.random() < 0.5:
+                state = "done"
+            case_deadlines.append((case_id, d["title"], d["due_date"], state, d["source"]))
+        if status == "draft":
+            case_jobs.append(("analyze", case_id, "queued", 0, now))
+        else:
+            case_jobs.append(("analyze", case_id, "done", 1, now))
+            if status != "analysis":
+                case_jobs.append(("docgen", case_id, "done", 1, now))
+    return cases, evidence, documents, case_deadlines, case_jobs
+
+
+def populate(db_path: Path | str, n_cases: int, seed: int = 0, today: date | None = None) -> dict:
+    # Дописывает n_cases дел (и пользователей/сроки/документы к ним) в базу db_path
+    rng = random.Random(seed)
+    today = today or date.today()
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        init_db(conn)
+    with pool.transaction() as conn:
+        if conn.execute("SELECT count(*) FROM Courts").fetchone()[0] < len(CITIES):
+            load_courts(conn, synth_courts())
+        court_ids = [r[0] for r in conn.execute("SELECT id FROM Courts")]
+        first_user = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM Users").fetchone()[0]
+        first_case = conn.execute("SELECT coalesce(max(id), 0) + 1 FROM Cases").fetchone()[0]
+
+    n_users = max(1, int(n_cases / CASES_PER_USER))
+    started = time.perf_counter()
+    for offset in range(0, n_users, CHUNK * 4):
+        rows = synth_users(rng, first_user + offset, min(CHUNK * 4, n_users - offset))
+        with pool.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO Users (id, fio, email, phone, resident_region, resident_city,
+                                   resident_address, email_key, phone_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+    max_user_id = first_user + n_users - 1
+    totals = {"users": n_users, "cases": 0, "evidence": 0, "documents": 0, "deadlines": 0, "jobs": 0}
+    for offset in range(0, n_cases, CHUNK):
+        cases, evidence, documents, case_deadlines, case_jobs = synth_cases(
+            rng, first_case + offset, min(CHUNK, n_cases - offset), max_user_id, court_ids, today
+        )
+        with pool.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO Cases (id, user_id, court_id, category, doc_type, description,
+                                   opponent_name, opponent_address, amount, event_date,
+                                   p_success, status, created_at, updated_at,
+                                   opponent_key, opponent_fts, description_fts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                cases,
+            )
+            conn.executemany("INSERT INTO CaseEvidence (case_id, evidence_id, present) VALUES (?, ?, ?)", evidence)
+            conn.executemany(
+                """
+                INSERT INTO Documents (case_id, doc_type, template_name, file_path, mime_type,
+                                       file_size, kb_articles, render_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                documents,
+            )
+            conn.executemany(
+                "INSERT INTO Deadlines (case_id, title, due_date, status, source) VALUES (?, ?, ?, ?, ?)",
+                case_deadlines,
+            )
+            conn.executemany(
+                "INSERT INTO Jobs (kind, case_id, status, attempts, run_after) VALUES (?, ?, ?, ?, ?)",
+                case_jobs,
+            )
+        totals["cases"] += len(cases)
+        totals["evidence"] += len(evidence)
+        totals["documents"] += len(documents)
+        totals["deadlines"] += len(case_deadlines)
+        totals["jobs"] += len(case_jobs)
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    return totals
+
+
+def main(argv: list[str]) -> None:
+    # python -m bench.synth DB_PATH N_CASES [--seed S]
+    if len(argv) < 2 or not argv[1].isdigit():
+        raise SystemExit("usage: python -m bench.synth DB_PATH N_CASES [--seed S]")
+    seed = int(argv[argv.index("--seed") + 1]) if "--seed" in argv else 0
+    totals = populate(argv[0], int(argv[1]), seed)
+    print(" ".join(f"{k}={v}" for k, v in totals.items()))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
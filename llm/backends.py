@@ -0,0 +1,389 @@
+# llm/backends.py
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Protocol
+import codecs
+import ctypes
+import hashlib
+import os
+import time
+
+import numpy as np
+
+MAX_BATCH = 4        # одновременно генерируемых последовательностей
+PREFIX_SLOTS = 6     # закешированных префиксов (пар категория/тип документа)
+N_CTX = 8192         # общий KV-кеш на все последовательности и префиксы
+N_BATCH = 512        # токенов за один llama_decode при разборе запроса
+TOP_K = 40
+
+
+@dataclass
+class GenerationRequest:
+    request_id: str
+    prompt: str                     # часть запроса, своя для дела
+    prefix: str = ""                # общая часть (инструкция, нормы) — кешируется
+    prefix_key: str | None = None   # например "return_goods:claim:<sha>"
+    max_tokens: int = 512
+    temperature: float = 0.0
+    seed: int = 0
+
+
+# (request_id, кусок текста, последовательность завершена)
+Event = tuple[str, str, bool]
+
+
+class Backend(Protocol):
+    # Бэкенд хранит состояние активных последовательностей; планирование
+    # (когда добавлять новые запросы) — в воркере, см. llm/service.py
+    @property
+    def free_slots(self) -> int: ...
+
+    @property
+    def active(self) -> int: ...
+
+    def add(self, request: GenerationRequest) -> None:
+        # Разбор запроса: префикс из кеша + своя часть. Ошибка — ValueError.
+        ...
+
+    def step(self) -> list[Event]:
+        # Один токен для каждой активной последовательности (одним батчем)
+        ...
+
+    def cancel(self, request_id: str) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def prefix_cache_key(request: GenerationRequest) -> str:
+    return request.prefix_key or hashlib.sha256(request.prefix.encode("utf-8")).hexdigest()
+
+
+# =========================
+# Детерминированная заглушка (тесты, разработка без модели)
+# =========================
+@dataclass
+class _StubSeq:
+    request: GenerationRequest
+    tokens: list[str]
+    pos: int = 0
+
+
+@dataclass
+class StubBackend:
+    # Ответ однозначно определяется запросом: «эхо» префикса и текста дела
+    max_batch: int = MAX_BATCH
+    prefix_slots: int = PREFIX_SLOTS
+    step_delay_s: float = 0.0  # имитация времени на токен
+    prefix_hits: int = 0
+    prefix_misses: int = 0
+    _seqs: dict[str, _StubSeq] = field(default_factory=dict)
+    _prefixes: OrderedDict = field(default_factory=OrderedDict)
+
+    @property
+    def free_slots(self) -> int:
+        return self.max_batch - len(self._seqs)
+
+    @property
+    def active(self) -> int:
+        return len(self._seqs)
+
+    def add(self, request: GenerationRequest) -> None:
+        if not request.prompt.strip():
+            raise ValueError("пустой запрос")
+        if self.free_slots <= 0:
+            raise RuntimeError("нет свободных слотов")
+        tokens = []
+        if request.prefix:
+            key = prefix_cache_key(request)
+            if key in self._prefixes:
+                self.prefix_hits += 1
+                self._prefixes.move_to_end(key)
+            else:
+                self.prefix_misses += 1
+                self._prefixes[key] = request.prefix.split()
+                if len(self._prefixes) > self.prefix_slots:
+                    self._prefixes.popitem(last=False)
+            tokens.append(f"[{key}]")
+        tokens += request.prompt.split()
+        self._seqs[request.request_id] = _StubSeq(request, tokens[:request.max_tokens])
+
+    def step(self) -> list[Event]:
+        if self.step_delay_s:
+            time.sleep(self.step_delay_s)
+        events = []
+        for rid, seq in list(self._seqs.items()):
+            piece = (" " if seq.pos else "") + seq.tokens[seq.pos]
+            seq.pos += 1
+            done = seq.pos >= len(seq.tokens)
+            if done:
+                del self._seqs[rid]
+            events.append((rid, piece, done))
+        return events
+
+    def cancel(self, request_id: str) -> None:
+        self._seqs.pop(request_id, None)
+
+    def close(self) -> None:
+        self._seqs.clear()
+
+
+# =========================
+# llama.cpp (GGUF, CPU) — llama-cpp-python, низкоуровневый API
+# =========================
+@dataclass
+class _Prefix:
+    seq_id: int
+    n_tokens: int
+
+
+@dataclass
+class _Seq:
+    request: GenerationRequest
+    slot: int
+    pos: int
+    next_token: int
+    rng: np.random.Generator
+    decoder: codecs.IncrementalDecoder
+    generated: int = 0
+
+
+class LlamaCppBackend:
+    # Один контекст с общим KV-кешем. Последовательности — seq_id 0..max_batch-1,
+    # префиксы живут в seq_id max_batch.. и копируются в слот через
+    # llama_kv_cache_seq_cp (ячейки KV общие, память не дублируется).
+    def __init__(
+        self,
+        model_path: str,
+        n_ctx: int = N_CTX,
+        max_batch: int = MAX_BATCH,
+        prefix_slots: int = PREFIX_SLOTS,
+        n_threads: int | None = None,
+        n_batch: int = N_BATCH,
+    ) -> None:
+        import llama_cpp  # тяжёлый импорт — только в процессе воркера
+
+        self._ll = llama_cpp
+        self.max_batch = max_batch
+        self.prefix_slots = prefix_slots
+        self.n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+
+        llama_cpp.llama_backend_init()
+        self._model = llama_cpp.llama_load_model_from_file(
+            model_path.encode("utf-8"), llama_cpp.llama_model_default_params()
+        )
+        if not self._model:
+            raise RuntimeError(f"не удалось загрузить модель: {model_path}")
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = n_ctx
+        params.n_batch = n_batch
+        params.n_seq_max = max_batch + prefix_slots
+        params.n_threads = params.n_threads_batch = n_threads or os.cpu_count() or 1
+        self._ctx = llama_cpp.llama_new_context_with_model(self._model, params)
+        if not self._ctx:
+            llama_cpp.llama_free_model(self._model)
+            raise RuntimeError("не удалось создать контекст llama.cpp")
+        self._n_vocab = llama_cpp.llama_n_vocab(self._model)
+        self._batch = llama_cpp.llama_batch_init(max(n_batch, max_batch), 0, 1)
+
+        self._seqs: dict[str, _Seq] = {}
+        self._free = list(range(max_batch - 1, -1, -1))
+        self._prefixes: OrderedDict[str, _Prefix] = OrderedDict()
+        self._free_prefix = list(range(max_batch + prefix_slots - 1, max_batch - 1, -1))
+
+    @property
+    def free_slots(self) -> int:
+        return len(self._free)
+
+    @property
+    def active(self) -> int:
+        return len(self._seqs)
+
+    # --- токены ---
+    def _tokenize(self, text: str, add_special: bool) -> list[int]:
+        data = text.encode("utf-8")
+        size = len(data) + 2
+        while True:
+            buf = (self._ll.llama_token * size)()
+            n = self._ll.llama_tokenize(self._model, data, len(data), buf, size, add_special, False)
+            if n >= 0:
+                return list(buf[:n])
+            size = -n
+
+    def _piece(self, token: int) -> bytes:
+        size = 32
+        while True:
+            buf = (ctypes.c_char * size)()
+            n = self._ll.llama_token_to_piece(self._model, token, buf, size, 0, False)
+            if n >= 0:
+                return buf.raw[:n]
+            size = -n
+
+    def _decode(self, tokens: list[int], start: int, seq_id: int) -> None:
+        # Разбор подряд идущих токенов одной последовательности, логиты — только у последнего
+        batch = self._batch
+        for lo in range(0, len(tokens), self.n_batch):
+            chunk = tokens[lo:lo + self.n_batch]
+            for i, token in enumerate(chunk):
+                batch.token[i] = token
+                batch.pos[i] = start + lo + i
+                batch.n_seq_id[i] = 1
+                batch.seq_id[i][0] = seq_id
+                batch.logits[i] = lo + i == len(tokens) - 1
+            batch.n_tokens = len(chunk)
+            self._check(self._ll.llama_decode(self._ctx, batch))
+
+    def _check(self, rc: int) -> None:
+        if rc != 0:
+            raise RuntimeError(f"llama_decode вернул {rc}: не хватает KV-кеша (увеличьте n_ctx)")
+
+    def _sample(self, index: int, request: GenerationRequest, rng: np.random.Generator) -> int:
+        logits = np.ctypeslib.as_array(
+            self._ll.llama_get_logits_ith(self._ctx, index), shape=(self._n_vocab,)
+        )
+        if request.temperature <= 0:
+            return int(np.argmax(logits))
+        top = np.argpartition(logits, -TOP_K)[-TOP_K:]
+        scaled = logits[top].astype(np.float64) / request.temperature
+        probs = np.exp(scaled - scaled.max())
+        return int(top[rng.choice(len(top), p=probs / probs.sum())])
+
+    # --- кеш префиксов ---
+    def _prefix(self, request: GenerationRequest) -> _Prefix:
+        key = prefix_cache_key(request)
+        cached = self._prefixes.get(key)
+        if cached is not None:
+            self.prefix_hits += 1
+            self._prefixes.move_to_end(key)
+            return cached
+        self.prefix_misses += 1
+        if not self._free_prefix:
+            _, evicted = self._prefixes.popitem(last=False)
+            # Ячейки, скопированные в активные слоты, остаются за ними
+            self._ll.llama_kv_cache_seq_rm(self._ctx, evicted.seq_id, -1, -1)
+            self._free_prefix.append(evicted.seq_id)
+        seq_id = self._free_prefix.pop()
+        tokens = self._tokenize(request.prefix, add_special=True)
+        try:
+            self._decode(tokens, 0, seq_id)
+        except Exception:
+            self._ll.llama_kv_cache_seq_rm(self._ctx, seq_id, -1, -1)
+            self._free_prefix.append(seq_id)
+            raise
+        prefix = self._prefixes[key] = _Prefix(seq_id, len(tokens))
+        return prefix
+
+    # --- Backend ---
+    def add(self, request: GenerationRequest) -> None:
+        if not request.prompt.strip():
+            raise ValueError("пустой запрос")
+        if not self._free:
+            raise RuntimeError("нет свободных слотов")
+        start = 0
+        slot = self._free.pop()
+        try:
+            if request.prefix:
+                prefix = self._prefix(request)
+                self._ll.llama_kv_cache_seq_cp(self._ctx, prefix.seq_id, slot, 0, prefix.n_tokens)
+                start = prefix.n_tokens
+            tokens = self._tokenize(request.prompt, add_special=not request.prefix)
+            if start + len(tokens) + 1 >= self.n_ctx:
+                raise ValueError("запрос не помещается в контекст модели")
+            self._decode(tokens, start, slot)
+        except Exception:
+            self._ll.llama_kv_cache_seq_rm(self._ctx, slot, -1, -1)
+            self._free.append(slot)
+            raise
+        rng = np.random.default_rng(request.seed)
+        self._seqs[request.request_id] = _Seq(
+            request=request,
+            slot=slot,
+            pos=start + len(tokens),
+            next_token=self._sample(-1, request, rng),
+            rng=rng,
+            decoder=codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        )
+
+    def step(self) -> list[Event]:
+        events = []
+        running = []
+        for rid, seq in list(self._seqs.items()):
+            if self._ll.llama_token_is_eog(self._model, seq.next_token):
+                events.append((rid, seq.decoder.decode(b"", final=True), True))
+                self._release(rid)
+                continue
+            piece = seq.decoder.decode(self._piece(seq.next_token))
+            seq.generated += 1
+            if seq.generated >= seq.request.max_tokens or seq.pos + 1 >= self.n_ctx:
+                events.append((rid, piece + seq.decoder.decode(b"", final=True), True))
+                self._release(rid)
+                continue
+            events.append((rid, piece, False))
+            running.append(seq)
+        if not running:
+            return events
+
+        # Continuous batching: следующий токен всех активных последовательностей — один decode
+        batch = self._batch
+        for i, seq in enumerate(running):
+            batch.token[i] = seq.next_token
+            batch.pos[i] = seq.pos
+            batch.n_seq_id[i] = 1
+            batch.seq_id[i][0] = seq.slot
+            batch.logits[i] = True
+        batch.n_tokens = len(running)
+        self._check(self._ll.llama_decode(self._ctx, batch))
+        for i, seq in enumerate(running):
+            seq.pos += 1
+            seq.next_token = self._sample(i, seq.request, seq.rng)
+        return events
+
+    def _release(self, request_id: str) -> None:
+        seq = self._seqs.pop(request_id)
+        self._ll.llama_kv_cache_seq_rm(self._ctx, seq.slot, -1, -1)
+        self._free.append(seq.slot)
+
+    def cancel(self, request_id: str) -> None:
+        if request_id in self._seqs:
+            self._release(request_id)
+
+    def close(self) -> None:
+        self._seqs.clear()
+        self._ll.llama_batch_free(self._batch)
+        self._ll.llama_free(self._ctx)
+        self._ll.llama_free_model(self._model)
+
+
+# =========================
+# Выбор бэкенда по окружению
+# =========================
+def backend_config() -> dict:
+    # APP_LLM_BACKEND=stub|llama_cpp, по умолчанию llama_cpp с моделью из APP_LLM_MODEL.
+    # Заглушка (эхо запроса) — только по явному APP_LLM_BACKEND=stub
+    model_path = os.environ.get("APP_LLM_MODEL") or ""
+    kind = os.environ.get("APP_LLM_BACKEND") or "llama_cpp"
+    return {
+        "kind": kind,
+        "model_path": model_path,
+        "n_ctx": int(os.environ.get("APP_LLM_CTX") or N_CTX),
+        "max_batch": int(os.environ.get("APP_LLM_BATCH") or MAX_BATCH),
+        "n_threads": int(os.environ.get("APP_LLM_THREADS") or 0) or None,
+    }
+
+
+def make_backend(config: dict) -> Backend:
+    if config["kind"] == "stub":
+        return StubBackend(max_batch=config["max_batch"], step_delay_s=config.get("step_delay_s", 0.0))
+    if config["kind"] == "llama_cpp":
+        if not config["model_path"]:
+            raise ValueError("для llama_cpp укажите путь к GGUF-модели в APP_LLM_MODEL")
+        return LlamaCppBackend(
+            config["model_path"],
+            n_ctx=config["n_ctx"],
+            max_batch=config["max_batch"],
+            n_threads=config["n_threads"],
+        )
+    raise ValueError(f"неизвестный бэкенд LLM: {config['kind']}")
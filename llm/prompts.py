@@ -0,0 +1,63 @@
+# llm/prompts.py
+from __future__ import annotations
+from functools import lru_cache
+from typing import Mapping
+import hashlib
+
+from ml import kb
+from utils.evidence import get_registry, registry_version
+
+SYSTEM_PROMPT = (
+    "Ты — помощник юриста по мелким гражданским спорам в России. "
+    "Составь проект процессуального документа по данным дела: шапка (суд, истец, ответчик), "
+    "описательная часть, ссылки на нормы, требования, перечень приложений. "
+    "Не выдумывай факты, которых нет в данных дела.\n"
+)
+KB_ARTICLES = 4
+KB_ARTICLE_CHARS = 600  # текст нормы в промпте обрезается: окно контекста ограничено
+
+
+@lru_cache(maxsize=64)
+def _prefix(category: str, doc_type: str, registry_version: int, kb_version: str | None) -> tuple[str, str]:
+    # Общая часть для всех дел категории и типа документа: её KV-кеш переиспользуется
+    # воркером (llm/backends.py). registry_version и kb_version — чтобы сбросить кеш
+    # при смене схемы доказательств или пересборке индекса норм.
+    registry = get_registry()
+    schema = registry.doc_type(category, doc_type)
+    lines = [SYSTEM_PROMPT]
+    if schema is not None:
+        lines.append(f"Категория спора: {registry.categories[category].label}.")
+        lines.append(f"Тип документа: {schema.label}.")
+        if schema.required:
+            lines.append("Обязательные приложения: " + "; ".join(i.label for i in schema.required) + ".")
+        # Нормы подбираются по типу документа, а не по описанию дела — иначе префикс
+        # у каждого дела свой и KV-кеш не переиспользуется
+        query = " ".join([schema.label, *(i.label for i in schema.required)])
+        articles = kb.search(query, category, KB_ARTICLES)
+        if articles:
+            lines.append("Применимые нормы:")
+            lines.extend(
+                f"— {a.citation}. {a.title}: {a.text[:KB_ARTICLE_CHARS]}" for a in articles
+            )
+    text = "\n".join(lines) + "\n\n"
+    sha = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{category}:{doc_type}:{sha}", text
+
+
+def build_prompt(case: Mapping, court: Mapping | None = None) -> tuple[str, str, str]:
+    # -> (prefix_key, prefix, prompt) для LLMService.generate
+    index = kb.load_index()
+    prefix_key, prefix = _prefix(
+        case["category"] or "", case["doc_type"] or "", registry_version(), index and index.version
+    )
+    fields = [
+        ("Ответчик", case["opponent_name"]),
+        ("Адрес ответчика", case["opponent_address"]),
+        ("Сумма требований, руб.", case["amount"]),
+        ("Дата события", case["event_date"]),
+        ("Суд", case["court_name_override"] or (court and court["name"])),
+        ("Адрес суда", case["court_address_override"] or (court and court["address"])),
+        ("Описание", case["description"]),
+    ]
+    body = "\n".join(f"{label}: {value}" for label, value in fields if value not in (None, ""))
+    return prefix_key, prefix, f"Данные дела:\n{body}\n\nТекст документа:\n"
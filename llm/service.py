@@ -0,0 +1,225 @@
+# llm/service.py
+from __future__ import annotations
+from typing import Iterator
+import multiprocessing as mp
+import queue
+import sys
+import threading
+import uuid
+
+from llm.backends import GenerationRequest, backend_config, make_backend
+
+QUEUE_SIZE = 32          # запросов в очереди сверх активных; дальше — LLMBusy
+SUBMIT_TIMEOUT_S = 2.0   # сколько ждать места в очереди
+TOKEN_TIMEOUT_S = 120.0  # молчание воркера дольше этого — ошибка
+MAX_PENDING_CANCELS = 1024
+
+# Сообщения воркера: (request_id, kind, text)
+TOKEN, DONE, ERROR = "token", "done", "error"
+
+
+class LLMBusy(RuntimeError):
+    pass
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+# =========================
+# Процесс воркера: одна модель на сервер
+# =========================
+def _worker(config: dict, requests: mp.Queue, cancels: mp.Queue, events: mp.Queue) -> None:
+    try:
+        backend = make_backend(config)
+    except Exception as e:
+        events.put((None, ERROR, f"{type(e).__name__}: {e}"))
+        return
+    events.put((None, DONE, "ready"))
+
+    running: set[str] = set()
+    # Отмены запросов, ещё не взятых из очереди (dict — порядок для обрезки старых)
+    cancelled: dict[str, None] = {}
+    while True:
+        while True:
+            try:
+                rid = cancels.get_nowait()
+            except queue.Empty:
+                break
+            if rid in running:
+                backend.cancel(rid)
+                running.discard(rid)
+            else:
+                cancelled[rid] = None
+                if len(cancelled) > MAX_PENDING_CANCELS:
+                    del cancelled[next(iter(cancelled))]
+
+        # Continuous batching: новые запросы принимаются между шагами декодирования,
+        # как только освобождается слот. Без активных — ждём очередь.
+        while backend.free_slots > 0:
+            try:
+                request = requests.get(block=not running)
+            except queue.Empty:
+                break
+            if request is None:
+                backend.close()
+                return
+            if request.request_id in cancelled:
+                del cancelled[request.request_id]
+                continue
+            try:
+                backend.add(request)
+                running.add(request.request_id)
+            except Exception as e:
+                events.put((request.request_id, ERROR, f"{type(e).__name__}: {e}"))
+
+        try:
+            for rid, piece, done in backend.step():
+                if piece:
+                    events.put((rid, TOKEN, piece))
+                if done:
+                    running.discard(rid)
+                    events.put((rid, DONE, ""))
+        except Exception as e:
+            # Ошибка батча касается всех активных последовательностей
+            for rid in running:
+                backend.cancel(rid)
+                events.put((rid, ERROR, f"{type(e).__name__}: {e}"))
+            running.clear()
+
+
+# =========================
+# Клиент в процессе Streamlit
+# =========================
+class LLMService:
+    # Один экземпляр на процесс (st.cache_resource в app/app.py). Сессии кладут
+    # запросы в общую ограниченную очередь и читают свои токены из личных очередей.
+    def __init__(self, config: dict | None = None, queue_size: int = QUEUE_SIZE) -> None:
+        config = config or backend_config()
+        if config["kind"] == "llama_cpp" and not config["model_path"]:
+            raise LLMError("модель не задана: укажите путь к GGUF-модели в APP_LLM_MODEL")
+        ctx = mp.get_context("spawn")
+        self._requests = ctx.Queue(maxsize=queue_size)
+        self._cancels = ctx.Queue()
+        self._events = ctx.Queue()
+        self._process = ctx.Process(
+            target=_worker,
+            args=(config, self._requests, self._cancels, self._events),
+            name="llm-worker",
+            daemon=True,
+        )
+        self._process.start()
+        self._streams: dict[str | None, queue.Queue] = {None: queue.Queue()}
+        self._lock = threading.Lock()
+        self._router = threading.Thread(target=self._route, name="llm-router", daemon=True)
+        self._router.start()
+
+    def _route(self) -> None:
+        while True:
+            try:
+                rid, kind, text = self._events.get(timeout=1.0)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+                with self._lock:
+                    for stream in self._streams.values():
+                        stream.put((ERROR, "процесс LLM завершился"))
+                return
+            with self._lock:
+                stream = self._streams.get(rid)
+            if stream is not None:
+                stream.put((kind, text))
+
+    def wait_ready(self, timeout: float | None = None) -> None:
+        # Загрузка модели в воркере; ошибка загрузки — LLMError
+        kind, text = self._streams[None].get(timeout=timeout)
+        self._streams[None].put((kind, text))
+        if kind == ERROR:
+            raise LLMError(text)
+
+    def submit(
+        self,
+        prompt: str,
+        prefix: str = "",
+        prefix_key: str | None = None,
+        max_tokens: int = 512,
+        temperature: float = 0.0,
+        timeout: float = SUBMIT_TIMEOUT_S,
+    ) -> str:
+        request = GenerationRequest(
+            request_id=uuid.uuid4().hex,
+            prompt=prompt,
+            prefix=prefix,
+            prefix_key=prefix_key,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        if not self._process.is_alive():
+            raise LLMError("процесс LLM не запущен")
+        with self._lock:
+            self._streams[request.request_id] = queue.Queue()
+        try:
+            self._requests.put(request, timeout=timeout)
+        except queue.Full:
+            self._forget(request.request_id)
+            raise LLMBusy("очередь генерации заполнена") from None
+        return request.request_id
+
+    def stream(self, request_id: str, timeout: float = TOKEN_TIMEOUT_S) -> Iterator[str]:
+        with self._lock:
+            tokens = self._streams[request_id]
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, text = tokens.get(timeout=timeout)
+                except queue.Empty:
+                    raise LLMError("LLM не отвечает") from None
+                if kind == ERROR:
+                    finished = True
+                    raise LLMError(text)
+                if kind == DONE:
+                    finished = True
+                    return
+                yield text
+        finally:
+            # Генератор закрыт раньше конца (пользователь ушёл со страницы) — освобождаем слот
+            if not finished:
+                self.cancel(request_id)
+            self._forget(request_id)
+
+    def generate(self, prompt: str, **kwargs) -> Iterator[str]:
+        # Для st.write_stream: запрос уходит в очередь сразу, токены — по мере готовности
+        return self.stream(self.submit(prompt, **kwargs))
+
+    def cancel(self, request_id: str) -> None:
+        self._cancels.put(request_id)
+
+    def _forget(self, request_id: str) -> None:
+        with self._lock:
+            self._streams.pop(request_id, None)
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def main(argv: list[str]) -> None:
+    # python -m llm.service "текст запроса"  (бэкенд — APP_LLM_BACKEND / APP_LLM_MODEL)
+    try:
+        service = LLMService()
+    except LLMError as e:
+        raise SystemExit(str(e)) from None
+    try:
+        service.wait_ready()
+        for piece in service.generate(" ".join(argv) or "Проверка связи."):
+            print(piece, end="", flush=True)
+        print()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
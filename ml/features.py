@@ -0,0 +1,134 @@
+# ml/features.py
+from __future__ import annotations
+from typing import Iterable, Iterator, Sequence
+import hashlib
+import math
+import sqlite3
+
+import numpy as np
+from scipy import sparse
+
+from utils.evidence import get_registry
+
+CHUNK_SIZE = 500  # id в одном IN (...)
+
+
+def chunked(ids: Sequence[int], size: int = CHUNK_SIZE) -> Iterator[Sequence[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def fetch_cases(conn: sqlite3.Connection, case_ids: Sequence[int]) -> list[dict]:
+    # Дела вместе с отметками CaseEvidence: два запроса на пачку, без N+1
+    cases: dict[int, dict] = {}
+    for chunk in chunked(list(case_ids)):
+        marks = ",".join("?" * len(chunk))
+        for row in conn.execute(
+            f"""
+            SELECT id, category, doc_type, description, amount, event_date, created_at
+            FROM Cases WHERE id IN ({marks})
+            """,
+            chunk,
+        ):
+            cases[row["id"]] = {**dict(row), "evidence": {}}
+        for case_id, evidence_id, present in conn.execute(
+            f"SELECT case_id, evidence_id, present FROM CaseEvidence WHERE case_id IN ({marks})",
+            chunk,
+        ):
+            cases[case_id]["evidence"][evidence_id] = present
+    return [cases[i] for i in case_ids if i in cases]
+
+
+def structured_features(case: dict) -> dict[str, float]:
+    # Признаки помимо текста: категория/тип документа, флаги доказательств,
+    # доля недостающих обязательных доказательств и сумма иска
+    category = case.get("category") or "none"
+    doc_type = case.get("doc_type") or "none"
+    evidence = case.get("evidence") or {}
+    feats: dict[str, float] = {f"cat={category}": 1.0, f"doc={category}:{doc_type}": 1.0}
+    for evidence_id, present in evidence.items():
+        feats[f"ev={category}:{evidence_id}"] = float(present or 0)
+
+    schema = get_registry().doc_type(case.get("category"), case.get("doc_type"))
+    if schema and schema.required_ids:
+        missing = sum(1 for i in schema.required_ids if not evidence.get(i))
+        feats["required_missing_share"] = missing / len(schema.required_ids)
+
+    amount = case.get("amount") or 0.0
+    feats["log_amount"] = math.log1p(max(float(amount), 0.0))
+    return feats
+
+
+def texts(cases: Iterable[dict]) -> list[str]:
+    return [c.get("description") or "" for c in cases]
+
+
+# =========================
+# Кеш TF-IDF векторов (NlpAnalysis.text_features)
+# =========================
+def description_sha(text: str | None) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def encode_vector(indices: np.ndarray, data: np.ndarray) -> bytes:
+    # int32 индексы, затем float32 значения
+    return indices.astype("<i4").tobytes() + data.astype("<f4").tobytes()
+
+
+def decode_vector(blob: bytes) -> tuple[np.ndarray, np.ndarray]:
+    nnz = len(blob) // 8
+    return (
+        np.frombuffer(blob, dtype="<i4", count=nnz),
+        np.frombuffer(blob, dtype="<f4", count=nnz, offset=4 * nnz),
+    )
+
+
+def cached_text_features(
+    conn: sqlite3.Connection, cases: Sequence[dict], version: str
+) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    # Векторы, посчитанные той же версией модели по тому же тексту описания
+    if not cases:
+        return {}
+    by_id = {c["id"]: c for c in cases}
+    cached = {}
+    for chunk in chunked(list(by_id)):
+        marks = ",".join("?" * len(chunk))
+        for case_id, sha, blob in conn.execute(
+            f"""
+            SELECT case_id, description_sha, text_features FROM NlpAnalysis
+            WHERE case_id IN ({marks}) AND text_features_version = ?
+              AND text_features IS NOT NULL
+            """,
+            (*chunk, version),
+        ):
+            if sha == description_sha(by_id[case_id].get("description")):
+                cached[case_id] = decode_vector(blob)
+    return cached
+
+
+def text_matrix(
+    tfidf, cases: Sequence[dict], cache: dict[int, tuple[np.ndarray, np.ndarray]]
+) -> sparse.csr_matrix:
+    # Токенизируем только дела без кеша, остальное собираем из готовых векторов
+    missing = [c for c in cases if c["id"] not in cache]
+    fresh = tfidf.transform(texts(missing)) if missing else None
+    indices, data, indptr = [], [], [0]
+    k = 0
+    for case in cases:
+        if case["id"] in cache:
+            idx, dat = cache[case["id"]]
+        else:
+            lo, hi = fresh.indptr[k], fresh.indptr[k + 1]
+            idx, dat = fresh.indices[lo:hi], fresh.data[lo:hi]
+            k += 1
+        indices.append(idx)
+        data.append(dat)
+        indptr.append(indptr[-1] + len(idx))
+    return sparse.csr_matrix(
+        (
+            np.concatenate(data).astype(np.float32) if data else np.empty(0, np.float32),
+            np.concatenate(indices) if indices else np.empty(0, np.int32),
+            np.array(indptr),
+        ),
+        shape=(len(cases), len(tfidf.vocabulary_)),
+    )
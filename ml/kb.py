@@ -0,0 +1,413 @@
+# ml/kb.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Sequence
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+
+import numpy as np
+import yaml
+
+from utils import metrics
+from utils.text import words
+
+ROOT = Path(__file__).resolve().parents[1]
+KB_DIR = ROOT / "kb"
+MANIFEST_PATH = KB_DIR / "statutes.yaml"
+MODELS_DIR = Path(os.environ.get("APP_MODELS_DIR") or ROOT / "models") / "kb"
+LATEST = "LATEST"  # файл с версией актуального индекса
+SEGMENTS = "segments"  # разобранные файлы норм: пересобираются только изменившиеся
+
+TOKENIZER_VERSION = 1  # меняется вместе с tokenize(): старые сегменты становятся невалидными
+CHUNK_CHARS = 1200
+BM25_K1 = 1.5
+BM25_B = 0.75
+DENSE_DIM = 128
+DENSE_WEIGHT = 0.5  # вклад косинусной близости LSA к нормированному BM25
+
+# =========================
+# Токенизация: слова и стоп-слова — как в поиске по делам (utils/text.py),
+# окончания отсекаются своим, более грубым стеммером
+# =========================
+_HEADING_RE = re.compile(r"^##\s+Статья\s+(\d+(?:\.\d+)*)\.?\s*(.*)$")
+
+# Окончания русских существительных, прилагательных и глаголов, от длинных к коротким
+_ENDINGS = tuple(sorted(
+    "ами ями ого его ому ему ыми ими ать ять ить еть ешь ете ует уют ила ала ела ыла "
+    "ил ал ел ыл ой ей ий ый ая яя ое ее ую юю ам ям ах ях ом ем ов ев ию ия ие ии ть "
+    "ет ит ут ют ат ят ла ли ло а я о е у ю ы и ь й".split(),
+    key=len, reverse=True,
+))
+
+
+def _stem(word: str) -> str:
+    if word.endswith(("ся", "сь")) and len(word) > 5:
+        word = word[:-2]
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    return [_stem(w) for w in words(text)]
+
+
+# =========================
+# Разбор файлов норм на фрагменты (по статьям, длинные — по абзацам)
+# =========================
+@dataclass(frozen=True)
+class Statute:
+    file: str  # путь относительно kb/
+    code: str  # краткое название акта в ссылке: «ЗоЗПП», «ГК РФ»
+    categories: tuple[str, ...]
+
+
+def read_manifest(path: Path = MANIFEST_PATH) -> list[Statute]:
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    return [
+        Statute(s["file"], s["code"], tuple(s.get("categories") or ()))
+        for s in data.get("statutes") or ()
+    ]
+
+
+def chunk_statute(text: str) -> list[dict]:
+    # -> [{"article", "title", "text"}]; текст до первой статьи (заголовок акта) пропускается
+    articles: list[tuple[str, str, list[str]]] = []
+    for line in text.splitlines():
+        heading = _HEADING_RE.match(line)
+        if heading:
+            articles.append((heading.group(1), heading.group(2).strip(), []))
+        elif articles and line.strip():
+            articles[-1][2].append(line.strip())
+    chunks = []
+    for number, title, paragraphs in articles:
+        piece: list[str] = []
+        for paragraph in paragraphs:
+            if piece and sum(map(len, piece)) + len(paragraph) > CHUNK_CHARS:
+                chunks.append({"article": number, "title": title, "text": "\n".join(piece)})
+                piece = []
+            piece.append(paragraph)
+        chunks.append({"article": number, "title": title, "text": "\n".join(piece)})
+    return chunks
+
+
+def _segment_path(statute: Statute, models_dir: Path) -> Path:
+    return models_dir / SEGMENTS / (statute.file.replace("/", "__") + ".json")
+
+
+def _load_segment(path: Path) -> Optional[dict]:
+    try:
+        segment = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return segment if segment.get("tokenizer") == TOKENIZER_VERSION else None
+
+
+def update_segment(statute: Statute, kb_dir: Path = KB_DIR, models_dir: Path = MODELS_DIR) -> tuple[dict, bool]:
+    # Файл перечитывается, только если изменились mtime/размер и содержимое (sha256).
+    # -> (сегмент, изменился ли он)
+    source = kb_dir / statute.file
+    st = os.stat(source)
+    path = _segment_path(statute, models_dir)
+    segment = _load_segment(path)
+    if segment and segment["mtime_ns"] == st.st_mtime_ns and segment["size"] == st.st_size:
+        return segment, False
+    raw = source.read_bytes()
+    sha = hashlib.sha256(raw).hexdigest()
+    changed = not segment or segment["sha256"] != sha
+    if changed:
+        chunks = chunk_statute(raw.decode("utf-8"))
+        for chunk in chunks:
+            terms = tokenize(f"{chunk['title']}\n{chunk['text']}")
+            chunk["length"] = len(terms)
+            chunk["terms"] = {t: terms.count(t) for t in dict.fromkeys(terms)}
+        segment = {"tokenizer": TOKENIZER_VERSION, "file": statute.file, "sha256": sha, "chunks": chunks}
+    segment.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(segment, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+    return segment, changed
+
+
+# =========================
+# Сборка индекса: BM25 (веса считаются заранее) + опционально LSA-векторы
+# =========================
+def _bm25(segments: Sequence[tuple[Statute, dict]]) -> tuple[list[str], list[dict], dict[str, np.ndarray]]:
+    chunks, postings = [], {}
+    for statute, segment in segments:
+        for chunk in segment["chunks"]:
+            doc = len(chunks)
+            chunks.append({
+                "code": statute.code,
+                "article": chunk["article"],
+                "title": chunk["title"],
+                "text": chunk["text"],
+                "categories": list(statute.categories),
+                "length": chunk["length"],
+            })
+            for term, tf in chunk["terms"].items():
+                postings.setdefault(term, []).append((doc, tf))
+    n_docs = len(chunks)
+    lengths = np.array([c.pop("length") for c in chunks], dtype=np.float32)
+    avgdl = float(lengths.mean()) if n_docs else 0.0
+    terms = sorted(postings)
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    docs, weights = [], []
+    for row, term in enumerate(terms):
+        plist = postings[term]
+        idf = np.log1p((n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+        d = np.fromiter((p[0] for p in plist), dtype=np.int32, count=len(plist))
+        tf = np.fromiter((p[1] for p in plist), dtype=np.float32, count=len(plist))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[d] / avgdl)
+        docs.append(d)
+        weights.append((idf * tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32))
+        indptr[row + 1] = indptr[row] + len(plist)
+    arrays = {
+        "indptr": indptr,
+        "docs": np.concatenate(docs) if docs else np.empty(0, np.int32),
+        "weights": np.concatenate(weights) if weights else np.empty(0, np.float32),
+    }
+    return terms, chunks, arrays
+
+
+def _fit_dense(chunks: Sequence[dict], path: Path) -> Optional[np.ndarray]:
+    # LSA (TF-IDF + TruncatedSVD) по тем же токенам: ловит синонимию, которую
+    # не видит BM25. Строится из сегментов, корпус заново не читается.
+    import joblib
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    # На вход — уже токенизированный текст: в joblib не попадает ссылка на tokenize
+    tfidf = TfidfVectorizer(analyzer=str.split, sublinear_tf=True)
+    X = tfidf.fit_transform([" ".join(tokenize(f"{c['title']}\n{c['text']}")) for c in chunks])
+    dim = min(DENSE_DIM, X.shape[0] - 1, X.shape[1] - 1)
+    if dim < 2:
+        return None
+    svd = TruncatedSVD(n_components=dim, random_state=0)
+    vectors = svd.fit_transform(X).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    joblib.dump((tfidf, svd), path)
+    return vectors
+
+
+def latest_version(models_dir: Path = MODELS_DIR) -> Optional[str]:
+    try:
+        return (models_dir / LATEST).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+
+
+def build_index(
+    dense: Optional[bool] = None,
+    kb_dir: Path = KB_DIR,
+    models_dir: Path = MODELS_DIR,
+) -> tuple[str, list[str]]:
+    # Инкрементальная сборка: разбираются только изменившиеся файлы, затем из
+    # сегментов собирается новая версия индекса. dense=None — как в прошлой версии.
+    # -> (версия, изменившиеся файлы)
+    statutes = read_manifest(kb_dir / MANIFEST_PATH.name)
+    segments, changed = [], []
+    for statute in statutes:
+        segment, was_changed = update_segment(statute, kb_dir, models_dir)
+        segments.append((statute, segment))
+        if was_changed:
+            changed.append(statute.file)
+
+    previous = latest_version(models_dir)
+    if dense is None:
+        dense = bool(previous) and (models_dir / previous / "dense.npy").exists()
+    version = hashlib.sha256(json.dumps(
+        [TOKENIZER_VERSION, BM25_K1, BM25_B, dense,
+         [(s.file, s.code, s.categories, seg["sha256"]) for s, seg in segments]],
+        ensure_ascii=False,
+    ).encode("utf-8")).hexdigest()[:16]
+    if version == previous and (models_dir / version / "meta.json").exists():
+        return version, changed
+
+    out = models_dir / version
+    shutil.rmtree(out, ignore_errors=True)
+    out.mkdir(parents=True)
+    terms, chunks, arrays = _bm25(segments)
+    for name, array in arrays.items():
+        np.save(out / f"{name}.npy", array)
+    if dense and chunks:
+        vectors = _fit_dense(chunks, out / "dense.joblib")
+        if vectors is not None:
+            np.save(out / "dense.npy", vectors)
+    (out / "terms.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+    (out / "chunks.json").write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+    (out / "meta.json").write_text(json.dumps({
+        "version": version,
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "documents": len(chunks),
+        "terms": len(terms),
+        "files": [s.file for s in statutes],
+    }, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    tmp = models_dir / f"{LATEST}.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, models_dir / LATEST)
+    # Предыдущую версию оставляем: её ещё могут читать через mmap другие процессы
+    for stale in models_dir.iterdir():
+        if stale.is_dir() and stale.name not in (SEGMENTS, version, previous):
+            shutil.rmtree(stale, ignore_errors=True)
+    return version, changed
+
+
+# =========================
+# Поиск
+# =========================
+@dataclass(frozen=True)
+class Article:
+    code: str
+    article: str
+    title: str
+    text: str
+    score: float
+
+    @property
+    def citation(self) -> str:
+        return f"ст. {self.article} {self.code}"
+
+
+@dataclass
+class KbIndex:
+    version: str
+    terms: dict[str, int]
+    chunks: list[dict]
+    indptr: np.ndarray
+    docs: np.ndarray
+    weights: np.ndarray
+    dense: Optional[np.ndarray]  # L2-нормированные строки, mmap
+    path: Path
+    _masks: dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+    _encoder: object = field(default=None, repr=False)
+
+    def category_mask(self, category: str) -> np.ndarray:
+        mask = self._masks.get(category)
+        if mask is None:
+            mask = self._masks[category] = np.fromiter(
+                (category in c["categories"] for c in self.chunks), dtype=bool, count=len(self.chunks)
+            )
+        return mask
+
+    def bm25(self, query_terms: Sequence[str]) -> np.ndarray:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(query_terms):
+            row = self.terms.get(term)
+            if row is not None:
+                lo, hi = self.indptr[row], self.indptr[row + 1]
+                # в строке термина каждый документ встречается один раз
+                scores[self.docs[lo:hi]] += self.weights[lo:hi]
+        return scores
+
+    def cosine(self, text: str) -> np.ndarray:
+        if self._encoder is None:
+            import joblib
+            self._encoder = joblib.load(self.path / "dense.joblib")
+        tfidf, svd = self._encoder
+        query = svd.transform(tfidf.transform([" ".join(tokenize(text))])).astype(np.float32)[0]
+        norm = np.linalg.norm(query)
+        if not norm:
+            return np.zeros(len(self.chunks), dtype=np.float32)
+        return self.dense @ (query / norm)
+
+
+_loaded: dict[Path, tuple[int, KbIndex]] = {}
+_load_lock = threading.Lock()
+
+
+def _open(path: Path) -> KbIndex:
+    dense = path / "dense.npy"
+    return KbIndex(
+        version=path.name,
+        terms={t: i for i, t in enumerate(json.loads((path / "terms.json").read_text(encoding="utf-8")))},
+        chunks=json.loads((path / "chunks.json").read_text(encoding="utf-8")),
+        indptr=np.load(path / "indptr.npy", mmap_mode="r"),
+        docs=np.load(path / "docs.npy", mmap_mode="r"),
+        weights=np.load(path / "weights.npy", mmap_mode="r"),
+        dense=np.load(dense, mmap_mode="r") if dense.exists() else None,
+        path=path,
+    )
+
+
+def load_index(models_dir: Path = MODELS_DIR) -> Optional[KbIndex]:
+    # Кеш на процесс; индекс переоткрывается, когда сборка переключила LATEST.
+    # None — индекс ещё не собран (python -m ml.kb build).
+    try:
+        mtime = os.stat(models_dir / LATEST).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get(models_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _load_lock:
+        cached = _loaded.get(models_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        index = _open(models_dir / latest_version(models_dir))
+        _loaded[models_dir] = (mtime, index)
+        return index
+
+
+@metrics.timed("kb.search")
+def search(
+    description: str,
+    category: Optional[str] = None,
+    k: int = 5,
+    index: Optional[KbIndex] = None,
+) -> list[Article]:
+    # Топ-k статей по описанию дела. Нормы, не отнесённые к категории, не выдаются;
+    # несколько фрагментов одной статьи сворачиваются в лучший.
+    index = index or load_index()
+    if index is None or not index.chunks or not description:
+        return []
+    scores = index.bm25(tokenize(description))
+    if scores.max() > 0:
+        scores /= scores.max()
+    if index.dense is not None:
+        scores += DENSE_WEIGHT * np.maximum(index.cosine(description), 0)
+    if category:
+        scores[~index.category_mask(category)] = 0
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k * 4:
+        candidates = candidates[np.argpartition(-scores[candidates], k * 4)[: k * 4]]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    found: dict[tuple[str, str], Article] = {}
+    for doc in order:
+        if len(found) >= k:
+            break
+        chunk = index.chunks[doc]
+        key = (chunk["code"], chunk["article"])
+        if key not in found:
+            found[key] = Article(
+                chunk["code"], chunk["article"], chunk["title"], chunk["text"], float(scores[doc])
+            )
+    return list(found.values())
+
+
+def main(argv: list[str]) -> None:
+    # python -m ml.kb build [--dense|--no-dense]
+    # python -m ml.kb search CATEGORY|- описание дела
+    if argv[:1] == ["build"]:
+        dense = True if "--dense" in argv else False if "--no-dense" in argv else None
+        version, changed = build_index(dense=dense)
+        print(f"index {version}; reparsed: {', '.join(changed) or 'nothing'}")
+    elif argv[:1] == ["search"] and len(argv) >= 3:
+        category = None if argv[1] == "-" else argv[1]
+        for article in search(" ".join(argv[2:]), category):
+            print(f"{article.score:.3f}  {article.citation}. {article.title}")
+    else:
+        raise SystemExit("usage: python -m ml.kb build [--dense|--no-dense] | search CATEGORY|- TEXT")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,202 @@
+# ml/nlp.py
+from __future__ import annotations
+from typing import Sequence
+import json
+import re
+import sqlite3
+import sys
+
+from ml.features import chunked, description_sha, encode_vector
+from ml.p_success import PSuccessModel, load_model
+from utils.db import get_pool
+from utils.evidence import get_registry
+
+CHUNK_SIZE = 1000
+MAX_FACTS = 10
+
+# Ключевые слова (основы), по которым предлагаем отметить доказательство.
+# Предложения попадают в auto_flags_json и подтверждаются пользователем.
+AUTO_FLAG_KEYWORDS = {
+    "purchase_doc": ("чек", "квитанц", "договор купли", "заказ"),
+    "claim": ("претенз",),
+    "pretrial_claim": ("претенз", "досудебн"),
+    "claim_send_proof": ("отправил", "отправила", "почтой", "заказным", "опись вложения"),
+    "return_proof": ("вернул товар", "вернула товар", "возвратил", "сдал товар", "сдала товар"),
+    "photos_before": ("фото", "видео"),
+    "issue_photos": ("фото", "видео"),
+    "incident_media": ("фото", "видео"),
+    "chat_with_seller": ("переписк", "чат", "whatsapp", "telegram", "мессенджер"),
+    "chat_with_uk": ("переписк", "обращени", "письм"),
+    "chat_with_insurer": ("переписк", "страхов"),
+    "seller_reply": ("ответ продавца", "отказал", "отказали"),
+    "witnesses": ("свидетел", "соседи", "видели"),
+    "utility_contracts": ("квитанц", "счет", "договор управлени"),
+    "payment_docs": ("оплатил", "оплатила", "выписк", "чек"),
+    "ownership_or_rent": ("собственност", "найм", "аренд"),
+    "compensation_calc": ("расчет",),
+    "inspection_acts": ("акт",),
+    "med_docs": ("справк", "диагноз", "выписк"),
+    "er_certificate": ("травмпункт", "больниц", "скорая"),
+    "treatment_payments": ("лечени", "лекарств", "аптек"),
+    "passport": ("паспорт",),
+    "sick_leave": ("больничн",),
+    "forensic_exam": ("экспертиз",),
+}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+_ENTITY_PATTERNS = {
+    "MONEY": re.compile(r"\d[\d\s]*(?:[.,]\d{1,2})?\s*(?:руб(?:\.|лей|ля|ль)?|₽|р\.)", re.I),
+    "DATE": re.compile(
+        r"\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b"
+        r"|\b\d{1,2}\s+(?:января|февраля|марта|апреля|мая|июня|июля|августа"
+        r"|сентября|октября|ноября|декабря)(?:\s+\d{4})?",
+        re.I,
+    ),
+    "ORG": re.compile(r"\b(?:ООО|АО|ПАО|ЗАО|ОАО|ИП|УК|ТСЖ)\s*(?:«[^»]{1,80}»|\"[^\"]{1,80}\")"),
+    "PHONE": re.compile(r"(?:\+7|\b8)[\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2}\b"),
+    "EMAIL": re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b"),
+}
+
+
+def _normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def extract_facts(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s.strip()][:MAX_FACTS]
+
+
+def extract_entities(text: str) -> list[dict]:
+    return [
+        {"type": kind, "text": m.group(0).strip(), "start": m.start()}
+        for kind, pattern in _ENTITY_PATTERNS.items()
+        for m in pattern.finditer(text or "")
+    ]
+
+
+def suggest_flags(text: str, category: str | None, doc_type: str | None) -> dict[str, int]:
+    # Только доказательства из схемы выбранного типа документа
+    schema = get_registry().doc_type(category, doc_type)
+    if schema is None:
+        return {}
+    norm = _normalize(text or "")
+    return {
+        evidence_id: 1
+        for evidence_id in schema.items
+        if any(k in norm for k in AUTO_FLAG_KEYWORDS.get(evidence_id, ()))
+    }
+
+
+def pending_case_ids(conn: sqlite3.Connection, version: str | None) -> list[int]:
+    # Новые дела, дела с изменённым описанием (sha сброшен триггером) и дела,
+    # проанализированные другой версией признаков
+    return [r[0] for r in conn.execute(
+        """
+        SELECT c.id FROM Cases c
+        LEFT JOIN NlpAnalysis n ON n.case_id = c.id
+        WHERE n.case_id IS NULL
+           OR n.description_sha IS NULL
+           OR n.text_features_version IS NOT ?
+        ORDER BY c.id
+        """,
+        (version,),
+    )]
+
+
+def analyze_cases(
+    conn: sqlite3.Connection, case_ids: Sequence[int], model: PSuccessModel | None
+) -> int:
+    version = model.version if model else None
+    marks = ",".join("?" * len(case_ids))
+    cases = [dict(r) for r in conn.execute(
+        f"SELECT id, category, doc_type, description FROM Cases WHERE id IN ({marks})",
+        list(case_ids),
+    )]
+    known = {
+        r[0]: (r[1], r[2]) for r in conn.execute(
+            f"""
+            SELECT case_id, description_sha, text_features_version FROM NlpAnalysis
+            WHERE case_id IN ({marks})
+            """,
+            list(case_ids),
+        )
+    }
+    # Триггер trg_cases_nlp_stale сбрасывает sha при изменении описания,
+    # так что совпадение sha и версии означает, что дело уже посчитано
+    todo = []
+    for case in cases:
+        case["sha"] = description_sha(case["description"])
+        if known.get(case["id"]) != (case["sha"], version):
+            todo.append(case)
+    if not todo:
+        return 0
+
+    vectors = model.tfidf.transform([c["description"] or "" for c in todo]) if model else None
+    rows = []
+    for k, case in enumerate(todo):
+        text = case["description"] or ""
+        blob = None
+        if vectors is not None:
+            lo, hi = vectors.indptr[k], vectors.indptr[k + 1]
+            blob = encode_vector(vectors.indices[lo:hi], vectors.data[lo:hi])
+        rows.append({
+            "case_id": case["id"],
+            "description_sha": case["sha"],
+            "facts_json": json.dumps(extract_facts(text), ensure_ascii=False),
+            "entities_json": json.dumps(extract_entities(text), ensure_ascii=False),
+            "auto_flags_json": json.dumps(
+                suggest_flags(text, case["category"], case["doc_type"]), ensure_ascii=False
+            ),
+            "text_features_version": version,
+            "text_features": blob,
+        })
+    conn.executemany(
+        """
+        INSERT INTO NlpAnalysis (case_id, description_sha, facts_json, entities_json,
+                                 auto_flags_json, text_features_version, text_features,
+                                 updated_at)
+        VALUES (:case_id, :description_sha, :facts_json, :entities_json,
+                :auto_flags_json, :text_features_version, :text_features,
+                datetime('now'))
+        ON CONFLICT(case_id) DO UPDATE SET
+          description_sha = excluded.description_sha,
+          facts_json = excluded.facts_json,
+          entities_json = excluded.entities_json,
+          auto_flags_json = excluded.auto_flags_json,
+          text_features_version = excluded.text_features_version,
+          text_features = excluded.text_features,
+          updated_at = excluded.updated_at
+        """,
+        rows,
+    )
+    return len(rows)
+
+
+def current_model() -> PSuccessModel | None:
+    try:
+        return load_model()
+    except FileNotFoundError:
+        return None  # модели ещё нет — анализ без TF-IDF признаков
+
+
+def run(model: PSuccessModel | None = None) -> int:
+    # Ночной прогон: обрабатывает только изменившиеся дела, пачками по CHUNK_SIZE
+    pool = get_pool()
+    model = model or current_model()
+    with pool.connection() as conn:
+        ids = pending_case_ids(conn, model.version if model else None)
+    processed = 0
+    for chunk in chunked(ids, CHUNK_SIZE):
+        with pool.transaction() as conn:
+            processed += analyze_cases(conn, chunk, model)
+    return processed
+
+
+def main(argv: list[str]) -> None:
+    # python -m ml.nlp
+    processed = run()
+    print(f"analyzed {processed} cases")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,194 @@
+# ml/p_success.py
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Mapping, Sequence
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from ml.features import (
+    cached_text_features, chunked, fetch_cases, structured_features, text_matrix, texts,
+)
+from utils.db import get_pool
+
+ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = Path(os.environ.get("APP_MODELS_DIR") or ROOT / "models") / "p_success"
+LATEST = "LATEST"  # файл с версией актуальной модели
+
+SCORE_CHUNK = 5000
+
+
+@dataclass
+class PSuccessModel:
+    # TF-IDF по Cases.description + флаги доказательств -> логистическая регрессия
+    version: str
+    tfidf: TfidfVectorizer
+    dictvec: DictVectorizer
+    clf: LogisticRegression
+
+    def transform(self, cases: Sequence[dict], text_cache: dict | None = None) -> sparse.csr_matrix:
+        # text_cache — готовые TF-IDF векторы из NlpAnalysis (см. ml/nlp.py)
+        return sparse.hstack([
+            text_matrix(self.tfidf, cases, text_cache or {}),
+            self.dictvec.transform([structured_features(c) for c in cases]),
+        ], format="csr")
+
+    def predict(self, cases: Sequence[dict], text_cache: dict | None = None) -> np.ndarray:
+        if not cases:
+            return np.empty(0)
+        return self.clf.predict_proba(self.transform(cases, text_cache))[:, 1]
+
+
+# =========================
+# Обучение
+# =========================
+def read_labels(path: Path) -> dict[int, int]:
+    # CSV с колонками case_id,won (1 — иск удовлетворён, 0 — нет)
+    with open(path, encoding="utf-8", newline="") as f:
+        return {int(r["case_id"]): int(r["won"]) for r in csv.DictReader(f)}
+
+
+def train(conn: sqlite3.Connection, labels: Mapping[int, int]) -> tuple[PSuccessModel, dict]:
+    cases = fetch_cases(conn, list(labels))
+    y = np.array([labels[c["id"]] for c in cases])
+    if len(set(y)) < 2:
+        raise ValueError("для обучения нужны дела обоих исходов (won = 0 и 1)")
+
+    version = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    model = PSuccessModel(
+        version=version,
+        tfidf=TfidfVectorizer(
+            lowercase=True, ngram_range=(1, 2), min_df=2, max_features=50_000,
+            sublinear_tf=True, dtype=np.float32,
+        ),
+        dictvec=DictVectorizer(dtype=np.float32),
+        clf=LogisticRegression(C=1.0, solver="liblinear", class_weight="balanced"),
+    )
+
+    metrics = {"n_samples": len(cases), "positive_share": float(y.mean())}
+    if len(cases) >= 50 and min(np.bincount(y)) >= 5:
+        # отложенная выборка только для отчёта; финальная модель — на всех данных
+        train_idx, test_idx = train_test_split(
+            np.arange(len(cases)), test_size=0.2, stratify=y, random_state=0
+        )
+        holdout = _fit(model, [cases[i] for i in train_idx], y[train_idx])
+        metrics["holdout_auc"] = float(roc_auc_score(
+            y[test_idx], holdout.predict([cases[i] for i in test_idx])
+        ))
+    _fit(model, cases, y)
+    return model, metrics
+
+
+def _fit(model: PSuccessModel, cases: Sequence[dict], y: np.ndarray) -> PSuccessModel:
+    X = sparse.hstack([
+        model.tfidf.fit_transform(texts(cases)),
+        model.dictvec.fit_transform([structured_features(c) for c in cases]),
+    ], format="csr")
+    model.clf.fit(X, y)
+    return model
+
+
+def save_model(model: PSuccessModel, metrics: dict, models_dir: Path = MODELS_DIR) -> Path:
+    # Без сжатия: массивы numpy (idf_, coef_) потом открываются через mmap
+    models_dir.mkdir(parents=True, exist_ok=True)
+    path = models_dir / f"{model.version}.joblib"
+    joblib.dump(model, path)
+    (models_dir / f"{model.version}.json").write_text(
+        json.dumps({"version": model.version, **metrics}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    tmp = models_dir / f"{LATEST}.tmp"
+    tmp.write_text(model.version, encoding="utf-8")
+    os.replace(tmp, models_dir / LATEST)
+    return path
+
+
+# =========================
+# Пакетная оценка
+# =========================
+_loaded: dict[Path, PSuccessModel] = {}
+_load_lock = threading.Lock()
+
+
+def latest_version(models_dir: Path = MODELS_DIR) -> str:
+    return (models_dir / LATEST).read_text(encoding="utf-8").strip()
+
+
+def load_model(version: str | None = None, models_dir: Path = MODELS_DIR) -> PSuccessModel:
+    # Модель загружается один раз на процесс и версию
+    path = models_dir / f"{version or latest_version(models_dir)}.joblib"
+    model = _loaded.get(path)
+    if model is None:
+        with _load_lock:
+            model = _loaded.get(path)
+            if model is None:
+                model = _loaded[path] = joblib.load(path, mmap_mode="r")
+    return model
+
+
+def score_batch(
+    case_ids: Sequence[int],
+    conn: sqlite3.Connection | None = None,
+    model: PSuccessModel | None = None,
+) -> int:
+    # Оценивает дела пачками и записывает Cases.p_success одним executemany на пачку.
+    # Без conn каждая пачка — своя короткая транзакция.
+    model = model or load_model()
+    updated = 0
+    for chunk in chunked(list(case_ids), SCORE_CHUNK):
+        if conn is None:
+            with get_pool().transaction() as tx:
+                updated += _score_chunk(tx, chunk, model)
+        else:
+            updated += _score_chunk(conn, chunk, model)
+    return updated
+
+
+def _score_chunk(conn: sqlite3.Connection, case_ids: Sequence[int], model: PSuccessModel) -> int:
+    cases = fetch_cases(conn, case_ids)
+    probs = model.predict(cases, cached_text_features(conn, cases, model.version))
+    conn.executemany(
+        "UPDATE Cases SET p_success = ?, updated_at = datetime('now') WHERE id = ?",
+        ((float(p), c["id"]) for p, c in zip(probs, cases)),
+    )
+    return len(cases)
+
+
+def all_case_ids(conn: sqlite3.Connection) -> list[int]:
+    return [r[0] for r in conn.execute("SELECT id FROM Cases ORDER BY id")]
+
+
+def main(argv: list[str]) -> None:
+    # python -m ml.p_success train labels.csv
+    # python -m ml.p_success score [case_id ...]   (без id — все дела)
+    if not argv or argv[0] not in ("train", "score"):
+        raise SystemExit("usage: python -m ml.p_success train LABELS.csv | score [CASE_ID ...]")
+    pool = get_pool()
+    if argv[0] == "train":
+        with pool.connection() as conn:
+            model, metrics = train(conn, read_labels(Path(argv[1])))
+        path = save_model(model, metrics)
+        print(f"saved {path} {metrics}")
+    else:
+        with pool.connection() as conn:
+            ids = [int(a) for a in argv[1:]] or all_case_ids(conn)
+        updated = score_batch(ids)
+        print(f"scored {updated} cases with model {latest_version()}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,164 @@
+# utils/analytics.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional, Sequence
+import sqlite3
+import sys
+
+import pandas as pd
+
+from utils.db import get_pool
+
+# Отчёты по делам читают CaseStats (миграция 8): строк в ней — комбинации
+# категория × статус × суд × месяц, а не дела, поэтому время отчёта не растёт
+# вместе с Cases. Таблицу поддерживают триггеры trg_case_stats_*.
+
+# Измерение отчёта -> выражение над CaseStats s
+DIMENSIONS = {
+    "category": "s.category",
+    "status": "s.status",
+    "court": "s.court_id",
+    "month": "s.month",
+}
+
+_AGGREGATE = """
+    SELECT coalesce(category, '') AS category, coalesce(status, '') AS status,
+           coalesce(court_id, 0) AS court_id, coalesce(substr(created_at, 1, 7), '') AS month,
+           count(*) AS cases, total(amount) AS amount_sum,
+           total(p_success) AS p_success_sum, count(p_success) AS p_success_n
+    FROM Cases
+    GROUP BY 1, 2, 3, 4
+"""
+
+
+def rebuild_stats(conn: sqlite3.Connection) -> int:
+    # Полный пересчёт из Cases (миграция, после массового импорта с выключенными
+    # триггерами или если check показал расхождение). Выполнять внутри транзакции.
+    conn.execute("DELETE FROM CaseStats")
+    cur = conn.execute(f"INSERT INTO CaseStats {_AGGREGATE}")
+    return cur.rowcount
+
+
+def check_stats(conn: sqlite3.Connection) -> list[tuple]:
+    # Расхождения CaseStats с пересчётом по Cases (полный проход — только для проверки)
+    # -> строки, которые есть только в одной из таблиц. Суммы сравниваются
+    # с округлением: триггеры прибавляют и вычитают REAL, накапливая ошибку ~1e-12.
+    rounded = """category, status, court_id, month, cases, round(amount_sum, 4),
+                 round(p_success_sum, 4), p_success_n"""
+    return conn.execute(f"""
+        WITH fresh AS (SELECT {rounded} FROM ({_AGGREGATE})),
+        stored AS (SELECT {rounded} FROM CaseStats)
+        SELECT 'missing', * FROM (SELECT * FROM fresh EXCEPT SELECT * FROM stored)
+        UNION ALL
+        SELECT 'stale', * FROM (SELECT * FROM stored EXCEPT SELECT * FROM fresh)
+    """).fetchall()
+
+
+def summary(
+    conn: sqlite3.Connection,
+    by: Sequence[str] = ("category", "status"),
+    categories: Sequence[str] = (),
+    statuses: Sequence[str] = (),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> pd.DataFrame:
+    # Сводка в разрезе измерений by (ключи DIMENSIONS); since/until — месяцы 'YYYY-MM'
+    # включительно. Разрез по суду добавляет его наименование.
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"неизвестные измерения: {unknown}; доступны {list(DIMENSIONS)}")
+    where, params = [], []
+    if categories:
+        where.append(f"s.category IN ({','.join('?' * len(categories))})")
+        params += categories
+    if statuses:
+        where.append(f"s.status IN ({','.join('?' * len(statuses))})")
+        params += statuses
+    if since:
+        where.append("s.month >= ?")
+        params.append(since)
+    if until:
+        where.append("s.month <= ?")
+        params.append(until)
+
+    columns = [f"{DIMENSIONS[d]} AS {d}" for d in by]
+    group = [DIMENSIONS[d] for d in by]
+    join = ""
+    if "court" in by:
+        columns.append("c.name AS court_name")
+        group.append("c.name")
+        join = "LEFT JOIN Courts c ON c.id = s.court_id"
+    select = ", ".join([*columns, """
+        sum(s.cases) AS cases,
+        sum(s.amount_sum) AS amount_sum,
+        sum(s.amount_sum) / sum(s.cases) AS amount_avg,
+        sum(s.p_success_sum) / nullif(sum(s.p_success_n), 0) AS p_success_avg
+    """])
+    sql = f"""
+        SELECT {select}
+        FROM CaseStats s {join}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        {'GROUP BY ' + ', '.join(group) if group else ''}
+        {'ORDER BY ' + ', '.join(group) if group else ''}
+    """
+    df = pd.read_sql_query(sql, conn, params=params)
+    if "court" in by:
+        df["court"] = df["court"].astype("Int64").mask(df["court"] == 0)  # 0 -> суд не выбран
+    return df
+
+
+def months(conn: sqlite3.Connection) -> list[str]:
+    return [r[0] for r in conn.execute("SELECT DISTINCT month FROM CaseStats WHERE month <> '' ORDER BY 1")]
+
+
+def export(df: pd.DataFrame, path: Path | str) -> Path:
+    # Формат — по расширению: .parquet (pyarrow) или .csv (UTF-8 с BOM — открывается в Excel)
+    path = Path(path)
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    elif path.suffix == ".csv":
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    else:
+        raise ValueError(f"неизвестный формат выгрузки: {path.suffix} (.parquet или .csv)")
+    return path
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.analytics summary [--by category,status,court,month] [--out report.parquet|.csv]
+    # python -m utils.analytics check | rebuild
+    usage = (
+        "usage: python -m utils.analytics summary [--by DIM,...] [--since YYYY-MM] [--until YYYY-MM]"
+        " [--out FILE.parquet|FILE.csv] | check | rebuild"
+    )
+    if not argv or argv[0] not in ("summary", "check", "rebuild"):
+        raise SystemExit(usage)
+    pool = get_pool()
+    if argv[0] == "rebuild":
+        with pool.transaction() as conn:
+            rows = rebuild_stats(conn)
+        print(f"rebuilt {rows} aggregate rows")
+        return
+    if argv[0] == "check":
+        with pool.connection() as conn:
+            diff = check_stats(conn)
+        for row in diff:
+            print(*row, sep="\t")
+        print(f"{len(diff)} mismatched rows")
+        if diff:
+            raise SystemExit(1)
+        return
+
+    opts = dict(zip(argv[1::2], argv[2::2]))
+    if set(opts) - {"--by", "--since", "--until", "--out"}:
+        raise SystemExit(usage)
+    by = [d for d in opts.get("--by", "category,status").split(",") if d]
+    with pool.connection() as conn:
+        df = summary(conn, by, since=opts.get("--since"), until=opts.get("--until"))
+    if "--out" in opts:
+        print(export(df, opts["--out"]))
+    else:
+        print(df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,321 @@
+# utils/bulk.py
+from __future__ import annotations
+from datetime import date
+from itertools import islice
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, Sequence
+import csv
+import io
+import sqlite3
+import sys
+import time
+
+import orjson
+from pydantic import (
+    BaseModel, ConfigDict, ValidationError, ValidationInfo, field_validator, model_validator,
+)
+from pydantic_core import PydanticCustomError
+
+from utils import intake, metrics, repository, validation
+from utils.db import DB_PATH, get_pool
+from utils.evidence import EvidenceRegistry, get_registry
+
+# Массовый импорт и выгрузка анкет. Запись — одно дело в плоском виде (FIELDS);
+# в CSV доказательства перечисляются через «;». Файл читается потоково, дела
+# пишутся пачками по CHUNK_SIZE в отдельных транзакциях, поэтому память не растёт
+# с размером файла. Отклонённые строки — в отчёт об ошибках (JSONL: номер строки,
+# ошибки по полям с теми же текстами, что в форме, и исходная запись).
+
+CHUNK_SIZE = 1000
+
+FIELDS = (
+    "fio", "email", "phone", "region", "city", "address",
+    "court_id", "court_name_override", "court_address_override",
+    "opponent_name", "opponent_address", "amount", "event_date", "description",
+    "category", "doc_type", "evidence",
+)
+# Колонки выгрузки, которых нет в анкете: при импорте пропускаются,
+# поэтому выгрузку можно загрузить обратно
+EXPORT_ONLY = ("id", "status", "created_at")
+
+# =========================
+# Запись анкеты (pydantic): типы и разбор полей; правила — utils/validation.py
+# =========================
+class CaseRecord(BaseModel):
+    # Контекст model_validate: {"rules": validation.Context}
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    fio: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    region: Optional[str] = None
+    city: Optional[str] = None
+    address: Optional[str] = None
+    court_id: Optional[int] = None
+    court_name_override: Optional[str] = None
+    court_address_override: Optional[str] = None
+    opponent_name: Optional[str] = None
+    opponent_address: Optional[str] = None
+    amount: Optional[float] = None
+    event_date: Optional[date] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    doc_type: Optional[str] = None
+    evidence: frozenset[str] = frozenset()
+
+    @field_validator(*(f for f in FIELDS if f not in ("amount", "event_date", "evidence")), mode="before")
+    @classmethod
+    def _blank_is_none(cls, value):
+        # Пустая ячейка CSV — то же, что незаполненное поле формы
+        return None if isinstance(value, str) and not value.strip() else value
+
+    @field_validator("amount", mode="before")
+    @classmethod
+    def _amount(cls, value):
+        # Нечисловая сумма — как незаполненная: правило amount скажет, что не так
+        try:
+            return float(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    @field_validator("event_date", mode="before")
+    @classmethod
+    def _event_date(cls, value):
+        if value is None or isinstance(value, date) or not str(value).strip():
+            return value or None
+        try:
+            return date.fromisoformat(str(value).strip())
+        except ValueError:
+            raise PydanticCustomError("form", "Дата события — в формате ГГГГ-ММ-ДД.") from None
+
+    @field_validator("evidence", mode="before")
+    @classmethod
+    def _evidence(cls, value):
+        # Список id, строка «id1;id2» или {id: 0/1}
+        return validation.evidence_ids(value)
+
+    @model_validator(mode="after")
+    def _form_rules(self, info: ValidationInfo) -> "CaseRecord":
+        # Правила формы — все ошибки сразу; выполняются, когда поля разобраны
+        errors = validation.validate(self.model_dump(), (info.context or {}).get("rules"))
+        if errors:
+            raise PydanticCustomError(
+                "form_errors", "ошибок в анкете: {count}", {"count": len(errors), "errors": errors}
+            )
+        return self
+
+    def payloads(self, registry: EvidenceRegistry) -> tuple[dict, dict, dict]:
+        # -> (Users, Cases, отметки доказательств) — как при сохранении формы
+        users_payload = {
+            "fio": self.fio,
+            "resident_region": self.region,
+            "resident_city": self.city,
+            "resident_address": self.address,
+            "email": self.email,
+            "phone": self.phone,
+        }
+        cases_payload = {
+            "court_id": self.court_id,
+            "court_name_override": self.court_name_override,
+            "court_address_override": self.court_address_override,
+            "opponent_name": self.opponent_name,
+            "opponent_address": self.opponent_address,
+            "amount": self.amount,
+            "event_date": self.event_date.isoformat(),
+            "description": self.description,
+            "status": "draft",
+            "category": self.category,
+            "doc_type": self.doc_type,
+        }
+        schema = registry.doc_type(self.category, self.doc_type)
+        flags = {item_id: int(item_id in self.evidence) for item_id in schema.items}
+        return users_payload, cases_payload, flags
+
+
+def errors_of(exc: ValidationError) -> dict[str, str]:
+    # ValidationError -> {поле: сообщение}
+    errors: dict[str, str] = {}
+    for err in exc.errors(include_url=False):
+        if err["type"] == "form_errors":
+            errors.update(err["ctx"]["errors"])
+        elif err["type"] == "extra_forbidden":
+            errors[str(err["loc"][0])] = "Неизвестное поле."
+        else:
+            errors[".".join(str(p) for p in err["loc"]) or "record"] = err["msg"]
+    return errors
+
+
+# =========================
+# Чтение
+# =========================
+def read_records(path: Path) -> Iterator[tuple[int, object]]:
+    # -> (номер строки файла, запись); JSONL (.jsonl/.ndjson) или CSV с заголовком.
+    # Битая строка JSONL отдаётся как исключение, чтобы попасть в отчёт, а не прервать импорт.
+    if path.suffix.lower() == ".csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        return
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, orjson.loads(line)
+            except orjson.JSONDecodeError as exc:
+                yield line_no, exc
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+# =========================
+# Импорт
+# =========================
+def import_chunk(
+    conn: sqlite3.Connection, records: Sequence[tuple[int, CaseRecord]], registry: EvidenceRegistry
+) -> tuple[list[int], list[tuple[int, dict[str, str]]]]:
+    # Выполнять внутри транзакции. Каждое дело — в своей точке сохранения: ошибка
+    # БД отклоняет только эту запись. -> (id дел, [(строка, ошибки)])
+    case_ids = []
+    rejected = []
+    for line_no, record in records:
+        conn.execute("SAVEPOINT bulk_case")
+        try:
+            case_ids.append(intake.store_case(conn, *record.payloads(registry)))
+        except sqlite3.DatabaseError as exc:
+            conn.execute("ROLLBACK TO bulk_case")
+            rejected.append((line_no, {"db": str(exc)}))
+        conn.execute("RELEASE bulk_case")
+    # Сроки и задачи анализа — пачкой на всю порцию
+    intake.finish(conn, case_ids)
+    return case_ids, rejected
+
+
+def import_file(
+    path: Path | str,
+    errors_path: Path | str | None = None,
+    db_path: Path | str = DB_PATH,
+    chunk_size: int = CHUNK_SIZE,
+    today: Optional[date] = None,
+) -> dict:
+    # -> {"read", "imported", "rejected", "seconds"}
+    path = Path(path)
+    errors_path = Path(errors_path) if errors_path else path.with_name(f"{path.stem}.errors.jsonl")
+    pool = get_pool(db_path)
+    registry = get_registry()
+    with pool.connection() as conn:
+        courts = {r[0] for r in conn.execute("SELECT id FROM Courts")}
+    context = {"rules": validation.make_context(registry, today, courts)}
+    totals = {"read": 0, "imported": 0, "rejected": 0}
+    started = time.perf_counter()
+    report: Optional[IO[bytes]] = None
+
+    def reject(line_no: int, errors: dict[str, str], raw: object) -> None:
+        nonlocal report
+        if report is None:
+            report = open(errors_path, "wb")
+        report.write(orjson.dumps({"line": line_no, "errors": errors, "record": raw}, default=str))
+        report.write(b"\n")
+        totals["rejected"] += 1
+
+    try:
+        for chunk in _chunks(read_records(path), chunk_size):
+            valid = []
+            raw_by_line = {}
+            for line_no, raw in chunk:
+                totals["read"] += 1
+                if isinstance(raw, Exception):
+                    reject(line_no, {"record": f"некорректный JSON: {raw}"}, None)
+                    continue
+                if not isinstance(raw, dict):
+                    reject(line_no, {"record": "ожидается объект с полями анкеты"}, raw)
+                    continue
+                fields = {k: v for k, v in raw.items() if k not in EXPORT_ONLY}
+                try:
+                    valid.append((line_no, CaseRecord.model_validate(fields, context=context)))
+                    raw_by_line[line_no] = raw
+                except ValidationError as exc:
+                    reject(line_no, errors_of(exc), raw)
+            if not valid:
+                continue
+            with metrics.timer("bulk.import_chunk"), pool.transaction() as conn:
+                case_ids, rejected = import_chunk(conn, valid, registry)
+            totals["imported"] += len(case_ids)
+            for line_no, errors in rejected:
+                reject(line_no, errors, raw_by_line[line_no])
+    finally:
+        if report is not None:
+            report.close()
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    totals["errors_path"] = str(errors_path) if totals["rejected"] else None
+    return totals
+
+
+# =========================
+# Выгрузка
+# =========================
+EXPORT_COLUMNS = EXPORT_ONLY + FIELDS
+
+
+def export_cases(rows: Iterable[sqlite3.Row], out: IO[bytes], fmt: str = "jsonl") -> int:
+    # fmt: jsonl (доказательства — список id) или csv (UTF-8 с BOM, id через «;»)
+    count = 0
+    if fmt == "csv":
+        text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="", write_through=True)
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(row[c] for c in EXPORT_COLUMNS)
+            count += 1
+        text.detach()
+        return count
+    if fmt != "jsonl":
+        raise ValueError(f"неизвестный формат выгрузки: {fmt} (jsonl или csv)")
+    for row in rows:
+        record = {c: row[c] for c in EXPORT_COLUMNS}
+        record["evidence"] = record["evidence"].split(";") if record["evidence"] else []
+        out.write(orjson.dumps(record))
+        out.write(b"\n")
+        count += 1
+    return count
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.bulk import FILE.jsonl|FILE.csv [--errors ERRORS.jsonl] [--chunk 1000]
+    # python -m utils.bulk export FILE.jsonl|FILE.csv [--category CAT] [--status STATUS]
+    usage = (
+        "usage: python -m utils.bulk import FILE.jsonl|FILE.csv [--errors FILE] [--chunk N]"
+        " | export FILE.jsonl|FILE.csv [--category CAT] [--status STATUS]"
+    )
+    if len(argv) < 2 or argv[0] not in ("import", "export"):
+        raise SystemExit(usage)
+    path = Path(argv[1])
+    opts = dict(zip(argv[2::2], argv[3::2]))
+    allowed = {"--errors", "--chunk"} if argv[0] == "import" else {"--category", "--status"}
+    if len(argv) % 2 or set(opts) - allowed:
+        raise SystemExit(usage)
+
+    if argv[0] == "import":
+        totals = import_file(path, opts.get("--errors"), chunk_size=int(opts.get("--chunk", CHUNK_SIZE)))
+        print(
+            f"read {totals['read']}, imported {totals['imported']}, rejected {totals['rejected']}"
+            f" in {totals['seconds']}s"
+        )
+        if totals["errors_path"]:
+            print(f"errors: {totals['errors_path']}")
+        return
+
+    fmt = "csv" if path.suffix.lower() == ".csv" else "jsonl"
+    with get_pool().connection() as conn, open(path, "wb") as out:
+        rows = repository.iter_case_forms(conn, opts.get("--category"), opts.get("--status"))
+        count = export_cases(rows, out, fmt)
+    print(f"exported {count} cases to {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
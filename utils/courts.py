@@ -0,0 +1,198 @@
+# utils/courts.py
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator
+import csv
+import json
+import re
+import sqlite3
+import sys
+
+from utils.db import DB_PATH, get_pool
+
+ROOT = Path(__file__).resolve().parents[1]
+SEED_PATH = ROOT / "kb" / "courts.csv"
+
+COURT_FIELDS = ("name", "court_level", "region", "city", "address", "jurisdiction_notes")
+BATCH_SIZE = 1000
+MIN_QUERY_LEN = 2  # короче — не ищем, чтобы не дёргать индекс на каждую букву
+
+# Веса bm25 для колонок CourtsFts: name, region, city, address
+_RANK = "bm25(CourtsFts, 10.0, 2.0, 4.0, 1.0)"
+_TOKEN_RE = re.compile(r"\w+")
+
+
+# =========================
+# Загрузка справочника
+# =========================
+def read_courts(path: Path) -> Iterator[dict]:
+    # CSV (с заголовком) или JSON-массив объектов с полями COURT_FIELDS
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = json.load(f) if path.suffix.lower() == ".json" else csv.DictReader(f)
+        for row in rows:
+            court = {k: ((row.get(k) or "").strip() or None) for k in COURT_FIELDS}
+            if court["name"]:
+                yield court
+
+
+def load_courts(conn: sqlite3.Connection, courts: Iterable[dict]) -> int:
+    # Upsert по (name, address): id судов, на которые уже ссылаются дела, не меняются
+    sql = """
+        INSERT INTO Courts (name, court_level, region, city, address, jurisdiction_notes)
+        VALUES (:name, :court_level, :region, :city, :address, :jurisdiction_notes)
+        ON CONFLICT(name, address) DO UPDATE SET
+          court_level = excluded.court_level,
+          region = excluded.region,
+          city = excluded.city,
+          jurisdiction_notes = excluded.jurisdiction_notes
+    """
+    total = 0
+    batch = []
+    for court in courts:
+        batch.append(court)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+# =========================
+# Поиск / подсказки
+# =========================
+def _normalize(text: str | None) -> str:
+    return (text or "").lower().replace("ё", "е").strip()
+
+
+def _terms(text: str, prefix: bool) -> list[str]:
+    star = "*" if prefix else ""
+    return [f'"{t}"{star}' for t in _TOKEN_RE.findall(_normalize(text))]
+
+
+def _column_filter(column: str, text: str) -> str | None:
+    terms = _terms(text, prefix=True)
+    return f"{column} : ({' AND '.join(terms)})" if terms else None
+
+
+def _match(conn: sqlite3.Connection, match: str, limit: int) -> list[dict]:
+    rows = conn.execute(
+        f"""
+        SELECT c.id, c.name, c.court_level, c.region, c.city, c.address
+        FROM CourtsFts
+        JOIN Courts c ON c.id = CourtsFts.rowid
+        WHERE CourtsFts MATCH ?
+        ORDER BY {_RANK}
+        LIMIT ?
+        """,
+        (match, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def suggest(
+    conn: sqlite3.Connection,
+    query: str = "",
+    region: str = "",
+    city: str = "",
+    limit: int = 10,
+) -> list[dict]:
+    # Сначала суды города истца, затем региона, затем по всему справочнику
+    query = query if len(_normalize(query)) >= MIN_QUERY_LEN else ""
+    text = " AND ".join(_terms(query, prefix=True))
+    scopes = [s for s in (_column_filter("city", city), _column_filter("region", region)) if s]
+    if text:
+        scopes.append(None)
+
+    found: dict[int, dict] = {}
+    for scope in scopes:
+        match = " AND ".join(x for x in (text, scope) if x)
+        for court in _match(conn, match, limit):
+            found.setdefault(court["id"], court)
+        if len(found) >= limit:
+            break
+    return list(found.values())[:limit]
+
+
+def index_version(db_path: Path | str = DB_PATH) -> int:
+    # Версия справочника (CourtsVersion, растёт по триггерам на Courts) — ключ кешей,
+    # производных от него: загрузка из другого процесса сбрасывает их без перезапуска
+    with get_pool(db_path).connection() as conn:
+        return conn.execute("SELECT version FROM CourtsVersion").fetchone()[0]
+
+
+@lru_cache(maxsize=4096)
+def _search_cached(db_path: str, version: int, query: str, region: str, city: str,
+                   limit: int) -> tuple[dict, ...]:
+    with get_pool(db_path).connection() as conn:
+        return tuple(suggest(conn, query, region, city, limit))
+
+
+def search_courts(
+    query: str = "",
+    region: str = "",
+    city: str = "",
+    limit: int = 10,
+    db_path: Path | str = DB_PATH,
+) -> list[dict]:
+    # Кешируем по нормализованным аргументам: «Москва» и «москва » — один ключ
+    cached = _search_cached(
+        str(db_path), index_version(db_path), _normalize(query), _normalize(region), _normalize(city), limit
+    )
+    return [dict(c) for c in cached]
+
+
+# =========================
+# Суд по уровню и месту (utils/jurisdiction.py)
+# =========================
+_PLACE_PREFIX_RE = re.compile(r"^(г\.|г|город)\s+")
+
+
+def place_key(text: str | None) -> str:
+    # «г. Москва», «Город москва» -> «москва»
+    return _PLACE_PREFIX_RE.sub("", _normalize(text))
+
+
+@lru_cache(maxsize=16)
+def court_index(db_path: str, version: int) -> dict[tuple[str, str, str], int]:
+    # (уровень, 'city' | 'region', место) -> id первого такого суда справочника.
+    # version — index_version(): справочник небольшой, при изменении строится заново
+    index: dict[tuple[str, str, str], int] = {}
+    with get_pool(db_path).connection() as conn:
+        for r in conn.execute("SELECT id, court_level, region, city FROM Courts ORDER BY id"):
+            level = _normalize(r["court_level"])
+            for scope in ("city", "region"):
+                if r[scope]:
+                    index.setdefault((level, scope, place_key(r[scope])), r["id"])
+    return index
+
+
+def find_court(level: str, city: str = "", region: str = "", db_path: Path | str = DB_PATH) -> int | None:
+    # Суд уровня level в городе истца, иначе в его регионе; None — в справочнике нет
+    index = court_index(str(db_path), index_version(db_path))
+    level = _normalize(level)
+    for scope, place in (("city", place_key(city)), ("region", place_key(region))):
+        court_id = index.get((level, scope, place)) if place else None
+        if court_id is not None:
+            return court_id
+    return None
+
+
+def get_court(conn: sqlite3.Connection, court_id: int) -> dict | None:
+    row = conn.execute("SELECT * FROM Courts WHERE id = ?", (court_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.courts [путь к CSV/JSON]  (по умолчанию kb/courts.csv)
+    path = Path(argv[0]) if argv else SEED_PATH
+    with get_pool().transaction() as conn:
+        total = load_courts(conn, read_courts(path))
+    print(f"loaded {total} courts from {path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+# utils/db.py
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+import os
+import queue
+import sqlite3
+import threading
+
+from utils import metrics
+
+ROOT = Path(__file__).resolve().parents[1]
+DB_PATH = Path(os.environ.get("APP_DB_PATH") or ROOT / "db" / "app.sqlite")
+
+# Прагмы каждого соединения (и python -m utils.db_init); busy_timeout — ожидание блокировки
+# вместо мгновенного "database is locked".
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    # Для новой базы — до первой записи (переход в WAL уже пишет заголовок файла);
+    # существующую переводит python -m utils.maintenance run --full-vacuum
+    "PRAGMA auto_vacuum = INCREMENTAL;",
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};",
+)
+
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256  # кеш подготовленных выражений на соединение
+
+
+def connect(db_path: Path | str = DB_PATH) -> sqlite3.Connection:
+    # isolation_level=None: транзакции открываем сами (BEGIN IMMEDIATE),
+    # чтобы не было неявных долгих транзакций sqlite3-модуля.
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=metrics.connection_factory(),  # APP_METRICS=1 -> замер запросов
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений SQLite, безопасный для потоков Streamlit.
+
+    Каждое соединение в каждый момент используется только одним потоком;
+    при исчерпании пула поток ждёт освобождения соединения.
+    """
+
+    def __init__(self, db_path: Path | str = DB_PATH, size: int = POOL_SIZE) -> None:
+        self.db_path = Path(db_path)
+        self.size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        # Писатели одного процесса ждут друг друга здесь, а не в busy_timeout:
+        # обработчик занятости SQLite опрашивает блокировку с паузами до 100 мс,
+        # и при нескольких сессиях отдельная запись могла ждать дольше таймаута.
+        # Между процессами (воркер utils.jobs) по-прежнему действует busy_timeout.
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("пул соединений закрыт")
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return connect(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        # Соединение для чтения (autocommit, без явной транзакции)
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        # Короткая транзакция записи: блокировку на запись берём сразу,
+        # чтобы не получать SQLITE_BUSY при апгрейде read -> write.
+        # Вложенные transaction() в одном потоке не поддерживаются.
+        with self._write_lock, self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools: dict[Path, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Path | str = DB_PATH) -> ConnectionPool:
+    # Один пул на файл БД на процесс
+    key = Path(db_path).resolve()
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key)
+        return pool
@@ -1,12 +1,11 @@
 # utils/db_init.py
 from __future__ import annotations
-from pathlib import Path
 import sqlite3
 
-ROOT = Path(__file__).resolve().parents[1]
-DB_DIR = ROOT / "db"
-DB_PATH = DB_DIR / "app.sqlite"
+from utils.db import DB_PATH, connect
 
+# Базовая схема (PRAGMA user_version = 0). Дальнейшие изменения схемы —
+# только через MIGRATIONS ниже.
 DDL = r"""
 PRAGMA foreign_keys = ON;
 
@@ -38,6 +37,42 @@ CREATE TABLE IF NOT EXISTS Courts (
   address          TEXT,
   jurisdiction_notes TEXT
 );
+CREATE UNIQUE INDEX IF NOT EXISTS idx_courts_name_addr ON Courts(name, address);
+CREATE INDEX IF NOT EXISTS idx_courts_region_city ON Courts(region, city);
+
+-- Полнотекстовый индекс справочника судов (utils/courts.py).
+-- ё -> е заменяем в триггерах, регистр сворачивает токенизатор unicode61.
+CREATE VIRTUAL TABLE IF NOT EXISTS CourtsFts USING fts5(
+  name, region, city, address,
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_courts_fts_ins AFTER INSERT ON Courts
+BEGIN
+  INSERT INTO CourtsFts (rowid, name, region, city, address)
+  VALUES (NEW.id,
+          replace(replace(NEW.name,    'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.region,  'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.city,    'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.address, 'ё', 'е'), 'Ё', 'Е'));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_courts_fts_del AFTER DELETE ON Courts
+BEGIN
+  DELETE FROM CourtsFts WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_courts_fts_upd AFTER UPDATE OF name, region, city, address ON Courts
+BEGIN
+  DELETE FROM CourtsFts WHERE rowid = OLD.id;
+  INSERT INTO CourtsFts (rowid, name, region, city, address)
+  VALUES (NEW.id,
+          replace(replace(NEW.name,    'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.region,  'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.city,    'ё', 'е'), 'Ё', 'Е'),
+          replace(replace(NEW.address, 'ё', 'е'), 'Ё', 'Е'));
+END;
 
 -- =========================
 -- Дела
@@ -149,6 +184,38 @@ CREATE TABLE IF NOT EXISTS Documents (
 CREATE INDEX IF NOT EXISTS idx_docs_case_id ON Documents(case_id);
 CREATE INDEX IF NOT EXISTS idx_docs_type    ON Documents(doc_type);
 
+-- =========================
+-- Файлы (хранилище по содержимому, utils/filestore.py)
+-- =========================
+CREATE TABLE IF NOT EXISTS Blobs (
+  file_path  TEXT PRIMARY KEY,   -- = Documents.file_path
+  ref_count  INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT DEFAULT (datetime('now'))
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_docs_blob_ref_ins
+AFTER INSERT ON Documents WHEN NEW.file_path IS NOT NULL
+BEGIN
+  INSERT INTO Blobs (file_path, ref_count) VALUES (NEW.file_path, 1)
+    ON CONFLICT(file_path) DO UPDATE SET ref_count = ref_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_docs_blob_ref_del
+AFTER DELETE ON Documents WHEN OLD.file_path IS NOT NULL
+BEGIN
+  UPDATE Blobs SET ref_count = ref_count - 1 WHERE file_path = OLD.file_path;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_docs_blob_ref_upd
+AFTER UPDATE OF file_path ON Documents
+WHEN OLD.file_path IS NOT NEW.file_path
+BEGIN
+  UPDATE Blobs SET ref_count = ref_count - 1 WHERE file_path = OLD.file_path;
+  INSERT INTO Blobs (file_path, ref_count)
+    SELECT NEW.file_path, 1 WHERE NEW.file_path IS NOT NULL
+    ON CONFLICT(file_path) DO UPDATE SET ref_count = ref_count + 1;
+END;
+
 -- =========================
 -- Сроки/этапы (Календарь)
 -- =========================
@@ -167,13 +234,602 @@ CREATE TABLE IF NOT EXISTS Deadlines (
 CREATE INDEX IF NOT EXISTS idx_dead_case_due ON Deadlines(case_id, due_date);
 """
 
+# =========================
+# Миграции (PRAGMA user_version)
+# =========================
+# Каждый шаг идемпотентен и выполняется в своей транзакции; после шага
+# user_version = номер шага. Уже применённые шаги не меняем — только добавляем новые.
+
+# Снимок соответствия «категория, id доказательства -> колонка Cases» на момент
+# перехода к CaseEvidence; используется для переноса данных и представления CasesWide.
+LEGACY_EVIDENCE_COLUMNS = (
+    ("return_goods", "purchase_doc", "rg_has_purchase_doc"),
+    ("return_goods", "claim", "rg_has_claim_letter"),
+    ("return_goods", "claim_send_proof", "rg_has_claim_send_proof"),
+    ("return_goods", "return_proof", "rg_has_goods_return_proof"),
+    ("return_goods", "photos_before", "rg_opt_media_product"),
+    ("return_goods", "chat_with_seller", "rg_opt_chat_with_seller"),
+    ("return_goods", "seller_reply", "rg_opt_seller_response"),
+    ("return_goods", "delivery_cost_docs", "rg_opt_delivery_expenses_docs"),
+    ("return_goods", "witnesses", "rg_opt_witnesses"),
+
+    ("housing_utilities", "utility_contracts", "hu_has_bills_contracts"),
+    ("housing_utilities", "payment_docs", "hu_has_payment_docs"),
+    ("housing_utilities", "ownership_or_rent", "hu_has_property_contract"),
+    ("housing_utilities", "pretrial_claim", "hu_has_claim_to_uk"),
+    ("housing_utilities", "claim_send_proof", "hu_has_claim_send_proof"),
+    ("housing_utilities", "compensation_calc", "hu_has_compensation_calc"),
+    ("housing_utilities", "inspection_acts", "hu_opt_inspection_acts"),
+    ("housing_utilities", "issue_photos", "hu_opt_issue_photos"),
+    ("housing_utilities", "chat_with_uk", "hu_opt_chat_with_uk"),
+    ("housing_utilities", "expert_reports", "hu_opt_expert_reports"),
+    ("housing_utilities", "witnesses", "hu_opt_neighbor_witnesses"),
+    ("housing_utilities", "loss_docs", "hu_opt_damage_expense_docs"),
+    ("housing_utilities", "motion_text", "hu_mo_has_motion_body"),
+    ("housing_utilities", "motion_support_docs", "hu_mo_has_support_docs"),
+    ("housing_utilities", "motion_copy_proof", "hu_mo_has_copy_proof"),
+    ("housing_utilities", "utility_contract", "hu_ob_has_service_contract"),
+    ("housing_utilities", "billing_calc", "hu_ob_has_charge_calc"),
+    ("housing_utilities", "acts_done", "hu_ob_has_work_acts"),
+    ("housing_utilities", "claim_answers", "hu_ob_has_claim_answers"),
+    ("housing_utilities", "finance_docs", "hu_ob_has_financial_docs"),
+
+    ("minor_injury", "med_docs", "mi_has_med_docs"),
+    ("minor_injury", "er_certificate", "mi_has_trauma_cert"),
+    ("minor_injury", "causality_proof", "mi_has_causality_proof"),
+    ("minor_injury", "treatment_payments", "mi_has_treatment_receipts"),
+    ("minor_injury", "pretrial_claim", "mi_has_preclaim"),
+    ("minor_injury", "passport", "mi_has_identity_doc"),
+    ("minor_injury", "incident_act", "mi_opt_accident_act"),
+    ("minor_injury", "incident_media", "mi_opt_scene_media"),
+    ("minor_injury", "witnesses", "mi_opt_witnesses"),
+    ("minor_injury", "forensic_exam", "mi_opt_forensic_exam"),
+    ("minor_injury", "chat_with_insurer", "mi_opt_defendant_corresp"),
+    ("minor_injury", "sick_leave", "mi_opt_sick_leave"),
+    ("minor_injury", "income_before", "mi_opt_income_statement"),
+    ("minor_injury", "psych_report", "mi_opt_psych_report"),
+    ("minor_injury", "motion_text", "mi_mo_has_motion_body"),
+    ("minor_injury", "motion_support_docs", "mi_mo_has_support_docs"),
+    ("minor_injury", "motion_copy_proof", "mi_mo_has_copy_proof"),
+    ("minor_injury", "no_causality_acts", "mi_ob_has_no_causality_docs"),
+    ("minor_injury", "good_faith_docs", "mi_ob_has_due_care_docs"),
+    ("minor_injury", "other_med_docs", "mi_ob_has_alt_cause_med"),
+    ("minor_injury", "plaintiff_notifications", "mi_ob_has_claim_notices"),
+    ("minor_injury", "defendant_witnesses", "mi_ob_has_support_witnesses"),
+)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> set[str]:
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _m001_case_evidence(conn: sqlite3.Connection) -> None:
+    # Доказательства по делу — строки (case_id, evidence_id) вместо ~50 колонок Cases
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CaseEvidence (
+          case_id      INTEGER NOT NULL,
+          evidence_id  TEXT    NOT NULL,   -- id из kb/evidence_schema.yaml
+          present      INTEGER NOT NULL CHECK (present IN (0,1)),
+          document_id  INTEGER,            -- загруженный файл (опц.)
+          PRIMARY KEY (case_id, evidence_id),
+          FOREIGN KEY(case_id)     REFERENCES Cases(id)     ON UPDATE CASCADE ON DELETE CASCADE,
+          FOREIGN KEY(document_id) REFERENCES Documents(id) ON UPDATE CASCADE ON DELETE SET NULL
+        ) WITHOUT ROWID
+    """)
+    # Покрывающий индекс для «дела без доказательства X»: case_id берётся из ключа
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_case_evidence_item
+        ON CaseEvidence(evidence_id, present)
+    """)
+
+    legacy = _table_columns(conn, "Cases")
+    for category, evidence_id, column in LEGACY_EVIDENCE_COLUMNS:
+        if column not in legacy:
+            continue
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO CaseEvidence (case_id, evidence_id, present)
+            SELECT id, ?, {column} FROM Cases
+            WHERE category = ? AND {column} IS NOT NULL
+            """,
+            (evidence_id, category),
+        )
+    # Файлы, сохранённые save_case() как Documents.doc_type = 'evidence:<id>'
+    conn.execute("""
+        UPDATE CaseEvidence SET document_id = (
+          SELECT max(d.id) FROM Documents d
+          WHERE d.case_id = CaseEvidence.case_id
+            AND d.doc_type = 'evidence:' || CaseEvidence.evidence_id
+        )
+        WHERE document_id IS NULL
+    """)
+
+
+CASES_DDL = r"""
+CREATE TABLE Cases (
+  id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id            INTEGER,  -- FK -> Users.id
+  court_id           INTEGER,  -- FK -> Courts.id (может быть NULL)
+  category           TEXT,     -- 'return_goods' | 'housing_utilities' | 'minor_injury'
+  doc_type           TEXT,     -- 'claim' | 'motion' | 'objection'
+  description        TEXT,
+  opponent_name      TEXT,
+  opponent_address   TEXT,
+  amount             REAL,
+  event_date         TEXT,     -- ISO 8601
+  p_success          REAL,     -- 0..1
+  status             TEXT,     -- draft|analysis|docs_ready|scheduled
+  created_at         TEXT DEFAULT (datetime('now')),
+  updated_at         TEXT,
+
+  court_name_override   TEXT,
+  court_address_override TEXT,
+
+  FOREIGN KEY(user_id)  REFERENCES Users(id)  ON UPDATE CASCADE ON DELETE SET NULL,
+  FOREIGN KEY(court_id) REFERENCES Courts(id) ON UPDATE CASCADE ON DELETE SET NULL,
+  CHECK (p_success IS NULL OR (p_success >= 0.0 AND p_success <= 1.0)),
+  CHECK (category IS NULL OR category IN ('return_goods','housing_utilities','minor_injury')),
+  CHECK (status   IS NULL OR status   IN ('draft','analysis','docs_ready','scheduled'))
+)
+"""
+
+CASES_BASE_COLUMNS = (
+    "id", "user_id", "court_id", "category", "description",
+    "opponent_name", "opponent_address", "amount", "event_date",
+    "p_success", "status", "created_at", "updated_at",
+    "court_name_override", "court_address_override",
+)
+
+
+def _m002_narrow_cases(conn: sqlite3.Connection) -> None:
+    # Пересборка Cases без колонок-флагов (ALTER TABLE DROP COLUMN не умеет
+    # колонки с CHECK); выполняется при foreign_keys = OFF, см. migrate().
+    if "rg_has_purchase_doc" in _table_columns(conn, "Cases"):
+        conn.execute(CASES_DDL.replace("CREATE TABLE Cases", "CREATE TABLE Cases_new"))
+        cols = ", ".join(CASES_BASE_COLUMNS)
+        conn.execute(f"INSERT INTO Cases_new ({cols}) SELECT {cols} FROM Cases")
+        # Тип документа раньше не сохранялся — восстанавливаем по заполненным флагам
+        for doc_type, marker in (("motion", "_mo_"), ("objection", "_ob_"), ("claim", None)):
+            columns = [
+                c for _, _, c in LEGACY_EVIDENCE_COLUMNS
+                if (marker in c if marker else "_mo_" not in c and "_ob_" not in c)
+            ]
+            conn.execute(
+                f"""
+                UPDATE Cases_new SET doc_type = ?
+                WHERE doc_type IS NULL AND id IN (
+                  SELECT id FROM Cases WHERE {" OR ".join(f"{c} IS NOT NULL" for c in columns)}
+                )
+                """,
+                (doc_type,),
+            )
+        conn.execute("DROP TABLE Cases")
+        conn.execute("ALTER TABLE Cases_new RENAME TO Cases")
+        for sql in (
+            "CREATE INDEX IF NOT EXISTS idx_cases_user     ON Cases(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_cases_court    ON Cases(court_id)",
+            "CREATE INDEX IF NOT EXISTS idx_cases_category ON Cases(category)",
+            "CREATE INDEX IF NOT EXISTS idx_cases_status   ON Cases(status)",
+        ):
+            conn.execute(sql)
+
+    # Представление со старым «широким» набором колонок для совместимости
+    pivot = ",\n".join(
+        f"  (SELECT e.present FROM CaseEvidence e WHERE e.case_id = c.id"
+        f" AND e.evidence_id = '{evidence_id}' AND c.category = '{category}') AS {column}"
+        for category, evidence_id, column in LEGACY_EVIDENCE_COLUMNS
+    )
+    conn.execute("DROP VIEW IF EXISTS CasesWide")
+    conn.execute(f"CREATE VIEW CasesWide AS\nSELECT c.*,\n{pivot}\nFROM Cases c")
+
+
+def _m003_nlp_analysis(conn: sqlite3.Connection) -> None:
+    # NLP-анализ описания дела (ml/nlp.py). description_sha и text_features_version
+    # позволяют пересчитывать только изменившиеся дела.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS NlpAnalysis (
+          case_id               INTEGER PRIMARY KEY,  -- FK -> Cases.id (один к одному)
+          description_sha       TEXT,     -- SHA-256 Cases.description на момент анализа
+          facts_json            TEXT,
+          entities_json         TEXT,
+          auto_flags_json       TEXT,
+          text_features_version TEXT,     -- версия модели p_success (TF-IDF)
+          text_features         BLOB,     -- кеш разреженного TF-IDF вектора
+          nlp_notes             TEXT,
+          updated_at            TEXT DEFAULT (datetime('now')),
+          FOREIGN KEY(case_id) REFERENCES Cases(id) ON UPDATE CASCADE ON DELETE CASCADE
+        )
+    """)
+    # Изменение описания помечает анализ устаревшим
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_cases_nlp_stale
+        AFTER UPDATE OF description ON Cases
+        WHEN OLD.description IS NOT NEW.description
+        BEGIN
+          UPDATE NlpAnalysis SET description_sha = NULL WHERE case_id = NEW.id;
+        END
+    """)
+
+
+def _m004_document_render_key(conn: sqlite3.Connection) -> None:
+    # Сгенерированные документы (utils/docgen.py): хеш полей дела + версия шаблона.
+    # Документ с тем же ключом уже есть — повторно не рендерим.
+    if "render_key" not in _table_columns(conn, "Documents"):
+        conn.execute("ALTER TABLE Documents ADD COLUMN render_key TEXT")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_docs_render_key
+        ON Documents(case_id, render_key) WHERE render_key IS NOT NULL
+    """)
+
+
+def _m005_deadline_rules(conn: sqlite3.Connection) -> None:
+    # Сроки из kb/timeline.yaml (utils/deadlines.py): одно правило — одна строка
+    # на дело, пересчёт идёт через UPSERT по (case_id, source)
+    conn.execute("""
+        DELETE FROM Deadlines
+        WHERE source IS NOT NULL AND id NOT IN (
+          SELECT max(id) FROM Deadlines WHERE source IS NOT NULL GROUP BY case_id, source
+        )
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_dead_case_source
+        ON Deadlines(case_id, source) WHERE source IS NOT NULL
+    """)
+    # Проход «planned -> overdue» читает только незакрытые сроки
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dead_planned_due
+        ON Deadlines(due_date) WHERE status = 'planned'
+    """)
+
+
+def _m006_user_identity(conn: sqlite3.Connection) -> None:
+    # Пользователь определяется по нормализованным email/телефону (utils/users.py):
+    # повторное сохранение дела обновляет существующую строку Users, а не добавляет новую
+    from utils.users import merge_duplicates
+
+    columns = _table_columns(conn, "Users")
+    for column in ("email_key", "phone_key"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE Users ADD COLUMN {column} TEXT")
+    merge_duplicates(conn)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_key
+        ON Users(email_key) WHERE email_key IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone_key
+        ON Users(phone_key) WHERE phone_key IS NOT NULL
+    """)
+
+
+def _m007_jobs(conn: sqlite3.Connection) -> None:
+    # Очередь фоновых задач (utils/jobs.py): анализ дела, генерация документов,
+    # проход по срокам. Задача берётся воркером в аренду (lease_until), при
+    # падении воркера аренда истекает и задача возвращается в очередь.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Jobs (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          kind TEXT NOT NULL,                  -- 'analyze' | 'docgen' | 'deadlines' | 'maintenance'
+          case_id INTEGER,
+          payload TEXT,                        -- JSON-параметры задачи (опц.)
+          status TEXT NOT NULL DEFAULT 'queued',
+          attempts INTEGER NOT NULL DEFAULT 0,
+          max_attempts INTEGER NOT NULL DEFAULT 3,
+          run_after REAL NOT NULL,             -- unix-время, не раньше которого запускать
+          lease_owner TEXT,                    -- воркер 'host:pid', взявший задачу
+          lease_until REAL,                    -- unix-время окончания аренды
+          error TEXT,                          -- последняя ошибка
+          created_at TEXT DEFAULT (datetime('now')),
+          updated_at TEXT DEFAULT (datetime('now')),
+          FOREIGN KEY (case_id) REFERENCES Cases(id) ON DELETE CASCADE,
+          CHECK (status IN ('queued','running','done','failed'))
+        )
+    """)
+    # Выборка готовых задач и поиск просроченных аренд читают только свои строки
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_queued
+        ON Jobs(run_after) WHERE status = 'queued'
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_running
+        ON Jobs(lease_until) WHERE status = 'running'
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_case ON Jobs(case_id)")
+
+
+def _m008_case_stats(conn: sqlite3.Connection) -> None:
+    # Агрегаты для отчётов (utils/analytics.py): число дел и суммы в разрезе
+    # категория × статус × суд × месяц создания. Триггеры на Cases поддерживают их
+    # при каждой вставке/изменении, поэтому отчёт не сканирует Cases.
+    # NULL в измерениях хранится как '' / 0 — иначе первичный ключ не склеит строки.
+    from utils.analytics import rebuild_stats
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CaseStats (
+          category TEXT NOT NULL,
+          status TEXT NOT NULL,
+          court_id INTEGER NOT NULL,      -- 0: суд не выбран
+          month TEXT NOT NULL,            -- 'YYYY-MM' из Cases.created_at
+          cases INTEGER NOT NULL DEFAULT 0,
+          amount_sum REAL NOT NULL DEFAULT 0,
+          p_success_sum REAL NOT NULL DEFAULT 0,
+          p_success_n INTEGER NOT NULL DEFAULT 0,  -- дел с оценкой p_success
+          PRIMARY KEY (category, status, court_id, month)
+        ) WITHOUT ROWID
+    """)
+    add = """
+        INSERT INTO CaseStats (category, status, court_id, month,
+                               cases, amount_sum, p_success_sum, p_success_n)
+        VALUES (coalesce(NEW.category, ''), coalesce(NEW.status, ''),
+                coalesce(NEW.court_id, 0), coalesce(substr(NEW.created_at, 1, 7), ''),
+                1, coalesce(NEW.amount, 0), coalesce(NEW.p_success, 0), NEW.p_success IS NOT NULL)
+        ON CONFLICT(category, status, court_id, month) DO UPDATE SET
+          cases = cases + 1,
+          amount_sum = amount_sum + excluded.amount_sum,
+          p_success_sum = p_success_sum + excluded.p_success_sum,
+          p_success_n = p_success_n + excluded.p_success_n;
+    """
+    key = """
+        category = coalesce(OLD.category, '') AND status = coalesce(OLD.status, '')
+        AND court_id = coalesce(OLD.court_id, 0) AND month = coalesce(substr(OLD.created_at, 1, 7), '')
+    """
+    sub = f"""
+        UPDATE CaseStats SET
+          cases = cases - 1,
+          amount_sum = amount_sum - coalesce(OLD.amount, 0),
+          p_success_sum = p_success_sum - coalesce(OLD.p_success, 0),
+          p_success_n = p_success_n - (OLD.p_success IS NOT NULL)
+        WHERE {key};
+        DELETE FROM CaseStats WHERE cases <= 0 AND {key};
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_case_stats_ins AFTER INSERT ON Cases BEGIN {add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_case_stats_del AFTER DELETE ON Cases BEGIN {sub} END")
+    # Меняется только updated_at (например, повторная оценка с тем же p_success) — триггер не срабатывает
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_case_stats_upd
+        AFTER UPDATE OF category, status, court_id, amount, p_success, created_at ON Cases
+        WHEN OLD.category IS NOT NEW.category OR OLD.status IS NOT NEW.status
+          OR OLD.court_id IS NOT NEW.court_id OR OLD.amount IS NOT NEW.amount
+          OR OLD.p_success IS NOT NEW.p_success OR OLD.created_at IS NOT NEW.created_at
+        BEGIN {sub} {add} END
+    """)
+    rebuild_stats(conn)
+
+
+def _m009_documents_case_type(conn: sqlite3.Connection) -> None:
+    # Поиск файла доказательства при сохранении дела (repository.insert_case_evidence):
+    # WHERE case_id = ? AND doc_type = ?. Без статистики планировщик выбирал
+    # idx_docs_type и перебирал все файлы этого доказательства по всем делам.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_case_type ON Documents(case_id, doc_type)")
+
+
+def _m010_cases_search(conn: sqlite3.Connection) -> None:
+    # Поиск по делам (utils/search.py). CasesFts индексирует основы слов ответчика и
+    # описания: текст нормализуют fts_name()/fts_text() из utils/text.py (стеммер
+    # Snowball), поэтому «Ромашки» находит «Ромашка». OpponentStats — число дел и сумма
+    # требований по ключу ответчика opponent_key(): повторяющиеся ответчики
+    # читаются по индексу, без прохода по Cases.
+    # Функции регистрирует utils.db.connect(); запись в Cases из соединения без них
+    # (например, консольный sqlite3) завершится ошибкой «no such function».
+    from utils.search import rebuild_index
+    from utils.text import register_functions
+
+    register_functions(conn)  # init_db может получить соединение не из utils.db
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS CasesFts USING fts5(
+          opponent, description,
+          content = '',
+          tokenize = 'unicode61 remove_diacritics 2',
+          detail = column
+        )
+    """)
+    # Число дел с каждым термом — для выбора редких слов запроса (utils/search.py)
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS CasesFtsVocab USING fts5vocab(CasesFts, 'row')")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS OpponentStats (
+          opponent_key TEXT PRIMARY KEY,  -- utils.text.opponent_key(Cases.opponent_name)
+          name TEXT,                      -- наименование из последнего дела
+          cases INTEGER NOT NULL DEFAULT 0,
+          amount_sum REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_opponent_stats_cases ON OpponentStats(cases)")
+    # Дела одного ответчика: WHERE opponent_key(opponent_name) = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_opponent_key ON Cases(opponent_key(opponent_name))")
+
+    fts_add = """
+        INSERT INTO CasesFts (rowid, opponent, description)
+        VALUES (NEW.id, fts_name(NEW.opponent_name), fts_text(NEW.description));
+    """
+    # Таблица без копии текста (content=''): строку удаляет команда 'delete' с теми же
+    # значениями, что были вставлены, — поэтому функции обязаны быть детерминированными
+    fts_sub = """
+        INSERT INTO CasesFts (CasesFts, rowid, opponent, description)
+        VALUES ('delete', OLD.id, fts_name(OLD.opponent_name), fts_text(OLD.description));
+    """
+    stats_add = """
+        INSERT INTO OpponentStats (opponent_key, name, cases, amount_sum)
+        SELECT key, NEW.opponent_name, 1, coalesce(NEW.amount, 0)
+        FROM (SELECT opponent_key(NEW.opponent_name) AS key) WHERE key IS NOT NULL
+        ON CONFLICT(opponent_key) DO UPDATE SET
+          name = excluded.name,
+          cases = cases + 1,
+          amount_sum = amount_sum + excluded.amount_sum;
+    """
+    stats_sub = """
+        UPDATE OpponentStats SET
+          cases = cases - 1,
+          amount_sum = amount_sum - coalesce(OLD.amount, 0)
+        WHERE opponent_key = opponent_key(OLD.opponent_name);
+        DELETE FROM OpponentStats WHERE cases <= 0 AND opponent_key = opponent_key(OLD.opponent_name);
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_cases_search_ins AFTER INSERT ON Cases BEGIN {fts_add} {stats_add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_cases_search_del AFTER DELETE ON Cases BEGIN {fts_sub} {stats_sub} END")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_cases_fts_upd
+        AFTER UPDATE OF opponent_name, description ON Cases
+        WHEN OLD.opponent_name IS NOT NEW.opponent_name OR OLD.description IS NOT NEW.description
+        BEGIN {fts_sub} {fts_add} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_opponent_stats_upd
+        AFTER UPDATE OF opponent_name, amount ON Cases
+        WHEN opponent_key(OLD.opponent_name) IS NOT opponent_key(NEW.opponent_name)
+          OR OLD.amount IS NOT NEW.amount
+        BEGIN {stats_sub} {stats_add} END
+    """)
+    rebuild_index(conn)
+
+
+def _m011_case_evidence_document(conn: sqlite3.Connection) -> None:
+    # Удаление документа (ON DELETE SET NULL в CaseEvidence.document_id) искало
+    # ссылки полным проходом по CaseEvidence: ~50 мс на документ на 200 тыс. строк,
+    # а архив черновиков (utils/maintenance.py) удаляет документы тысячами
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_case_evidence_document
+        ON CaseEvidence(document_id) WHERE document_id IS NOT NULL
+    """)
+
+
+def _m012_cases_search_columns(conn: sqlite3.Connection) -> None:
+    # Нормализованный текст для поиска хранится в колонках дела (utils.text.search_columns):
+    # его считает приложение при записи (utils/repository.py), а триггеры только переносят
+    # колонки в CasesFts и OpponentStats. Поэтому Cases можно менять из любого соединения,
+    # в том числе из консольного sqlite3; правки ответчика и описания в обход приложения
+    # попадут в поиск после python -m utils.search rebuild.
+    from utils.search import rebuild_index, refresh_columns
+    from utils.text import SEARCH_COLUMNS
+
+    # Прежние триггеры и индекс по выражению opponent_key(opponent_name) (миграция 10)
+    for trigger in ("trg_cases_search_ins", "trg_cases_search_del", "trg_cases_fts_upd", "trg_opponent_stats_upd"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP INDEX IF EXISTS idx_cases_opponent_key")
+    columns = _table_columns(conn, "Cases")
+    for column in SEARCH_COLUMNS:  # opponent_key, fts_name, fts_text из utils.text
+        if column not in columns:
+            conn.execute(f"ALTER TABLE Cases ADD COLUMN {column} TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cases_opponent_key ON Cases(opponent_key)")
+    refresh_columns(conn)  # до триггеров: CasesFts пересобирается ниже целиком
+
+    fts_add = """
+        INSERT INTO CasesFts (rowid, opponent, description)
+        VALUES (NEW.id, NEW.opponent_fts, NEW.description_fts);
+    """
+    # Таблица без копии текста (content=''): строку удаляет команда 'delete' с теми же
+    # значениями, что были вставлены, — они и хранятся в колонках дела
+    fts_sub = """
+        INSERT INTO CasesFts (CasesFts, rowid, opponent, description)
+        VALUES ('delete', OLD.id, OLD.opponent_fts, OLD.description_fts);
+    """
+    stats_add = """
+        INSERT INTO OpponentStats (opponent_key, name, cases, amount_sum)
+        SELECT NEW.opponent_key, NEW.opponent_name, 1, coalesce(NEW.amount, 0)
+        WHERE NEW.opponent_key IS NOT NULL
+        ON CONFLICT(opponent_key) DO UPDATE SET
+          name = excluded.name,
+          cases = cases + 1,
+          amount_sum = amount_sum + excluded.amount_sum;
+    """
+    stats_sub = """
+        UPDATE OpponentStats SET
+          cases = cases - 1,
+          amount_sum = amount_sum - coalesce(OLD.amount, 0)
+        WHERE opponent_key = OLD.opponent_key;
+        DELETE FROM OpponentStats WHERE cases <= 0 AND opponent_key = OLD.opponent_key;
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_cases_search_ins AFTER INSERT ON Cases BEGIN {fts_add} {stats_add} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_cases_search_del AFTER DELETE ON Cases BEGIN {fts_sub} {stats_sub} END")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_cases_fts_upd
+        AFTER UPDATE OF opponent_fts, description_fts ON Cases
+        WHEN OLD.opponent_fts IS NOT NEW.opponent_fts OR OLD.description_fts IS NOT NEW.description_fts
+        BEGIN {fts_sub} {fts_add} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_opponent_stats_upd
+        AFTER UPDATE OF opponent_key, amount ON Cases
+        WHEN OLD.opponent_key IS NOT NEW.opponent_key OR OLD.amount IS NOT NEW.amount
+        BEGIN {stats_sub} {stats_add} END
+    """)
+    rebuild_index(conn)
+
+
+def _m013_courts_version(conn: sqlite3.Connection) -> None:
+    # Версия справочника судов: кеши подсказок и подсудности (utils/courts.py) сверяют
+    # её на каждом запросе, поэтому загрузка из другого процесса (python -m utils.courts)
+    # или правка из консольного sqlite3 видна запущенному приложению и API сразу
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CourtsVersion (
+          id INTEGER PRIMARY KEY CHECK (id = 1),
+          version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO CourtsVersion (id, version) VALUES (1, 0)")
+    bump = "UPDATE CourtsVersion SET version = version + 1 WHERE id = 1;"
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_courts_version_{event.lower()}
+            AFTER {event} ON Courts BEGIN {bump} END
+        """)
+
+
+MIGRATIONS = (
+    (1, _m001_case_evidence),
+    (2, _m002_narrow_cases),
+    (3, _m003_nlp_analysis),
+    (4, _m004_document_render_key),
+    (5, _m005_deadline_rules),
+    (6, _m006_user_identity),
+    (7, _m007_jobs),
+    (8, _m008_case_stats),
+    (9, _m009_documents_case_type),
+    (10, _m010_cases_search),
+    (11, _m011_case_evidence_document),
+    (12, _m012_cases_search_columns),
+    (13, _m013_courts_version),
+)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, step in MIGRATIONS:
+        if target <= version:
+            continue
+        # foreign_keys нельзя переключать внутри транзакции
+        conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step(conn)
+                broken = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if broken:
+                    raise sqlite3.IntegrityError(f"{step.__name__}: нарушены внешние ключи {broken[:5]}")
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.execute("PRAGMA foreign_keys = ON")
+        version = target
+    return version
+
+
+def init_db(conn: sqlite3.Connection) -> int:
+    # Базовая схема + все миграции; безопасно вызывать повторно
+    conn.executescript(DDL)
+    return migrate(conn)
+
+
 def main() -> None:
-    DB_DIR.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("PRAGMA journal_mode = WAL;")
-        conn.execute("PRAGMA synchronous = NORMAL;")
-        conn.executescript(DDL)
-    print(f"{DB_PATH}")
+    # База — APP_DB_PATH (по умолчанию db/app.sqlite); прагмы — как у пула
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = connect(DB_PATH)
+    try:
+        version = init_db(conn)
+    finally:
+        conn.close()
+    print(f"{DB_PATH} (schema v{version})")
 
 if __name__ == "__main__":
     main()
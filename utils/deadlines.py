@@ -0,0 +1,282 @@
+# utils/deadlines.py
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional, Sequence
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import yaml
+from dateutil.relativedelta import MO, relativedelta
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from utils import metrics, repository
+from utils.db import get_pool
+
+ROOT = Path(__file__).resolve().parents[1]
+TIMELINE_PATH = ROOT / "kb" / "timeline.yaml"
+
+SUPPORTED_VERSIONS = {1}
+SOURCE_PREFIX = "kb.timeline."
+CHUNK_SIZE = 5000
+
+
+# =========================
+# Валидация YAML (pydantic, один раз при загрузке)
+# =========================
+class _RuleModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: str = Field(pattern=r"^[a-z][a-z0-9_]*$")
+    title: str = Field(min_length=1)
+    after: Optional[str] = None  # id правила выше по списку; None — от Cases.event_date
+    years: int = 0
+    months: int = 0
+    weeks: int = 0
+    days: int = 0
+    day: Optional[int] = Field(default=None, ge=1, le=31)
+    roll: bool = True
+
+
+class _TimelineModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    version: int
+    categories: dict[str, list[_RuleModel]]
+
+    @model_validator(mode="after")
+    def _check(self) -> "_TimelineModel":
+        if self.version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"неподдерживаемая версия сроков: {self.version}")
+        for cat_id, rules in self.categories.items():
+            seen: set[str] = set()
+            for rule in rules:
+                if rule.id in seen:
+                    raise ValueError(f"{cat_id}: повторяющийся id правила {rule.id}")
+                # ссылка только назад — циклов быть не может
+                if rule.after is not None and rule.after not in seen:
+                    raise ValueError(f"{cat_id}.{rule.id}: after={rule.after} должно быть выше по списку")
+                seen.add(rule.id)
+        return self
+
+
+# =========================
+# Скомпилированные правила
+# =========================
+@dataclass(frozen=True)
+class TimelineRule:
+    category: str
+    id: str
+    title: str
+    after: Optional[str]
+    delta: relativedelta
+    roll: bool
+
+    @property
+    def source(self) -> str:
+        return f"{SOURCE_PREFIX}{self.category}.{self.id}"
+
+
+@dataclass(frozen=True)
+class Timeline:
+    version: int
+    categories: Mapping[str, tuple[TimelineRule, ...]]
+
+    @property
+    def sources(self) -> list[str]:
+        return [r.source for rules in self.categories.values() for r in rules]
+
+    def rules(self, category: Optional[str]) -> tuple[TimelineRule, ...]:
+        return self.categories.get(category, ()) if category else ()
+
+
+def compile_timeline(data: dict) -> Timeline:
+    model = _TimelineModel.model_validate(data)
+    return Timeline(
+        version=model.version,
+        categories=MappingProxyType({
+            cat_id: tuple(
+                TimelineRule(
+                    category=cat_id,
+                    id=r.id,
+                    title=r.title,
+                    after=r.after,
+                    delta=relativedelta(years=r.years, months=r.months, weeks=r.weeks,
+                                        days=r.days, day=r.day),
+                    roll=r.roll,
+                )
+                for r in rules
+            )
+            for cat_id, rules in model.categories.items()
+        }),
+    )
+
+
+def load_timeline(path: Path = TIMELINE_PATH) -> Timeline:
+    with open(path, encoding="utf-8") as f:
+        return compile_timeline(yaml.safe_load(f))
+
+
+# Кеш на процесс: файл перечитывается, только если изменился его mtime
+_cache: dict[Path, tuple[int, Timeline]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_timeline(path: Path = TIMELINE_PATH) -> Timeline:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        timeline = load_timeline(path)
+        _cache[path] = (mtime, timeline)
+        return timeline
+
+
+def timeline_version(path: Path = TIMELINE_PATH) -> int:
+    # mtime загруженного файла — ключ кешей, производных от правил
+    get_timeline(path)
+    return _cache[path][0]
+
+
+# =========================
+# Расчёт сроков
+# =========================
+@lru_cache(maxsize=65536)
+def _due_dates(category: str, event_date: str, timeline_version: int) -> tuple[tuple[str, str, str], ...]:
+    # -> ((source, title, due_date ISO), ...). Дат событий намного меньше, чем дел,
+    # поэтому при массовом пересчёте результат почти всегда берётся из кеша.
+    # timeline_version — чтобы сбросить кеш при изменении kb/timeline.yaml.
+    base = date.fromisoformat(event_date)
+    due: dict[str, date] = {}
+    out = []
+    for rule in get_timeline().rules(category):
+        d = (due[rule.after] if rule.after else base) + rule.delta
+        if rule.roll and d.weekday() >= 5:
+            d += relativedelta(weekday=MO)  # ст. 193 ГК РФ: выходной -> следующий рабочий день
+        due[rule.id] = d
+        out.append((rule.source, rule.title, d.isoformat()))
+    return tuple(out)
+
+
+def compute(category: Optional[str], event_date: Optional[str]) -> list[repository.DeadlineRow]:
+    if not category or not event_date:
+        return []
+    return [
+        {"title": title, "due_date": due, "source": source}
+        for source, title, due in _due_dates(category, event_date, timeline_version())
+    ]
+
+
+@metrics.timed("deadlines.sync_cases")
+def sync_cases(conn: sqlite3.Connection, case_ids: Sequence[int], today: Optional[date] = None) -> int:
+    # Пересчитывает сроки дел по правилам; выполнять внутри транзакции.
+    # Сроки удалённых из kb/timeline.yaml правил, кроме выполненных, удаляются.
+    today_iso = (today or date.today()).isoformat()
+    sources = json.dumps(get_timeline().sources)
+    written = 0
+    for start in range(0, len(case_ids), CHUNK_SIZE):
+        chunk = case_ids[start:start + CHUNK_SIZE]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT id, category, event_date FROM Cases WHERE id IN ({marks})", chunk
+        ).fetchall()
+        deadlines = [
+            {**d, "case_id": r["id"]} for r in rows for d in compute(r["category"], r["event_date"])
+        ]
+        repository.upsert_deadlines(conn, deadlines, today_iso)
+        conn.execute(
+            f"""
+            DELETE FROM Deadlines
+            WHERE case_id IN ({marks}) AND source LIKE '{SOURCE_PREFIX}%'
+              AND status IS NOT 'done'
+              AND NOT EXISTS (
+                SELECT 1 FROM json_each(?) j WHERE j.value = Deadlines.source
+              )
+            """,
+            (*chunk, sources),
+        )
+        written += len(deadlines)
+    return written
+
+
+def sweep_overdue(conn: sqlite3.Connection, today: Optional[date] = None) -> int:
+    # Один UPDATE на все дела; idx_dead_planned_due -> читаются только просроченные 'planned'
+    cur = conn.execute(
+        """
+        UPDATE Deadlines SET status = 'overdue', updated_at = datetime('now')
+        WHERE status = 'planned' AND due_date < ?
+        """,
+        ((today or date.today()).isoformat(),),
+    )
+    return cur.rowcount
+
+
+# =========================
+# Экспорт в календарь (.ics)
+# =========================
+def to_ics(rows: Iterable[sqlite3.Row]) -> str:
+    # ics (с arrow) грузится ~80 мс — только при первой выгрузке, не при сохранении анкеты
+    from ics import Calendar, Event
+
+    calendar = Calendar(creator="digital_lawyer")
+    for row in rows:
+        if not row["due_date"]:
+            continue
+        event = Event(
+            name=row["title"],
+            begin=row["due_date"],
+            uid=f"deadline-{row['id']}@digital-lawyer",
+            description=f"Дело {row['case_id']}, статус: {row['status']}",
+        )
+        event.make_all_day()
+        calendar.events.add(event)
+    return calendar.serialize()
+
+
+def export_ics(conn: sqlite3.Connection, case_id: Optional[int] = None, include_done: bool = False) -> str:
+    where = ["1 = 1" if include_done else "status IS NOT 'done'"]
+    params: list = []
+    if case_id is not None:
+        where.append("case_id = ?")
+        params.append(case_id)
+    rows = conn.execute(
+        f"SELECT * FROM Deadlines WHERE {' AND '.join(where)} ORDER BY case_id, due_date", params
+    )
+    return to_ics(rows)
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.deadlines generate [case_id ...]   (без id — все дела)
+    # python -m utils.deadlines sweep                     (по cron раз в сутки)
+    # python -m utils.deadlines ics [case_id] > deadlines.ics
+    if not argv or argv[0] not in ("generate", "sweep", "ics"):
+        raise SystemExit("usage: python -m utils.deadlines generate [CASE_ID ...] | sweep | ics [CASE_ID]")
+    pool = get_pool()
+    if argv[0] == "generate":
+        with pool.connection() as conn:
+            ids = [int(a) for a in argv[1:]] or [
+                r[0] for r in conn.execute("SELECT id FROM Cases WHERE event_date IS NOT NULL ORDER BY id")
+            ]
+        written = 0
+        for start in range(0, len(ids), CHUNK_SIZE):
+            with pool.transaction() as conn:
+                written += sync_cases(conn, ids[start:start + CHUNK_SIZE])
+        print(f"deadlines for {len(ids)} cases: {written}")
+    elif argv[0] == "sweep":
+        with pool.transaction() as conn:
+            print(f"overdue: {sweep_overdue(conn)}")
+    else:
+        with pool.connection() as conn:
+            sys.stdout.write(export_ics(conn, int(argv[1]) if len(argv) > 1 else None))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,257 @@
+# utils/docgen.py
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+import sys
+import threading
+
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+from ml import kb
+from utils import filestore, metrics, repository
+from utils.db import DB_PATH, get_pool
+from utils.evidence import get_registry
+
+ROOT = Path(__file__).resolve().parents[1]
+TEMPLATES_DIR = ROOT / "templates"
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+BULK_CHUNK = 200  # дел на одну задачу пула процессов
+KB_ARTICLES = 5   # ссылок на нормы в документе (ml/kb.py)
+
+# Автоэкранирование: «&» и «<» в описании дела не должны ломать XML документа
+_JINJA = Environment(autoescape=True)
+
+
+# =========================
+# Шаблоны: читаются один раз на процесс
+# =========================
+def template_path(category: str, doc_type: str, templates_dir: Path = TEMPLATES_DIR) -> Path:
+    # templates/<category>/<doc_type>.docx, иначе общий templates/<doc_type>.docx
+    specific = templates_dir / category / f"{doc_type}.docx"
+    return specific if specific.exists() else templates_dir / f"{doc_type}.docx"
+
+
+@dataclass(frozen=True)
+class LoadedTemplate:
+    # Содержимое .docx читается с диска один раз на процесс; рендер — публичный
+    # DocxTemplate(...).render() на свежем объекте для каждого документа
+    # (DocxTemplate хранит состояние рендера, делить его между потоками нельзя).
+    name: str     # путь относительно TEMPLATES_DIR -> Documents.template_name
+    version: str  # хеш содержимого .docx: исправленный шаблон — новая версия
+    source: bytes = field(repr=False)
+
+    def render(self, context: Mapping[str, Any]) -> bytes:
+        doc = DocxTemplate(io.BytesIO(self.source))
+        doc.render(dict(context), jinja_env=_JINJA)
+        out = io.BytesIO()
+        doc.save(out)
+        return out.getvalue()
+
+
+def _load(source: bytes, name: str) -> LoadedTemplate:
+    return LoadedTemplate(name=name, version=hashlib.sha256(source).hexdigest()[:16], source=source)
+
+
+_cache: dict[Path, tuple[int, LoadedTemplate]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_template(category: str, doc_type: str, templates_dir: Path = TEMPLATES_DIR) -> LoadedTemplate:
+    # Кеш на процесс; шаблон перечитывается, только если изменился mtime файла
+    path = template_path(category, doc_type, templates_dir)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        template = _load(path.read_bytes(), path.relative_to(templates_dir).as_posix())
+        _cache[path] = (mtime, template)
+        return template
+
+
+# =========================
+# Контекст и ключ рендера
+# =========================
+def _format_amount(amount: Optional[float]) -> str:
+    return f"{amount or 0:,.2f}".replace(",", " ").replace(".", ",")
+
+
+def _format_date(iso: Optional[str]) -> str:
+    return ".".join(reversed(iso.split("-"))) if iso else ""
+
+
+def fetch_context(conn: sqlite3.Connection, case_id: int) -> Optional[dict]:
+    # Всё, что попадает в документ: дело, истец, суд, отмеченные доказательства,
+    # ссылки на нормы (пустой список, если индекс ml/kb.py не собран)
+    row = conn.execute(
+        """
+        SELECT c.id, c.category, c.doc_type, c.description, c.opponent_name,
+               c.opponent_address, c.amount, c.event_date,
+               coalesce(c.court_name_override, ct.name) AS court_name,
+               coalesce(c.court_address_override, ct.address) AS court_address,
+               u.fio, u.email, u.phone,
+               u.resident_region, u.resident_city, u.resident_address
+        FROM Cases c
+        JOIN Users u ON u.id = c.user_id
+        LEFT JOIN Courts ct ON ct.id = c.court_id
+        WHERE c.id = ?
+        """,
+        (case_id,),
+    ).fetchone()
+    if row is None or not row["category"] or not row["doc_type"]:
+        return None
+    registry = get_registry()
+    schema = registry.doc_type(row["category"], row["doc_type"])
+    present = repository.list_case_evidence(conn, case_id)
+    evidence = [
+        item.label for item in (schema.required + schema.optional if schema else ())
+        if present.get(item.id)
+    ]
+    category = registry.categories.get(row["category"])
+    return {
+        "case": {
+            "id": row["id"],
+            "category": row["category"],
+            "doc_type": row["doc_type"],
+            "category_label": category.label if category else row["category"],
+            "doc_label": schema.label if schema else row["doc_type"],
+            "description": row["description"] or "",
+            "opponent_name": row["opponent_name"] or "",
+            "opponent_address": row["opponent_address"],
+            "amount": _format_amount(row["amount"]),
+            "event_date": _format_date(row["event_date"]),
+        },
+        "user": {
+            "fio": row["fio"],
+            "email": row["email"],
+            "phone": row["phone"],
+            "address": ", ".join(
+                p for p in (row["resident_region"], row["resident_city"], row["resident_address"]) if p
+            ),
+        },
+        "court": {"name": row["court_name"] or "", "address": row["court_address"] or ""},
+        "evidence": evidence,
+        "articles": [
+            a.citation for a in kb.search(row["description"] or "", row["category"], KB_ARTICLES)
+        ],
+    }
+
+
+def render_key(context: Mapping[str, Any], template: LoadedTemplate) -> str:
+    payload = json.dumps(context, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{template.name}@{template.version}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def find_rendered(conn: sqlite3.Connection, case_id: int, key: str) -> Optional[sqlite3.Row]:
+    # idx_docs_render_key
+    return conn.execute(
+        "SELECT * FROM Documents WHERE case_id = ? AND render_key = ? ORDER BY id DESC LIMIT 1",
+        (case_id, key),
+    ).fetchone()
+
+
+# =========================
+# Генерация
+# =========================
+@dataclass(frozen=True)
+class GeneratedDocument:
+    case_id: int
+    document_id: int
+    file_path: str
+    cached: bool  # True — дело и шаблон не менялись, взят готовый документ
+
+
+@metrics.timed("docgen.generate")
+def generate(case_id: int, force: bool = False, db_path: Path | str = DB_PATH) -> Optional[GeneratedDocument]:
+    # Чтение — из пула, рендер и запись файла — вне транзакции,
+    # строка Documents — короткой транзакцией
+    pool = get_pool(db_path)
+    with pool.connection() as conn:
+        context = fetch_context(conn, case_id)
+        if context is None:
+            return None
+        template = get_template(context["case"]["category"], context["case"]["doc_type"])
+        key = render_key(context, template)
+        existing = None if force else find_rendered(conn, case_id, key)
+    if existing is not None:
+        return GeneratedDocument(case_id, existing["id"], existing["file_path"], cached=True)
+
+    stored = filestore.put(io.BytesIO(template.render(context)))
+    with pool.transaction() as conn:
+        repository.insert_documents(conn, [{
+            "case_id": case_id,
+            "doc_type": context["case"]["doc_type"],
+            "template_name": f"{template.name}@{template.version}",
+            "file_path": stored.file_path,
+            "mime_type": DOCX_MIME,
+            "file_size": stored.file_size,
+            "kb_articles": json.dumps(context["articles"], ensure_ascii=False),
+            "render_key": key,
+        }])
+        document_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return GeneratedDocument(case_id, document_id, stored.file_path, cached=False)
+
+
+def _generate_chunk(case_ids: Sequence[int], force: bool, db_path: str) -> tuple[int, int]:
+    # Задача пула процессов: шаблоны компилируются один раз на процесс-воркер
+    rendered = cached = 0
+    for case_id in case_ids:
+        doc = generate(case_id, force=force, db_path=db_path)
+        if doc is None:
+            continue
+        if doc.cached:
+            cached += 1
+        else:
+            rendered += 1
+    return rendered, cached
+
+
+def regenerate(
+    case_ids: Sequence[int],
+    workers: int | None = None,
+    force: bool = False,
+    db_path: Path | str = DB_PATH,
+) -> tuple[int, int]:
+    # Массовая перегенерация (например, после исправления шаблона): дела
+    # с неизменными полями и версией шаблона пропускаются по render_key
+    chunks = [case_ids[i:i + BULK_CHUNK] for i in range(0, len(case_ids), BULK_CHUNK)]
+    if not chunks:
+        return 0, 0
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    path = str(db_path)
+    if workers == 1:
+        results = [_generate_chunk(chunk, force, path) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+            results = list(pool.map(_generate_chunk, chunks, [force] * len(chunks), [path] * len(chunks)))
+    return sum(r for r, _ in results), sum(c for _, c in results)
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.docgen [--force] [case_id ...]  (без id — все дела с типом документа)
+    force = "--force" in argv
+    ids = [int(a) for a in argv if a != "--force"]
+    if not ids:
+        with get_pool().connection() as conn:
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM Cases WHERE doc_type IS NOT NULL ORDER BY id"
+            )]
+    rendered, cached = regenerate(ids, force=force)
+    print(f"rendered {rendered}, unchanged {cached}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,183 @@
+# utils/evidence.py
+from __future__ import annotations
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Optional
+import os
+import threading
+
+import yaml
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+ROOT = Path(__file__).resolve().parents[1]
+SCHEMA_PATH = ROOT / "kb" / "evidence_schema.yaml"
+
+SUPPORTED_VERSIONS = {1}
+
+
+# =========================
+# Валидация YAML (pydantic, один раз при загрузке)
+# =========================
+class _ItemModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: str = Field(pattern=r"^[a-z][a-z0-9_]*$")
+    label: str = Field(min_length=1)
+
+
+class _DocTypeModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    label: str = Field(min_length=1)
+    required: list[_ItemModel] = []
+    optional: list[_ItemModel] = []
+
+    @model_validator(mode="after")
+    def _unique_ids(self) -> "_DocTypeModel":
+        ids = [i.id for i in self.required + self.optional]
+        dup = {i for i in ids if ids.count(i) > 1}
+        if dup:
+            raise ValueError(f"повторяющиеся id доказательств: {sorted(dup)}")
+        return self
+
+
+class _CategoryModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    label: str = Field(min_length=1)
+    doc_types: dict[str, _DocTypeModel]
+
+
+class _SchemaModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    version: int
+    categories: dict[str, _CategoryModel]
+
+    @model_validator(mode="after")
+    def _check(self) -> "_SchemaModel":
+        if self.version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"неподдерживаемая версия схемы: {self.version}")
+        labels = [c.label for c in self.categories.values()]
+        if len(labels) != len(set(labels)):
+            raise ValueError("повторяющиеся названия категорий")
+        return self
+
+
+# =========================
+# Скомпилированный реестр (неизменяемый, с индексами)
+# =========================
+@dataclass(frozen=True)
+class EvidenceItem:
+    id: str
+    label: str
+    required: bool
+    widget_key: str  # ключ чекбокса в st.session_state
+    file_key: str    # ключ file_uploader в st.session_state
+
+
+@dataclass(frozen=True)
+class DocType:
+    category: str
+    id: str
+    label: str
+    required: tuple[EvidenceItem, ...]
+    optional: tuple[EvidenceItem, ...]
+    items: Mapping[str, EvidenceItem]
+    required_ids: frozenset[str]
+
+
+@dataclass(frozen=True)
+class Category:
+    id: str
+    label: str
+    doc_types: Mapping[str, DocType]
+    doc_type_by_label: Mapping[str, str]
+
+
+@dataclass(frozen=True)
+class EvidenceRegistry:
+    version: int
+    categories: Mapping[str, Category]
+    category_by_label: Mapping[str, str]
+    items: Mapping[tuple[str, str, str], EvidenceItem] = field(repr=False)
+
+    def doc_type(self, category: Optional[str], doc_type: Optional[str]) -> Optional[DocType]:
+        cat = self.categories.get(category) if category else None
+        return cat.doc_types.get(doc_type) if cat and doc_type else None
+
+    def item(self, category: str, doc_type: str, evidence_id: str) -> Optional[EvidenceItem]:
+        return self.items.get((category, doc_type, evidence_id))
+
+
+def compile_registry(data: dict) -> EvidenceRegistry:
+    schema = _SchemaModel.model_validate(data)
+    categories = {}
+    all_items = {}
+    for cat_id, cat in schema.categories.items():
+        doc_types = {}
+        for doc_id, doc in cat.doc_types.items():
+            def build(models: list[_ItemModel], required: bool) -> tuple[EvidenceItem, ...]:
+                return tuple(
+                    EvidenceItem(
+                        id=m.id,
+                        label=m.label,
+                        required=required,
+                        widget_key=f"ev_{cat_id}_{doc_id}_{m.id}",
+                        file_key=f"file_{cat_id}_{doc_id}_{m.id}",
+                    )
+                    for m in models
+                )
+
+            required = build(doc.required, True)
+            optional = build(doc.optional, False)
+            items = {i.id: i for i in required + optional}
+            doc_types[doc_id] = DocType(
+                category=cat_id,
+                id=doc_id,
+                label=doc.label,
+                required=required,
+                optional=optional,
+                items=MappingProxyType(items),
+                required_ids=frozenset(i.id for i in required),
+            )
+            all_items.update({(cat_id, doc_id, i.id): i for i in items.values()})
+        categories[cat_id] = Category(
+            id=cat_id,
+            label=cat.label,
+            doc_types=MappingProxyType(doc_types),
+            doc_type_by_label=MappingProxyType({d.label: d.id for d in doc_types.values()}),
+        )
+    return EvidenceRegistry(
+        version=schema.version,
+        categories=MappingProxyType(categories),
+        category_by_label=MappingProxyType({c.label: c.id for c in categories.values()}),
+        items=MappingProxyType(all_items),
+    )
+
+
+def load_registry(path: Path = SCHEMA_PATH) -> EvidenceRegistry:
+    with open(path, encoding="utf-8") as f:
+        return compile_registry(yaml.safe_load(f))
+
+
+# Кеш на процесс: файл перечитывается, только если изменился его mtime
+_cache: dict[Path, tuple[int, EvidenceRegistry]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_registry(path: Path = SCHEMA_PATH) -> EvidenceRegistry:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        registry = load_registry(path)
+        _cache[path] = (mtime, registry)
+        return registry
+
+
+def registry_version(path: Path = SCHEMA_PATH) -> int:
+    # mtime загруженного файла — ключ кешей, производных от схемы
+    get_registry(path)
+    return _cache[path][0]
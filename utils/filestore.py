@@ -0,0 +1,136 @@
+# utils/filestore.py
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+STORE_DIR = Path(os.environ.get("APP_FILESTORE_DIR") or ROOT / "filestore")
+
+CHUNK_SIZE = 1 << 20  # 1 МиБ
+GC_MIN_AGE_S = 3600  # файлы, загруженные/переиспользованные меньше часа назад, не трогаем
+
+# Хранилище файлов-доказательств с адресацией по содержимому:
+#   filestore/ab/cd/abcd...<sha256>
+# Documents.file_path ссылается на этот путь (относительно ROOT); счётчик
+# ссылок Blobs.ref_count ведут триггеры на Documents (см. utils/db_init.py).
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    sha256: str
+    file_path: str  # относительно ROOT, как в Documents.file_path
+    file_size: int
+
+
+def blob_path(sha256: str, store_dir: Path = STORE_DIR) -> Path:
+    return store_dir / sha256[:2] / sha256[2:4] / sha256
+
+
+def relative_path(path: Path) -> str:
+    try:
+        return path.relative_to(ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+class BlobWriter:
+    # Запись файла частями (потоковая загрузка в API): пишем во временный файл,
+    # одновременно считая SHA-256; commit() переносит его на место по хешу,
+    # если такой файл уже есть — временный просто удаляем.
+    def __init__(self, store_dir: Path = STORE_DIR) -> None:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        self.store_dir = store_dir
+        self.size = 0
+        self._digest = hashlib.sha256()
+        fd, self._tmp_name = tempfile.mkstemp(dir=store_dir, prefix=".upload-")
+        self._out = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self._digest.update(chunk)
+        self._out.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> StoredFile:
+        try:
+            self._out.close()
+            sha256 = self._digest.hexdigest()
+            target = blob_path(sha256, self.store_dir)
+            if target.exists():
+                os.unlink(self._tmp_name)
+                # свежий mtime защищает файл от gc(), пока документ ещё не записан
+                os.utime(target)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(self._tmp_name, target)
+        except BaseException:
+            self.abort()
+            raise
+        return StoredFile(sha256=sha256, file_path=relative_path(target), file_size=self.size)
+
+    def abort(self) -> None:
+        self._out.close()
+        if os.path.exists(self._tmp_name):
+            os.unlink(self._tmp_name)
+
+
+def put(fileobj: BinaryIO, store_dir: Path = STORE_DIR) -> StoredFile:
+    writer = BlobWriter(store_dir)
+    try:
+        while chunk := fileobj.read(CHUNK_SIZE):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def open_blob(file_path: str) -> BinaryIO:
+    return open(ROOT / file_path, "rb")
+
+
+def gc(conn: sqlite3.Connection, store_dir: Path = STORE_DIR) -> int:
+    # Удаляет файлы, на которые больше не ссылается ни один документ,
+    # и «сироты» от прерванных сохранений. Возвращает число удалённых файлов.
+    removed = 0
+    cutoff = time.time() - GC_MIN_AGE_S
+
+    def is_stale(path: Path) -> bool:
+        try:
+            return path.stat().st_mtime < cutoff
+        except FileNotFoundError:
+            return False
+
+    dead = [r[0] for r in conn.execute("SELECT file_path FROM Blobs WHERE ref_count <= 0")]
+    dead = [p for p in dead if is_stale(ROOT / p) or not (ROOT / p).exists()]
+    conn.executemany(
+        "DELETE FROM Blobs WHERE file_path = ? AND ref_count <= 0", ((p,) for p in dead)
+    )
+    for file_path in dead:
+        (ROOT / file_path).unlink(missing_ok=True)
+        removed += 1
+
+    if store_dir.exists():
+        known = {r[0] for r in conn.execute("SELECT file_path FROM Blobs")}
+        for path in store_dir.glob("*/*/*"):
+            if relative_path(path) not in known and is_stale(path):
+                path.unlink(missing_ok=True)
+                removed += 1
+    return removed
+
+
+def main() -> None:
+    from utils.db import get_pool
+
+    with get_pool().transaction() as conn:
+        removed = gc(conn)
+    print(f"removed {removed} files from {STORE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# utils/intake.py
+from __future__ import annotations
+from typing import Iterable, Mapping, Optional, Sequence
+import sqlite3
+
+from utils import deadlines, jobs, metrics, repository
+
+# Сохранение анкеты: общее для UI (app/app.py), массового импорта (utils/bulk.py)
+# и нагрузочных тестов (bench/). Вызывать внутри ConnectionPool.transaction():
+# Users, Cases, Documents, CaseEvidence, Deadlines и задача анализа — одна
+# транзакция (один fsync).
+
+
+def store_case(
+    conn: sqlite3.Connection,
+    users_payload: repository.UserRow,
+    cases_payload: repository.CaseRow,
+    evidence_flags: Optional[Mapping[str, int]] = None,
+    documents: Optional[Iterable[repository.DocumentRow]] = None,
+) -> int:
+    # Строки одного дела без сроков и задач — их добавляет finish() пачкой
+    # Users: тот же email или телефон -> тот же пользователь
+    user_id = repository.upsert_user(conn, users_payload)
+    case_id = repository.insert_case(conn, {**cases_payload, "user_id": user_id})
+    repository.insert_documents(conn, ({**d, "case_id": case_id} for d in documents or []))
+    repository.insert_case_evidence(conn, case_id, evidence_flags or {})
+    return case_id
+
+
+def finish(conn: sqlite3.Connection, case_ids: Sequence[int]) -> None:
+    deadlines.sync_cases(conn, case_ids)
+    # Анализ и генерация документов идут в воркере (utils/jobs.py),
+    # поэтому время сохранения от них не зависит
+    for case_id in case_ids:
+        jobs.enqueue(conn, "analyze", case_id)
+
+
+@metrics.timed("intake.save_case")
+def save_case(
+    conn: sqlite3.Connection,
+    users_payload: repository.UserRow,
+    cases_payload: repository.CaseRow,
+    evidence_flags: Optional[Mapping[str, int]] = None,
+    documents: Optional[Iterable[repository.DocumentRow]] = None,
+) -> int:
+    case_id = store_case(conn, users_payload, cases_payload, evidence_flags, documents)
+    finish(conn, [case_id])
+    return case_id
@@ -0,0 +1,390 @@
+# utils/jobs.py
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import time
+
+from utils import metrics, repository
+from utils.db import DB_PATH, get_pool
+
+# Фоновые задачи в таблице Jobs (миграция 7). Анкета только ставит задачу в той же
+# транзакции, что и дело, поэтому время сохранения не зависит от анализа и
+# генерации документов. Воркер (python -m utils.jobs worker) берёт задачи в аренду:
+#   queued -> running (lease_until) -> done | queued (повтор с задержкой) | failed
+# Упавший воркер не продлевает аренду, и задачу после её истечения берёт другой.
+# Этапы дела: draft -> analysis (задача analyze) -> docs_ready (задача docgen).
+
+LEASE_SECONDS = 120.0   # аренда продлевается, пока задача выполняется
+POLL_SECONDS = 1.0      # пауза между опросами пустой очереди
+RETRY_BASE_SECONDS = 10.0  # задержка повтора: 10 с, 20 с, 40 с, ...
+SWEEP_EVERY_SECONDS = 3600.0  # как часто воркер ставит проход по срокам
+MAINTAIN_EVERY_SECONDS = 86400.0  # и обслуживание базы (utils/maintenance.py)
+MAX_ATTEMPTS = 3
+
+STATUSES = ("queued", "running", "done", "failed")
+PENDING = ("queued", "running")
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    kind: str
+    case_id: Optional[int]
+    payload: Optional[dict]
+    attempts: int
+    max_attempts: int
+
+
+def _job(row: sqlite3.Row) -> Job:
+    payload = json.loads(row["payload"]) if row["payload"] else None
+    return Job(row["id"], row["kind"], row["case_id"], payload, row["attempts"], row["max_attempts"])
+
+
+# =========================
+# Очередь (функции принимают соединение, как в utils/repository.py)
+# =========================
+def enqueue(
+    conn: sqlite3.Connection,
+    kind: str,
+    case_id: Optional[int] = None,
+    payload: Optional[dict] = None,
+    delay: float = 0.0,
+    unique: bool = False,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> Optional[int]:
+    # unique: не ставить, если такая же задача уже ждёт или выполняется
+    # (внутри BEGIN IMMEDIATE проверка и вставка атомарны). -> id задачи или None
+    if kind not in HANDLERS:
+        raise ValueError(f"неизвестный тип задачи: {kind}")
+    cur = conn.execute(
+        f"""
+        INSERT INTO Jobs (kind, case_id, payload, max_attempts, run_after)
+        SELECT :kind, :case_id, :payload, :max_attempts, :run_after
+        {'''WHERE NOT EXISTS (
+          SELECT 1 FROM Jobs WHERE kind = :kind AND case_id IS :case_id
+                               AND status IN ('queued', 'running')
+        )''' if unique else ''}
+        """,
+        {
+            "kind": kind,
+            "case_id": case_id,
+            "payload": json.dumps(payload, ensure_ascii=False) if payload else None,
+            "max_attempts": max_attempts,
+            "run_after": time.time() + delay,
+        },
+    )
+    return cur.lastrowid if cur.rowcount else None
+
+
+def expire_leases(conn: sqlite3.Connection, now: Optional[float] = None) -> int:
+    # Задачи упавших воркеров: назад в очередь или в failed, если попытки исчерпаны
+    now = time.time() if now is None else now
+    cur = conn.execute(
+        """
+        UPDATE Jobs SET
+          status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+          error = 'аренда истекла (' || coalesce(lease_owner, '?') || ')',
+          run_after = :now, lease_owner = NULL, lease_until = NULL,
+          updated_at = datetime('now')
+        WHERE status = 'running' AND lease_until < :now
+        """,
+        {"now": now},
+    )
+    return cur.rowcount
+
+
+def claim(
+    conn: sqlite3.Connection,
+    owner: str,
+    limit: int,
+    lease: float = LEASE_SECONDS,
+    now: Optional[float] = None,
+) -> list[Job]:
+    # Один UPDATE ... RETURNING: задачу не возьмут два воркера сразу.
+    # idx_jobs_queued -> читаются только готовые к запуску строки.
+    now = time.time() if now is None else now
+    rows = conn.execute(
+        """
+        UPDATE Jobs SET
+          status = 'running', lease_owner = :owner, lease_until = :until,
+          attempts = attempts + 1, updated_at = datetime('now')
+        WHERE id IN (
+          SELECT id FROM Jobs WHERE status = 'queued' AND run_after <= :now
+          ORDER BY run_after, id LIMIT :limit
+        )
+        RETURNING id, kind, case_id, payload, attempts, max_attempts
+        """,
+        {"owner": owner, "until": now + lease, "now": now, "limit": limit},
+    ).fetchall()
+    return sorted((_job(r) for r in rows), key=lambda j: j.id)
+
+
+def extend_lease(conn: sqlite3.Connection, job: Job, owner: str, lease: float = LEASE_SECONDS) -> bool:
+    cur = conn.execute(
+        """
+        UPDATE Jobs SET lease_until = ?
+        WHERE id = ? AND status = 'running' AND lease_owner = ?
+        """,
+        (time.time() + lease, job.id, owner),
+    )
+    return cur.rowcount == 1
+
+
+def complete(conn: sqlite3.Connection, job: Job, owner: str, follow_ups: Sequence[str] = ()) -> bool:
+    # Следующие этапы ставятся в той же транзакции. False — аренду уже забрали
+    # (задача выполнится повторно), следующие этапы тогда не ставим.
+    cur = conn.execute(
+        """
+        UPDATE Jobs SET status = 'done', lease_owner = NULL, lease_until = NULL,
+                        error = NULL, updated_at = datetime('now')
+        WHERE id = ? AND status = 'running' AND lease_owner = ?
+        """,
+        (job.id, owner),
+    )
+    if cur.rowcount != 1:
+        return False
+    for kind in follow_ups:
+        enqueue(conn, kind, job.case_id, unique=True)
+    return True
+
+
+def fail(conn: sqlite3.Connection, job: Job, owner: str, error: str) -> str:
+    # Повтор с экспоненциальной задержкой; после max_attempts — failed. -> новый статус
+    status = "failed" if job.attempts >= job.max_attempts else "queued"
+    conn.execute(
+        """
+        UPDATE Jobs SET status = ?, error = ?, run_after = ?,
+                        lease_owner = NULL, lease_until = NULL, updated_at = datetime('now')
+        WHERE id = ? AND status = 'running' AND lease_owner = ?
+        """,
+        (status, error[:2000], time.time() + RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), job.id, owner),
+    )
+    return status
+
+
+def list_case_jobs(conn: sqlite3.Connection, case_id: int) -> list[sqlite3.Row]:
+    # idx_jobs_case
+    return conn.execute(
+        "SELECT id, kind, status, attempts, error, updated_at FROM Jobs WHERE case_id = ? ORDER BY id",
+        (case_id,),
+    ).fetchall()
+
+
+def has_pending(conn: sqlite3.Connection, case_id: int) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM Jobs WHERE case_id = ? AND status IN ('queued', 'running') LIMIT 1",
+        (case_id,),
+    ).fetchone() is not None
+
+
+def counts(conn: sqlite3.Connection) -> dict[tuple[str, str], int]:
+    return {
+        (r[0], r[1]): r[2]
+        for r in conn.execute("SELECT kind, status, count(*) FROM Jobs GROUP BY kind, status")
+    }
+
+
+def retry_failed(conn: sqlite3.Connection, kind: Optional[str] = None) -> int:
+    cur = conn.execute(
+        """
+        UPDATE Jobs SET status = 'queued', attempts = 0, run_after = ?, updated_at = datetime('now')
+        WHERE status = 'failed' AND (? IS NULL OR kind = ?)
+        """,
+        (time.time(), kind, kind),
+    )
+    return cur.rowcount
+
+
+# =========================
+# Обработчики. Выполняются в процессах пула: тяжёлые модули (scikit-learn,
+# docxtpl) импортируются там, а не в приложении, которое только ставит задачи.
+# -> типы следующих задач по этому делу
+# =========================
+def _analyze(case_id: int, payload: Optional[dict], db_path: str) -> list[str]:
+    from ml import nlp, p_success
+
+    pool = get_pool(db_path)
+    with pool.transaction() as conn:
+        repository.update_case_status(conn, case_id, "analysis", only_from=("draft",))
+    model = nlp.current_model()
+    with pool.transaction() as conn:
+        case = repository.get_case(conn, case_id)
+        if case is None:
+            return []
+        nlp.analyze_cases(conn, [case_id], model)
+        if model is not None:
+            p_success.score_batch([case_id], conn=conn, model=model)
+    return ["docgen"] if case["doc_type"] else []
+
+
+def _docgen(case_id: int, payload: Optional[dict], db_path: str) -> list[str]:
+    from utils import docgen
+
+    generated = docgen.generate(case_id, force=bool((payload or {}).get("force")), db_path=db_path)
+    if generated is not None:
+        with get_pool(db_path).transaction() as conn:
+            repository.update_case_status(conn, case_id, "docs_ready", only_from=("draft", "analysis"))
+    return []
+
+
+def _deadlines(case_id: Optional[int], payload: Optional[dict], db_path: str) -> list[str]:
+    # С делом — пересчёт его сроков, без дела — проход planned -> overdue по всем
+    from utils import deadlines
+
+    with get_pool(db_path).transaction() as conn:
+        if case_id is None:
+            deadlines.sweep_overdue(conn)
+        else:
+            deadlines.sync_cases(conn, [case_id])
+    return []
+
+
+def _maintenance(case_id: Optional[int], payload: Optional[dict], db_path: str) -> list[str]:
+    # Архив заброшенных черновиков и уплотнение базы; отчёт — в вывод воркера
+    from utils import maintenance
+
+    report = maintenance.run(db_path)
+    print(f"maintenance: {report.summary()}".replace("\n", "; "))
+    return []
+
+
+HANDLERS: dict[str, Callable[[Optional[int], Optional[dict], str], list[str]]] = {
+    "analyze": _analyze,
+    "docgen": _docgen,
+    "deadlines": _deadlines,
+    "maintenance": _maintenance,
+}
+
+
+def run_job(kind: str, case_id: Optional[int], payload: Optional[dict], db_path: str) -> list[str]:
+    # Точка входа в процессе пула (функция уровня модуля — сериализуется для spawn)
+    return HANDLERS[kind](case_id, payload, db_path)
+
+
+# =========================
+# Воркер: asyncio-цикл раздаёт задачи пулу процессов, сам только
+# ведёт очередь (короткие транзакции по несколько миллисекунд)
+# =========================
+async def _run_in_pool(executor: Executor, job: Job, owner: str, pool) -> list[str]:
+    # Ждём результат, продлевая аренду, пока задача выполняется
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, run_job, job.kind, job.case_id, job.payload, str(pool.db_path))
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=LEASE_SECONDS / 3)
+        if done:
+            return future.result()
+        with pool.transaction() as conn:
+            extend_lease(conn, job, owner)
+
+
+async def _execute(executor: Executor, job: Job, owner: str, db_path: str) -> bool:
+    # True — задача выполнена и отмечена done этим воркером
+    pool = get_pool(db_path)
+    try:
+        with metrics.timer(f"jobs.{job.kind}"):  # от передачи в пул до результата
+            follow_ups = await _run_in_pool(executor, job, owner, pool)
+    except Exception as e:
+        with pool.transaction() as conn:
+            status = fail(conn, job, owner, f"{type(e).__name__}: {e}")
+        print(f"job {job.id} {job.kind} failed ({status}): {e}", file=sys.stderr)
+        return False
+    with pool.transaction() as conn:
+        return complete(conn, job, owner, follow_ups)
+
+
+def _completed(tasks: set[asyncio.Task]) -> int:
+    # Задачи, отмеченные done; упавшие и перехваченные другим воркером не считаются
+    return sum(1 for task in tasks if not task.exception() and task.result())
+
+
+async def run_worker(
+    concurrency: int = 2,
+    db_path: Path | str = DB_PATH,
+    once: bool = False,
+    sweep_every: float = SWEEP_EVERY_SECONDS,
+    maintain_every: float = MAINTAIN_EVERY_SECONDS,
+) -> int:
+    # once: выполнить всё, что готово к запуску, и выйти. -> выполнено задач (done)
+    path = str(db_path)
+    pool = get_pool(path)
+    metrics.start_exporter()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows / не главный поток
+
+    running: set[asyncio.Task] = set()
+    executed = 0
+    next_sweep = 0.0
+    with ProcessPoolExecutor(concurrency, mp_context=mp.get_context("spawn")) as executor:
+        while not stop.is_set():
+            now = time.time()
+            if sweep_every and now >= next_sweep and not once:
+                with pool.transaction() as conn:
+                    enqueue(conn, "deadlines", unique=True)
+                    # Обслуживание всегда стоит в очереди на сутки вперёд: перезапуск
+                    # воркера не сдвигает и не повторяет уже запланированный проход
+                    if maintain_every:
+                        enqueue(conn, "maintenance", delay=maintain_every, unique=True, max_attempts=1)
+                next_sweep = now + sweep_every
+            if len(running) < concurrency:
+                with pool.transaction() as conn:
+                    expire_leases(conn, now)
+                    jobs = claim(conn, owner, concurrency - len(running), now=now)
+                for job in jobs:
+                    running.add(asyncio.create_task(_execute(executor, job, owner, path)))
+            if once and not running:
+                break
+            # Ждём освобождения слота, сигнала остановки или следующего опроса очереди
+            stopping = asyncio.ensure_future(stop.wait())
+            done, _ = await asyncio.wait(
+                running | {stopping}, timeout=POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            stopping.cancel()
+            running -= done
+            executed += _completed(done - {stopping})
+        # Остановка: новые задачи не берём, текущие доводим до конца
+        if running:
+            await asyncio.wait(running)
+            executed += _completed(running)
+    return executed
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.jobs worker [--concurrency N] [--once]
+    # python -m utils.jobs status
+    # python -m utils.jobs retry [KIND]
+    usage = "usage: python -m utils.jobs worker [--concurrency N] [--once] | status | retry [KIND]"
+    if not argv or argv[0] not in ("worker", "status", "retry"):
+        raise SystemExit(usage)
+    if argv[0] == "worker":
+        concurrency = int(argv[argv.index("--concurrency") + 1]) if "--concurrency" in argv else 2
+        executed = asyncio.run(run_worker(concurrency, once="--once" in argv))
+        print(f"executed {executed} jobs")
+    elif argv[0] == "status":
+        with get_pool().connection() as conn:
+            stats = counts(conn)
+        for (kind, status), n in sorted(stats.items()):
+            print(f"{kind}\t{status}\t{n}")
+    else:
+        with get_pool().transaction() as conn:
+            requeued = retry_failed(conn, argv[1] if len(argv) > 1 else None)
+        print(f"requeued {requeued} failed jobs")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,417 @@
+# utils/jurisdiction.py
+from __future__ import annotations
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Iterator, Mapping, Optional
+import math
+import os
+import sqlite3
+import sys
+import threading
+
+import yaml
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from utils import courts
+from utils.db import DB_PATH, get_pool
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+RULES_PATH = ROOT / "kb" / "jurisdiction.yaml"
+
+SUPPORTED_VERSIONS = {1}
+FRAME_CHUNK_SIZE = 50_000
+
+# Подсудность и госпошлина по цене иска (kb/jurisdiction.yaml). Правила компилируются
+# в таблицу интервалов цены иска для каждой категории: на интервале уровень суда
+# постоянен, а пошлина линейна (base + rate × (цена − from)), поэтому расчёт — один
+# bisect (в пакетном режиме — numpy.searchsorted по колонке). Суд подбирается по
+# (категория, интервал, город) с кешем на процесс: на перезапуске анкеты это
+# словарь, а не запрос к БД. pandas/numpy импортируются только в пакетном режиме.
+
+
+# =========================
+# Валидация YAML (pydantic, один раз при загрузке)
+# =========================
+class _ScaleRowModel(BaseModel):
+    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+    start: float = Field(alias="from", ge=0)
+    base: float = Field(ge=0)
+    rate: float = Field(ge=0, lt=1)
+
+
+class _CategoryModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    magistrate_max: Optional[float] = Field(default=None, gt=0)
+    magistrate_basis: str = ""
+    district_basis: str = ""
+    fee_exempt: bool = False
+    fee_exempt_up_to: Optional[float] = Field(default=None, gt=0)
+    fee_exempt_basis: str = ""
+
+    @model_validator(mode="after")
+    def _check(self) -> "_CategoryModel":
+        if self.magistrate_max is not None and not self.magistrate_basis:
+            raise ValueError("нужно magistrate_basis: на каком основании дело у мирового судьи")
+        if self.magistrate_max is None and not self.district_basis:
+            raise ValueError("нужно district_basis: почему дело только в районном суде")
+        if (self.fee_exempt or self.fee_exempt_up_to) and not self.fee_exempt_basis:
+            raise ValueError("нужно fee_exempt_basis: основание освобождения от пошлины")
+        return self
+
+
+class _LevelsModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    magistrate: str = Field(min_length=1)
+    district: str = Field(min_length=1)
+
+
+class _RulesModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    version: int
+    levels: _LevelsModel
+    fee_doc_types: list[str]
+    fee_scale: list[_ScaleRowModel] = Field(min_length=1)
+    fee_max: float = Field(gt=0)
+    categories: dict[str, _CategoryModel]
+
+    @model_validator(mode="after")
+    def _check(self) -> "_RulesModel":
+        if self.version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"неподдерживаемая версия правил подсудности: {self.version}")
+        scale = self.fee_scale
+        if scale[0].start != 0:
+            raise ValueError("fee_scale: первая строка — from: 0")
+        # Шкала непрерывна: base строки = пошлина предыдущей строки на её границе
+        for prev, row in zip(scale, scale[1:]):
+            if row.start <= prev.start:
+                raise ValueError(f"fee_scale: from должны возрастать ({row.start})")
+            expected = prev.base + prev.rate * (row.start - prev.start)
+            if abs(expected - row.base) > 0.5:
+                raise ValueError(f"fee_scale: с {row.start:.0f} base {row.base:.0f}, по шкале {expected:.0f}")
+        return self
+
+
+# =========================
+# Скомпилированные правила
+# =========================
+@dataclass(frozen=True)
+class CategoryTable:
+    # Интервалы цены иска (bounds[i-1], bounds[i]]; последний — до бесконечности.
+    # Колонки — по элементу на интервал: len(bounds) + 1
+    category: str
+    bounds: tuple[float, ...]
+    levels: tuple[str, ...]
+    level_notes: tuple[str, ...]
+    fee_from: tuple[float, ...]
+    fee_base: tuple[float, ...]
+    fee_rate: tuple[float, ...]
+    fee_notes: tuple[str, ...]
+
+    def bracket(self, amount: float) -> int:
+        # Граница входит в нижний интервал: «цена иска, не превышающая 100 000»
+        return bisect_left(self.bounds, amount)
+
+    def fee(self, bracket: int, amount: float) -> int:
+        # Пошлина в полных рублях (п. 6 ст. 52 НК РФ: от 50 копеек — вверх)
+        fee = self.fee_base[bracket] + self.fee_rate[bracket] * (amount - self.fee_from[bracket])
+        return int(fee + 0.5)
+
+
+@dataclass(frozen=True)
+class JurisdictionRules:
+    version: int
+    fee_doc_types: frozenset[str]
+    categories: Mapping[str, CategoryTable]
+
+
+def _rub(amount: float) -> str:
+    return f"{amount:,.0f}".replace(",", " ")
+
+
+def _scale_fee(scale: list[_ScaleRowModel], fee_max: float, amount: float) -> float:
+    # Пошлина по шкале — только при компиляции таблиц
+    row = scale[max(0, bisect_left([r.start for r in scale], amount) - 1)]
+    return min(row.base + row.rate * (amount - row.start), fee_max)
+
+
+def _compile_category(cat_id: str, cat: _CategoryModel, model: _RulesModel) -> CategoryTable:
+    scale, fee_max = model.fee_scale, model.fee_max
+    # Цена, с которой шкала упирается в fee_max: дальше пошлина постоянна
+    last = scale[-1]
+    cap = last.start + (fee_max - last.base) / last.rate if last.rate else None
+    points = {r.start for r in scale[1:]}
+    points |= {p for p in (cap, cat.magistrate_max, cat.fee_exempt_up_to) if p}
+    bounds = tuple(sorted(points))
+
+    levels, level_notes, fee_from, fee_base, fee_rate, fee_notes = [], [], [], [], [], []
+    exempt_fee = _scale_fee(scale, fee_max, cat.fee_exempt_up_to) if cat.fee_exempt_up_to else 0.0
+    for i in range(len(bounds) + 1):
+        low = bounds[i - 1] if i else 0.0
+        # Уровень суда
+        if cat.magistrate_max is None:
+            levels.append(model.levels.district)
+            level_notes.append(f"районный суд: {cat.district_basis} (ст. 24 ГПК РФ)")
+        elif low < cat.magistrate_max:
+            levels.append(model.levels.magistrate)
+            level_notes.append(
+                f"мировой судья: {cat.magistrate_basis} при цене иска до {_rub(cat.magistrate_max)} руб. (ст. 23 ГПК РФ)"
+            )
+        else:
+            levels.append(model.levels.district)
+            level_notes.append(f"районный суд: цена иска больше {_rub(cat.magistrate_max)} руб. (ст. 24 ГПК РФ)")
+        # Пошлина: линейна на интервале, наклон — из строки шкалы (0 после fee_max)
+        row = scale[max(0, bisect_left([r.start for r in scale], low + 1e-9) - 1)]
+        rate = 0.0 if cap is not None and low >= cap else row.rate
+        if cat.fee_exempt or (cat.fee_exempt_up_to and low < cat.fee_exempt_up_to):
+            base, rate = 0.0, 0.0
+            limit = f" при цене иска до {_rub(cat.fee_exempt_up_to)} руб." if cat.fee_exempt_up_to else ""
+            note = f"освобождение: {cat.fee_exempt_basis}{limit} (ст. 333.36 НК РФ)"
+        elif cat.fee_exempt_up_to:
+            base = _scale_fee(scale, fee_max, low) - exempt_fee
+            note = (f"{cat.fee_exempt_basis}: пошлина уменьшена на пошлину с цены иска "
+                    f"{_rub(cat.fee_exempt_up_to)} руб. (ст. 333.36 НК РФ)")
+        else:
+            base = _scale_fee(scale, fee_max, low)
+            note = "по цене иска (ст. 333.19 НК РФ)"
+        fee_from.append(low)
+        fee_base.append(base)
+        fee_rate.append(rate)
+        fee_notes.append(note)
+    return CategoryTable(
+        category=cat_id,
+        bounds=bounds,
+        levels=tuple(levels),
+        level_notes=tuple(level_notes),
+        fee_from=tuple(fee_from),
+        fee_base=tuple(fee_base),
+        fee_rate=tuple(fee_rate),
+        fee_notes=tuple(fee_notes),
+    )
+
+
+def compile_rules(data: dict) -> JurisdictionRules:
+    model = _RulesModel.model_validate(data)
+    return JurisdictionRules(
+        version=model.version,
+        fee_doc_types=frozenset(model.fee_doc_types),
+        categories=MappingProxyType({
+            cat_id: _compile_category(cat_id, cat, model) for cat_id, cat in model.categories.items()
+        }),
+    )
+
+
+def load_rules(path: Path = RULES_PATH) -> JurisdictionRules:
+    with open(path, encoding="utf-8") as f:
+        return compile_rules(yaml.safe_load(f))
+
+
+# Кеш на процесс: файл перечитывается, только если изменился его mtime
+_cache: dict[Path, tuple[int, JurisdictionRules]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_rules(path: Path = RULES_PATH) -> JurisdictionRules:
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        rules = load_rules(path)
+        _cache[path] = (mtime, rules)
+        return rules
+
+
+def rules_version(path: Path = RULES_PATH) -> int:
+    # mtime загруженного файла — ключ кешей, производных от правил
+    get_rules(path)
+    return _cache[path][0]
+
+
+# =========================
+# Одна анкета
+# =========================
+@dataclass(frozen=True)
+class Suggestion:
+    court_level: str          # Courts.court_level
+    court_id: Optional[int]   # суд этого уровня в городе (регионе) истца; None — нет в справочнике
+    fee: int                  # госпошлина, руб.
+    level_note: str
+    fee_note: str
+
+
+@lru_cache(maxsize=65536)
+def _court_for(category: str, bracket: int, city: str, region: str, db_path: str,
+               rules_version: int, courts_version: int) -> Optional[int]:
+    # rules_version и courts_version — чтобы сбросить кеш при изменении
+    # kb/jurisdiction.yaml и справочника судов (CourtsVersion в базе, из любого процесса)
+    table = get_rules().categories[category]
+    return courts.find_court(table.levels[bracket], city, region, db_path)
+
+
+def _versions(db_path: Path | str) -> tuple[int, int]:
+    return rules_version(), courts.index_version(db_path)
+
+
+def suggest(
+    category: Optional[str],
+    amount: object,
+    city: str = "",
+    region: str = "",
+    doc_type: Optional[str] = "claim",
+    db_path: Path | str = DB_PATH,
+) -> Optional[Suggestion]:
+    # None — категория неизвестна или сумма не указана
+    rules = get_rules()
+    table = rules.categories.get(category or "")
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None
+    if table is None or not 0 < amount < math.inf:
+        return None
+    bracket = table.bracket(amount)
+    court_id = _court_for(
+        table.category, bracket, courts.place_key(city), courts.place_key(region), str(db_path),
+        *_versions(db_path),
+    )
+    if doc_type in rules.fee_doc_types:
+        fee, fee_note = table.fee(bracket, amount), table.fee_notes[bracket]
+    else:
+        fee, fee_note = 0, "пошлина уплачивается при подаче иска"
+    return Suggestion(table.levels[bracket], court_id, fee, table.level_notes[bracket], fee_note)
+
+
+# =========================
+# Пачка дел (DataFrame, по колонкам)
+# =========================
+def suggest_frame(df: pd.DataFrame, db_path: Path | str = DB_PATH) -> pd.DataFrame:
+    # Колонки df: category, amount, city, region, doc_type (опц.; нет — иск).
+    # -> DataFrame с индексом df: court_level, court_id, fee (NaN/None — не определено)
+    import numpy as np
+    import pandas as pd
+
+    rules = get_rules()
+    n = len(df)
+    amount = pd.to_numeric(df["amount"], errors="coerce").to_numpy(dtype=float)
+    category = df["category"].to_numpy(dtype=object)
+    bracket = np.full(n, -1)
+    level = np.full(n, None, dtype=object)
+    fee = np.full(n, np.nan)
+    for table in rules.categories.values():
+        rows = (category == table.category) & (amount > 0) & np.isfinite(amount)
+        if not rows.any():
+            continue
+        b = np.searchsorted(np.asarray(table.bounds), amount[rows], side="left")
+        bracket[rows] = b
+        level[rows] = np.asarray(table.levels, dtype=object)[b]
+        fees = np.asarray(table.fee_base)[b] + np.asarray(table.fee_rate)[b] * (amount[rows] - np.asarray(table.fee_from)[b])
+        fee[rows] = np.floor(fees + 0.5)
+    if "doc_type" in df:
+        fee[(~df["doc_type"].isin(list(rules.fee_doc_types))).to_numpy() & (bracket >= 0)] = 0
+
+    # Суд: по одному вызову _court_for на уникальную (категория, интервал, город, регион)
+    keys = pd.DataFrame({
+        "category": category,
+        "bracket": bracket,
+        "city": df["city"].map(courts.place_key).to_numpy(),
+        "region": df["region"].map(courts.place_key).to_numpy(),
+    })
+    codes, uniques = pd.MultiIndex.from_frame(keys).factorize()
+    versions = _versions()
+    found = np.array([
+        _court_for(c, int(b), city, region, str(db_path), *versions) if b >= 0 else None
+        for c, b, city, region in uniques
+    ] + [None], dtype=object)  # codes == -1 (NaN в ключе) -> последний элемент
+    court_id = pd.array(found[codes], dtype="Int64")
+    return pd.DataFrame({"court_level": level, "court_id": court_id, "fee": fee}, index=df.index)
+
+
+# =========================
+# Проверка базы
+# =========================
+CASES_SQL = """
+    SELECT c.id, c.category, c.doc_type, c.amount, c.court_id,
+           u.resident_city AS city, u.resident_region AS region,
+           ct.court_level AS chosen_level
+    FROM Cases c
+    LEFT JOIN Users u ON u.id = c.user_id
+    LEFT JOIN Courts ct ON ct.id = c.court_id
+"""
+
+
+def case_frames(conn: sqlite3.Connection, chunk_size: int = FRAME_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    import pandas as pd
+
+    yield from pd.read_sql_query(CASES_SQL, conn, index_col="id", chunksize=chunk_size)
+
+
+def check_cases(conn: sqlite3.Connection, db_path: Path | str = DB_PATH) -> pd.DataFrame:
+    # Дела, у которых уровень выбранного суда не совпадает с подсудностью по правилам.
+    # -> (case_id, category, amount, chosen_level, court_level, court_id, fee)
+    import pandas as pd
+
+    frames = []
+    for chunk in case_frames(conn):
+        found = suggest_frame(chunk, db_path)
+        chosen = chunk["chosen_level"].map(lambda v: v.strip().lower() if isinstance(v, str) else None)
+        wrong = found["court_level"].notna() & chosen.notna() & (chosen != found["court_level"])
+        frames.append(chunk.loc[wrong, ["category", "amount", "chosen_level"]].join(found[wrong]))
+    if not frames:
+        return pd.DataFrame(columns=["case_id", "category", "amount", "chosen_level", "court_level", "court_id", "fee"])
+    return pd.concat(frames).rename_axis("case_id").reset_index()
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.jurisdiction suggest КАТЕГОРИЯ СУММА [ГОРОД] [РЕГИОН] [--doc-type claim]
+    # python -m utils.jurisdiction check [--out mismatches.csv]
+    usage = (
+        "usage: python -m utils.jurisdiction suggest CATEGORY AMOUNT [CITY] [REGION] [--doc-type TYPE]"
+        " | check [--out FILE.csv]"
+    )
+    if not argv or argv[0] not in ("suggest", "check"):
+        raise SystemExit(usage)
+    if argv[0] == "suggest":
+        args = argv[1:]
+        doc_type = "claim"
+        if "--doc-type" in args:
+            i = args.index("--doc-type")
+            if i + 1 >= len(args):
+                raise SystemExit(usage)
+            doc_type = args[i + 1]
+            args = args[:i] + args[i + 2:]
+        if not 2 <= len(args) <= 4:
+            raise SystemExit(usage)
+        found = suggest(args[0], args[1], *args[2:], doc_type=doc_type)
+        if found is None:
+            raise SystemExit(f"неизвестная категория или сумма: {args[0]} {args[1]}")
+        court = "-"
+        if found.court_id is not None:
+            with get_pool().connection() as conn:
+                court = courts.get_court(conn, found.court_id)["name"]
+        print(f"{found.court_level}\t{court}\n{found.level_note}\n{found.fee} руб.: {found.fee_note}")
+        return
+
+    if len(argv) not in (1, 3) or (len(argv) == 3 and argv[1] != "--out"):
+        raise SystemExit(usage)
+    with get_pool().connection() as conn:
+        wrong = check_cases(conn)
+    for (chosen, expected), n in wrong.groupby(["chosen_level", "court_level"]).size().items():
+        print(f"{chosen} -> {expected}\t{n}")
+    print(f"{len(wrong)} cases filed with a court of another level")
+    if len(argv) == 3:
+        wrong.to_csv(Path(argv[2]), index=False, encoding="utf-8-sig")
+    if len(wrong):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,417 @@
+# utils/maintenance.py
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+import os
+import sqlite3
+import sys
+import time
+
+from utils.db import BUSY_TIMEOUT_MS, DB_PATH, connect
+
+# Обслуживание базы: архив заброшенных черновиков и уплотнение файла.
+# Черновик (status = 'draft'), который не менялся DRAFT_RETENTION_DAYS дней, вместе
+# с документами, доказательствами, сроками и NLP-анализом переносится в архив
+# за месяц создания дела: db/archive/cases-YYYY-MM.sqlite (подключается через ATTACH).
+# Удаление из рабочей базы идёт пачками по BATCH_SIZE дел в коротких транзакциях,
+# поэтому анкета и воркер ждут не дольше одной пачки. CaseStats, CasesFts и
+# OpponentStats поправляют триггеры на Cases; задачи дела удаляются каскадом
+# (задача, которая полгода стоит в очереди, уже не выполнится; выполняемые — не трогаем).
+# Затем: старые выполненные задачи, incremental_vacuum, ANALYZE и
+# wal_checkpoint(TRUNCATE). Воркер (utils/jobs.py) ставит проход раз в сутки.
+
+ARCHIVE_DIR = os.environ.get("APP_ARCHIVE_DIR")  # по умолчанию — archive/ рядом с файлом базы
+
+DRAFT_RETENTION_DAYS = 180
+JOBS_RETENTION_DAYS = 30   # выполненные задачи старше — удаляются (упавшие остаются)
+BATCH_SIZE = 100           # дел в одной транзакции записи: ~75 мс на синтетической базе
+BATCH_PAUSE_SECONDS = 0.05  # пауза между пачками — окно для других писателей
+VACUUM_STEP_PAGES = 2048   # страниц за один incremental_vacuum (8 МиБ при странице 4 КиБ)
+ANALYSIS_LIMIT = 1000      # строк индекса на оценку в ANALYZE: статистика приблизительная, но быстрая
+FTS_MERGE_PAGES = 500      # ограниченное слияние сегментов CasesFts после удаления дел
+CHECKPOINT_BUSY_MS = 1000  # TRUNCATE ждёт читателей, не пуская писателей, — ждём недолго
+
+# Таблицы дела в порядке внешних ключей: (таблица, колонка с id дела)
+ARCHIVED_TABLES = (
+    ("Cases", "id"),
+    ("NlpAnalysis", "case_id"),
+    ("Documents", "case_id"),
+    ("CaseEvidence", "case_id"),
+    ("Deadlines", "case_id"),
+)
+
+# При возврате из архива пользователь или суд могли быть уже удалены (ON DELETE SET NULL)
+_RESTORE_REFS = {
+    "user_id": "(SELECT id FROM main.Users WHERE id = a.user_id)",
+    "court_id": "(SELECT id FROM main.Courts WHERE id = a.court_id)",
+}
+
+_STALE_DRAFTS = """
+    SELECT id, substr(created_at, 1, 7) AS month
+    FROM Cases c
+    WHERE status = 'draft' AND coalesce(updated_at, created_at) < datetime('now', ?)
+      AND NOT EXISTS (SELECT 1 FROM Jobs j WHERE j.case_id = c.id AND j.status = 'running')
+"""
+
+
+@dataclass
+class Report:
+    archived_cases: int = 0
+    archive_files: list[str] = field(default_factory=list)
+    purged_jobs: int = 0
+    freed_pages: int = 0
+    auto_vacuum: str = ""
+    checkpoint_busy: bool = False
+    size_before: int = 0  # файл базы + WAL, байт
+    size_after: int = 0
+
+    @property
+    def reclaimed(self) -> int:
+        return self.size_before - self.size_after
+
+    def summary(self) -> str:
+        files = f" -> {', '.join(self.archive_files)}" if self.archive_files else ""
+        lines = [
+            f"archived {self.archived_cases} draft cases{files}",
+            f"purged {self.purged_jobs} done jobs",
+            f"freed {self.freed_pages} pages (auto_vacuum={self.auto_vacuum})",
+            f"size {self.size_before} -> {self.size_after} bytes, reclaimed {self.reclaimed}"
+            + (" (checkpoint busy: WAL is still in use by readers)" if self.checkpoint_busy else ""),
+        ]
+        return "\n".join(lines)
+
+
+def db_size(db_path: Path | str) -> int:
+    # Файл базы + WAL (как bench.run.db_size)
+    return sum(p.stat().st_size for p in (Path(db_path), Path(f"{db_path}-wal")) if p.exists())
+
+
+def archive_dir(conn: sqlite3.Connection) -> Path:
+    if ARCHIVE_DIR:
+        return Path(ARCHIVE_DIR)
+    return Path(conn.execute("PRAGMA database_list").fetchone()[2]).parent / "archive"
+
+
+def archive_path(directory: Path, month: str) -> Path:
+    return directory / f"cases-{month}.sqlite"
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> list[sqlite3.Row]:
+    return conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()
+
+
+def _marks(ids: list[int]) -> str:
+    return ",".join("?" * len(ids))
+
+
+# =========================
+# Архив черновиков
+# =========================
+def _prepare_archive(conn: sqlite3.Connection) -> None:
+    # Таблицы архива повторяют колонки рабочих (без внешних ключей и триггеров).
+    # Колонки, добавленные миграциями позже, дописываются в уже созданный архив.
+    for table, case_column in ARCHIVED_TABLES:
+        columns = _columns(conn, "main", table)
+        existing = {r["name"] for r in _columns(conn, "archive", table)}
+        if not existing:
+            pk = [r["name"] for r in sorted(columns, key=lambda r: r["pk"]) if r["pk"]]
+            defs = [f"{r['name']} {r['type']}".strip() for r in columns]
+            if table == "Cases":
+                defs.append("archived_at TEXT DEFAULT (datetime('now'))")
+            conn.execute(f"CREATE TABLE archive.{table} ({', '.join(defs)}, PRIMARY KEY ({', '.join(pk)}))")
+            if case_column != "id" and pk[0] != case_column:
+                conn.execute(f"CREATE INDEX archive.idx_{table.lower()}_case ON {table}({case_column})")
+            continue
+        for r in columns:
+            if r["name"] not in existing:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {r['name']} {r['type']}")
+
+
+def _copy(conn: sqlite3.Connection, ids: list[int], source: str, target: str, refs: dict[str, str]) -> None:
+    # Строки дел ids из source в target; совпадение ключа — строка заменяется
+    for table, case_column in ARCHIVED_TABLES:
+        names = [r["name"] for r in _columns(conn, "main", table)]
+        select = ", ".join(refs.get(n, f"a.{n}") for n in names)
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO {target}.{table} ({', '.join(names)})
+            SELECT {select} FROM {source}.{table} a WHERE a.{case_column} IN ({_marks(ids)})
+            """,
+            ids,
+        )
+
+
+def _archive_batch(conn: sqlite3.Connection, ids: list[int], age: str) -> int:
+    # 1. Копия в архив отдельной транзакцией (рабочая база не блокируется): при
+    #    WAL у рабочей базы общий COMMIT не атомарен между файлами, и удаление
+    #    не должно зафиксироваться раньше копии.
+    conn.execute("BEGIN")
+    try:
+        _copy(conn, ids, "main", "archive", {})
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    # 2. Дело всё ещё заброшенный черновик -> обновить копию и удалить из рабочей базы.
+    #    Файлы документов остаются: ссылку на них держит архив (Blobs.ref_count).
+    #    Дела, изменённые между транзакциями, из архива убираем.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        copied, ids = ids, [r[0] for r in conn.execute(
+            f"{_STALE_DRAFTS} AND c.id IN ({_marks(ids)})", (age, *ids)
+        )]
+        changed = sorted(set(copied) - set(ids))
+        for table, case_column in reversed(ARCHIVED_TABLES) if changed else ():
+            conn.execute(f"DELETE FROM archive.{table} WHERE {case_column} IN ({_marks(changed)})", changed)
+        if ids:
+            _copy(conn, ids, "main", "archive", {})
+            conn.execute(f"DELETE FROM main.Cases WHERE id IN ({_marks(ids)})", ids)
+            conn.execute(
+                f"""
+                INSERT INTO main.Blobs (file_path, ref_count)
+                SELECT file_path, count(*) FROM archive.Documents
+                WHERE case_id IN ({_marks(ids)}) AND file_path IS NOT NULL
+                GROUP BY file_path
+                ON CONFLICT(file_path) DO UPDATE SET ref_count = ref_count + excluded.ref_count
+                """,
+                ids,
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(ids)
+
+
+def archive_drafts(
+    conn: sqlite3.Connection,
+    days: int = DRAFT_RETENTION_DAYS,
+    batch: int = BATCH_SIZE,
+    dry_run: bool = False,
+) -> dict[str, int]:
+    # Соединение — отдельное, не из пула: ATTACH виден всем, кто возьмёт соединение
+    # после нас. -> {файл архива: перенесено дел}
+    age = f"-{int(days)} days"
+    by_month: dict[str, list[int]] = defaultdict(list)
+    for r in conn.execute(f"{_STALE_DRAFTS} ORDER BY id", (age,)):
+        if r["month"]:
+            by_month[r["month"]].append(r["id"])
+    directory = archive_dir(conn)
+    if dry_run:
+        return {str(archive_path(directory, m)): len(ids) for m, ids in sorted(by_month.items())}
+
+    moved: dict[str, int] = {}
+    for month, ids in sorted(by_month.items()):
+        path = archive_path(directory, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _prepare_archive(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            n = 0
+            for start in range(0, len(ids), batch):
+                n += _archive_batch(conn, ids[start:start + batch], age)
+                time.sleep(BATCH_PAUSE_SECONDS)
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        if n:
+            moved[str(path)] = n
+    return moved
+
+
+def find_archived(directory: Path, case_id: int) -> Optional[Path]:
+    # Архивов по одному на месяц — перебор файлов дешёвый
+    for path in sorted(directory.glob("cases-*.sqlite")):
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as arc:
+            if arc.execute("SELECT 1 FROM Cases WHERE id = ?", (case_id,)).fetchone():
+                return path
+    return None
+
+
+def restore_case(conn: sqlite3.Connection, case_id: int) -> Optional[Path]:
+    # Возвращает дело из архива в рабочую базу. -> файл архива или None (не найдено)
+    path = find_archived(archive_dir(conn), case_id)
+    if path is None:
+        return None
+    conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Дело уже в рабочей базе — прошлый возврат прервался после COMMIT
+            # рабочей базы: остаётся удалить копию
+            if conn.execute("SELECT 1 FROM main.Cases WHERE id = ?", (case_id,)).fetchone() is None:
+                _copy(conn, [case_id], "archive", "main", _RESTORE_REFS)
+                # Триггер на Documents добавил ссылки на файлы; ссылку архива снимаем
+                conn.execute(
+                    """
+                    UPDATE main.Blobs SET ref_count = ref_count - (
+                      SELECT count(*) FROM archive.Documents d
+                      WHERE d.case_id = ? AND d.file_path = Blobs.file_path
+                    )
+                    WHERE file_path IN (SELECT file_path FROM archive.Documents WHERE case_id = ?)
+                    """,
+                    (case_id, case_id),
+                )
+                # Иначе следующий проход снова унесёт черновик в архив
+                conn.execute("UPDATE main.Cases SET updated_at = datetime('now') WHERE id = ?", (case_id,))
+            for table, case_column in reversed(ARCHIVED_TABLES):
+                conn.execute(f"DELETE FROM archive.{table} WHERE {case_column} = ?", (case_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return path
+
+
+# =========================
+# Уплотнение
+# =========================
+def purge_jobs(conn: sqlite3.Connection, days: int = JOBS_RETENTION_DAYS, batch: int = BATCH_SIZE * 10) -> int:
+    # Старые задачи — в начале таблицы, поэтому выборка по id находит их сразу
+    purged = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """
+                DELETE FROM Jobs WHERE id IN (
+                  SELECT id FROM Jobs
+                  WHERE status = 'done' AND updated_at < datetime('now', ?)
+                  ORDER BY id LIMIT ?
+                )
+                """,
+                (f"-{int(days)} days", batch),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        purged += cur.rowcount
+        if cur.rowcount < batch:
+            return purged
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+def incremental_vacuum(conn: sqlite3.Connection, step: int = VACUUM_STEP_PAGES) -> int:
+    # Свободные страницы отдаются файлу порциями: каждая — своя короткая транзакция.
+    # Работает только при auto_vacuum = INCREMENTAL (новые базы, см. utils/db_init.py;
+    # старые переводятся один раз: python -m utils.maintenance run --full-vacuum). -> страниц
+    freed = 0
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free:
+        # fetchall(): без него модуль sqlite3 выполняет только первый шаг прагмы
+        conn.execute(f"PRAGMA incremental_vacuum({min(free, step)})").fetchall()
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= free:
+            break
+        freed += free - left
+        free = left
+    return freed
+
+
+def compact(conn: sqlite3.Connection, full_vacuum: bool = False, report: Optional[Report] = None) -> Report:
+    report = report or Report()
+    modes = {0: "none", 1: "full", 2: "incremental"}
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2 and full_vacuum:
+        # VACUUM переписывает файл целиком и держит блокировку всё это время
+        before = conn.execute("PRAGMA page_count").fetchone()[0]
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        report.freed_pages += max(0, before - conn.execute("PRAGMA page_count").fetchone()[0])
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    report.auto_vacuum = modes.get(mode, str(mode))
+    if mode == 2:
+        report.freed_pages += incremental_vacuum(conn)
+
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE")
+
+    # Страницы, освобождённые в WAL-режиме, уходят из файла только при контрольной точке
+    conn.execute(f"PRAGMA busy_timeout = {CHECKPOINT_BUSY_MS}")
+    try:
+        busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    report.checkpoint_busy = bool(busy)
+    return report
+
+
+def run(
+    db_path: Path | str = DB_PATH,
+    days: int = DRAFT_RETENTION_DAYS,
+    batch: int = BATCH_SIZE,
+    full_vacuum: bool = False,
+) -> Report:
+    # Полный проход обслуживания (задача maintenance воркера и CLI)
+    report = Report(size_before=db_size(db_path))
+    conn = connect(db_path)
+    try:
+        moved = archive_drafts(conn, days, batch)
+        report.archived_cases = sum(moved.values())
+        report.archive_files = [Path(p).name for p in moved]
+        if moved:
+            # Удалённые строки CasesFts — пометки в сегментах, до слияния они занимают место
+            conn.execute("INSERT INTO CasesFts (CasesFts, rank) VALUES ('merge', ?)", (FTS_MERGE_PAGES,))
+        report.purged_jobs = purge_jobs(conn)
+        compact(conn, full_vacuum, report)
+    finally:
+        conn.close()
+    report.size_after = db_size(db_path)
+    return report
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.maintenance run [--days 180] [--batch 200] [--full-vacuum]
+    # python -m utils.maintenance pending [--days 180]   (что будет перенесено, без изменений)
+    # python -m utils.maintenance restore ID_ДЕЛА
+    usage = (
+        "usage: python -m utils.maintenance run [--days N] [--batch N] [--full-vacuum]"
+        " | pending [--days N] | restore CASE_ID"
+    )
+    if not argv or argv[0] not in ("run", "pending", "restore"):
+        raise SystemExit(usage)
+    flags = {"--full-vacuum"} & set(argv)
+    rest = [a for a in argv[1:] if a not in flags]
+    if argv[0] == "restore":
+        if len(rest) != 1 or not rest[0].isdigit():
+            raise SystemExit(usage)
+        conn = connect()
+        try:
+            path = restore_case(conn, int(rest[0]))
+        finally:
+            conn.close()
+        if path is None:
+            raise SystemExit(f"дело {rest[0]} в архиве не найдено")
+        print(f"restored case {rest[0]} from {path}")
+        return
+
+    opts = dict(zip(rest[::2], rest[1::2]))
+    allowed = {"--days", "--batch"} if argv[0] == "run" else {"--days"}
+    if len(rest) % 2 or set(opts) - allowed or (flags and argv[0] != "run"):
+        raise SystemExit(usage)
+    days = int(opts.get("--days", DRAFT_RETENTION_DAYS))
+    if argv[0] == "pending":
+        conn = connect()
+        try:
+            pending = archive_drafts(conn, days, dry_run=True)
+        finally:
+            conn.close()
+        for path, n in pending.items():
+            print(n, path, sep="\t")
+        print(f"{sum(pending.values())} draft cases older than {days} days")
+        return
+    report = run(days=days, batch=int(opts.get("--batch", BATCH_SIZE)), full_vacuum=bool(flags))
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
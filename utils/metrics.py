@@ -0,0 +1,285 @@
+# utils/metrics.py
+from __future__ import annotations
+from collections import deque
+from contextlib import nullcontext
+from functools import lru_cache, wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# Замеры в процессе: разделы страницы, save_case, генерация документов и каждый
+# SQL-запрос пула. Включаются APP_METRICS=1 при старте процесса; выключенные
+# timer() отдают общий пустой контекст, timed() возвращает функцию без обёртки,
+# а пул создаёт обычные соединения без трассировки — накладных расходов нет.
+# Квантили считаются по последним WINDOW замерам каждого ряда.
+#
+# Выгрузка в формате Prometheus:
+#   APP_METRICS_PORT=9101 -> http://127.0.0.1:9101/metrics (APP_METRICS_HOST)
+#   APP_METRICS_FILE=/var/lib/node_exporter/app.prom -> файл раз в EXPORT_EVERY_SECONDS
+# У каждого процесса (streamlit, воркер utils.jobs) — свои порт или файл.
+
+ENABLED = os.environ.get("APP_METRICS", "").lower() in ("1", "true", "yes")
+
+WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+EXPORT_EVERY_SECONDS = 15.0
+SQL_KEY_CHARS = 160  # длиннее — обрезаем, чтобы число рядов оставалось ограниченным
+
+SECTION_SECONDS = "app_section_seconds"
+SQL_SECONDS = "app_sql_seconds"
+SQL_STATEMENTS = "app_sql_statements_total"
+
+_HELP = {
+    SECTION_SECONDS: ("summary", "section", "Время выполнения разделов и функций, с"),
+    SQL_SECONDS: ("summary", "statement", "Время вызова execute/executemany пула, с"),
+    SQL_STATEMENTS: ("counter", "statement", "Выполненные SQLite выражения, включая выражения триггеров"),
+}
+
+F = TypeVar("F", bound=Callable)
+
+
+class _Series:
+    __slots__ = ("window", "count", "total")
+
+    def __init__(self) -> None:
+        self.window: deque[float] = deque(maxlen=WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+
+_series: dict[tuple[str, str], _Series] = {}
+_counters: dict[tuple[str, str], int] = {}
+_lock = threading.Lock()
+
+
+def observe(metric: str, label: str, seconds: float) -> None:
+    with _lock:
+        series = _series.get((metric, label))
+        if series is None:
+            series = _series[(metric, label)] = _Series()
+        series.window.append(seconds)
+        series.count += 1
+        series.total += seconds
+
+
+def increment(metric: str, label: str, n: int = 1) -> None:
+    with _lock:
+        _counters[(metric, label)] = _counters.get((metric, label), 0) + n
+
+
+def reset() -> None:
+    with _lock:
+        _series.clear()
+        _counters.clear()
+
+
+# =========================
+# Замеры кода
+# =========================
+class _Timer:
+    __slots__ = ("label", "start")
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(SECTION_SECONDS, self.label, time.perf_counter() - self.start)
+
+
+_NULL = nullcontext()
+
+
+def timer(label: str):
+    # with metrics.timer("app.rerun"): ...
+    return _Timer(label) if ENABLED else _NULL
+
+
+def timed(label: Optional[str] = None) -> Callable[[F], F]:
+    # @metrics.timed("app.save_case"); решение принимается при импорте модуля
+    def decorate(fn: F) -> F:
+        if not ENABLED:
+            return fn
+        name = label or f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(SECTION_SECONDS, name, time.perf_counter() - start)
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+
+# =========================
+# SQL: время вызовов пула + выражения из трассировки SQLite
+# =========================
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\bx'[0-9a-fA-F]*'|-?\b\d+(?:\.\d+)?(?:e[+-]?\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def sql_key(sql: str) -> str:
+    # Трассировка отдаёт выражения с подставленными значениями: литералы -> ?,
+    # чтобы одно выражение с разными параметрами было одним рядом
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()[:SQL_KEY_CHARS]
+
+
+def _trace(statement: str) -> None:
+    # Вызывается SQLite на каждое выражение, в том числе на выражения внутри
+    # триггеров ('-- TRIGGER name') и executescript, которые обёртки ниже не видят
+    increment(SQL_STATEMENTS, sql_key(statement))
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение с замером execute/executemany (utils.db.connect при APP_METRICS=1).
+
+    Для SELECT замеряется выполнение до первой строки; чтение остальных строк
+    (fetchall) в замер не входит.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def execute(self, sql, parameters=(), /):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            observe(SQL_SECONDS, sql_key(sql), time.perf_counter() - start)
+
+    def executemany(self, sql, parameters, /):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            observe(SQL_SECONDS, sql_key(sql), time.perf_counter() - start)
+
+    def executescript(self, script, /):
+        start = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            observe(SQL_SECONDS, "<script>", time.perf_counter() - start)
+
+
+def connection_factory() -> type[sqlite3.Connection]:
+    return ProfiledConnection if ENABLED else sqlite3.Connection
+
+
+# =========================
+# Снимок и выгрузка
+# =========================
+def _quantiles(window: list[float]) -> list[float]:
+    ordered = sorted(window)
+    return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES]
+
+
+def snapshot() -> list[dict]:
+    # Для отладочной панели: ряд -> count, sum, p50/p95/p99 (по окну), по убыванию суммы
+    with _lock:
+        series = [(metric, label, list(s.window), s.count, s.total) for (metric, label), s in _series.items()]
+        counters = dict(_counters)
+    rows = []
+    for metric, label, window, count, total in series:
+        p50, p95, p99 = _quantiles(window)
+        rows.append({
+            "metric": metric, "label": label, "count": count, "sum": total,
+            "p50": p50, "p95": p95, "p99": p99,
+            "statements": counters.get((SQL_STATEMENTS, label)) if metric == SQL_SECONDS else None,
+        })
+    return sorted(rows, key=lambda r: r["sum"], reverse=True)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render() -> str:
+    # Текстовый формат Prometheus 0.0.4
+    with _lock:
+        series = sorted((k, list(s.window), s.count, s.total) for k, s in _series.items())
+        counters = sorted(_counters.items())
+    lines: list[str] = []
+    for metric, (kind, label_name, help_text) in _HELP.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        if kind == "summary":
+            for (name, label), window, count, total in series:
+                if name != metric:
+                    continue
+                labels = f'{label_name}="{_escape(label)}"'
+                for q, value in zip(QUANTILES, _quantiles(window)):
+                    lines.append(f'{metric}{{{labels},quantile="{q}"}} {value:.6g}')
+                lines.append(f"{metric}_sum{{{labels}}} {total:.6g}")
+                lines.append(f"{metric}_count{{{labels}}} {count}")
+        else:
+            for (name, label), value in counters:
+                if name == metric:
+                    lines.append(f'{metric}{{{label_name}="{_escape(label)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Path | str) -> None:
+    # Атомарно (через временный файл) — textfile collector не прочитает половину
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(render(), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass  # опрос раз в несколько секунд не должен засорять лог
+
+
+_exporter_started = False
+
+
+def start_exporter() -> None:
+    # Идемпотентно; без APP_METRICS или без порта/файла ничего не делает
+    global _exporter_started
+    with _lock:
+        if _exporter_started or not ENABLED:
+            return
+        _exporter_started = True
+    port = os.environ.get("APP_METRICS_PORT")
+    if port:
+        try:
+            server = ThreadingHTTPServer((os.environ.get("APP_METRICS_HOST", "127.0.0.1"), int(port)), _Handler)
+        except OSError as e:
+            print(f"metrics: порт {port} недоступен: {e}", file=sys.stderr)
+        else:
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    path = os.environ.get("APP_METRICS_FILE")
+    if path:
+        def loop() -> None:
+            while True:
+                time.sleep(EXPORT_EVERY_SECONDS)
+                try:
+                    write_textfile(path)
+                except OSError as e:
+                    print(f"metrics: не удалось записать {path}: {e}", file=sys.stderr)
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
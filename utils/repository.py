@@ -0,0 +1,290 @@
+# utils/repository.py
+from __future__ import annotations
+from typing import Iterable, Iterator, Mapping, Optional, Sequence, TypedDict
+import sqlite3
+
+from utils.text import SEARCH_COLUMNS, search_columns
+from utils.users import normalize_email, normalize_phone
+
+# Функции принимают соединение первым аргументом, чтобы несколько вставок
+# можно было выполнить в одной транзакции ConnectionPool.transaction().
+
+
+class UserRow(TypedDict, total=False):
+    fio: str
+    email: Optional[str]
+    phone: Optional[str]
+    resident_region: str
+    resident_city: str
+    resident_address: str
+
+
+class CaseRow(TypedDict, total=False):
+    user_id: int
+    court_id: Optional[int]
+    category: str
+    doc_type: str
+    description: str
+    opponent_name: str
+    opponent_address: Optional[str]
+    amount: float
+    event_date: str
+    status: str
+    court_name_override: Optional[str]
+    court_address_override: Optional[str]
+
+
+class DocumentRow(TypedDict, total=False):
+    case_id: int
+    doc_type: Optional[str]
+    template_name: Optional[str]
+    file_path: Optional[str]
+    mime_type: Optional[str]
+    file_size: Optional[int]
+    kb_articles: Optional[str]
+    render_key: Optional[str]
+
+
+class DeadlineRow(TypedDict, total=False):
+    case_id: int
+    title: str
+    due_date: str
+    status: str
+    source: Optional[str]
+
+
+# =========================
+# Пользователи
+# =========================
+def insert_user(conn: sqlite3.Connection, user: UserRow) -> int:
+    cur = conn.execute(
+        """
+        INSERT INTO Users (fio, email, phone,
+                           resident_region, resident_city, resident_address)
+        VALUES (:fio, :email, :phone,
+                :resident_region, :resident_city, :resident_address)
+        """,
+        user,
+    )
+    return cur.lastrowid
+
+
+def upsert_user(conn: sqlite3.Connection, user: UserRow) -> int:
+    # Совпадение по email, иначе по телефону -> обновляем профиль найденного пользователя.
+    # Телефон/email, уже принадлежащий другому пользователю, не переносим.
+    cur = conn.execute(
+        """
+        INSERT INTO Users (fio, email, phone,
+                           resident_region, resident_city, resident_address,
+                           email_key, phone_key)
+        VALUES (:fio, :email, :phone,
+                :resident_region, :resident_city, :resident_address,
+                :email_key, :phone_key)
+        ON CONFLICT(email_key) WHERE email_key IS NOT NULL DO UPDATE SET
+          fio = excluded.fio,
+          email = excluded.email,
+          resident_region = excluded.resident_region,
+          resident_city = excluded.resident_city,
+          resident_address = excluded.resident_address,
+          phone = CASE WHEN excluded.phone_key IS NULL OR EXISTS (
+              SELECT 1 FROM Users u WHERE u.phone_key = excluded.phone_key AND u.id <> Users.id
+            ) THEN phone ELSE excluded.phone END,
+          phone_key = CASE WHEN excluded.phone_key IS NULL OR EXISTS (
+              SELECT 1 FROM Users u WHERE u.phone_key = excluded.phone_key AND u.id <> Users.id
+            ) THEN phone_key ELSE excluded.phone_key END
+        ON CONFLICT(phone_key) WHERE phone_key IS NOT NULL DO UPDATE SET
+          fio = excluded.fio,
+          phone = excluded.phone,
+          resident_region = excluded.resident_region,
+          resident_city = excluded.resident_city,
+          resident_address = excluded.resident_address,
+          email = CASE WHEN excluded.email_key IS NULL THEN email ELSE excluded.email END,
+          email_key = coalesce(excluded.email_key, email_key)
+        RETURNING id
+        """,
+        {
+            "email": None, "phone": None, **user,
+            "email_key": normalize_email(user.get("email")),
+            "phone_key": normalize_phone(user.get("phone")),
+        },
+    )
+    return cur.fetchone()[0]
+
+
+def get_user(conn: sqlite3.Connection, user_id: int) -> Optional[sqlite3.Row]:
+    return conn.execute("SELECT * FROM Users WHERE id = ?", (user_id,)).fetchone()
+
+
+# =========================
+# Дела
+# =========================
+def insert_case(conn: sqlite3.Connection, case: CaseRow) -> int:
+    # Колонки поиска (SEARCH_COLUMNS) считаются здесь: триггеры переносят их в CasesFts
+    cur = conn.execute(
+        f"""
+        INSERT INTO Cases (user_id, court_id, category, doc_type, description,
+                           opponent_name, opponent_address,
+                           amount, event_date, status,
+                           court_name_override, court_address_override,
+                           {", ".join(SEARCH_COLUMNS)})
+        VALUES (:user_id, :court_id, :category, :doc_type, :description,
+                :opponent_name, :opponent_address,
+                :amount, :event_date, :status,
+                :court_name_override, :court_address_override,
+                {", ".join(":" + c for c in SEARCH_COLUMNS)})
+        """,
+        {"doc_type": None, **case, **search_columns(case.get("opponent_name"), case.get("description"))},
+    )
+    return cur.lastrowid
+
+
+def get_case(conn: sqlite3.Connection, case_id: int) -> Optional[sqlite3.Row]:
+    return conn.execute("SELECT * FROM Cases WHERE id = ?", (case_id,)).fetchone()
+
+
+def list_cases_by_user(conn: sqlite3.Connection, user_id: int) -> list[sqlite3.Row]:
+    # idx_cases_user
+    return conn.execute(
+        "SELECT * FROM Cases WHERE user_id = ? ORDER BY id DESC", (user_id,)
+    ).fetchall()
+
+
+def update_case_status(
+    conn: sqlite3.Connection, case_id: int, status: str, only_from: Sequence[str] = ()
+) -> None:
+    # only_from: менять статус только из перечисленных (повтор фоновой задачи
+    # не должен откатить дело, ушедшее дальше по этапам)
+    guard = f" AND status IN ({','.join('?' * len(only_from))})" if only_from else ""
+    conn.execute(
+        f"UPDATE Cases SET status = ?, updated_at = datetime('now') WHERE id = ?{guard}",
+        (status, case_id, *only_from),
+    )
+
+
+# Дело в виде анкеты: поля формы, профиль истца и отмеченные доказательства
+# («id1;id2»). Выгрузка (utils/bulk.py) и перепроверка правил (utils/validation.py).
+CASE_FORMS_SQL = """
+    SELECT c.id, c.status, c.created_at,
+           u.fio, u.email, u.phone,
+           u.resident_region AS region, u.resident_city AS city, u.resident_address AS address,
+           c.court_id, c.court_name_override, c.court_address_override,
+           c.opponent_name, c.opponent_address, c.amount, c.event_date, c.description,
+           c.category, c.doc_type,
+           (SELECT group_concat(e.evidence_id, ';') FROM CaseEvidence e
+            WHERE e.case_id = c.id AND e.present = 1) AS evidence
+    FROM Cases c
+    LEFT JOIN Users u ON u.id = c.user_id
+    WHERE (:category IS NULL OR c.category = :category)
+      AND (:status IS NULL OR c.status = :status)
+    ORDER BY c.id
+"""
+
+
+def iter_case_forms(
+    conn: sqlite3.Connection,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    batch: int = 1000,
+) -> Iterator[sqlite3.Row]:
+    # Курсор читается порциями — все дела в память не загружаются
+    cur = conn.execute(CASE_FORMS_SQL, {"category": category, "status": status})
+    while rows := cur.fetchmany(batch):
+        yield from rows
+
+
+# =========================
+# Доказательства по делу
+# =========================
+def insert_case_evidence(
+    conn: sqlite3.Connection, case_id: int, present: Mapping[str, int]
+) -> None:
+    # document_id — последний файл, загруженный к этому доказательству
+    # (Documents.doc_type = 'evidence:<id>'), поэтому вызывать после insert_documents()
+    conn.executemany(
+        """
+        INSERT INTO CaseEvidence (case_id, evidence_id, present, document_id)
+        VALUES (:case_id, :evidence_id, :present, (
+          SELECT max(id) FROM Documents
+          WHERE case_id = :case_id AND doc_type = 'evidence:' || :evidence_id
+        ))
+        ON CONFLICT(case_id, evidence_id) DO UPDATE SET
+          present = excluded.present,
+          document_id = coalesce(excluded.document_id, document_id)
+        """,
+        (
+            {"case_id": case_id, "evidence_id": ev_id, "present": int(bool(flag))}
+            for ev_id, flag in present.items()
+        ),
+    )
+
+
+def list_case_evidence(conn: sqlite3.Connection, case_id: int) -> dict[str, int]:
+    return dict(conn.execute(
+        "SELECT evidence_id, present FROM CaseEvidence WHERE case_id = ?", (case_id,)
+    ).fetchall())
+
+
+# =========================
+# Документы
+# =========================
+def insert_documents(conn: sqlite3.Connection, docs: Iterable[DocumentRow]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO Documents (case_id, doc_type, template_name,
+                               file_path, mime_type, file_size, kb_articles, render_key)
+        VALUES (:case_id, :doc_type, :template_name,
+                :file_path, :mime_type, :file_size, :kb_articles, :render_key)
+        """,
+        (
+            {"doc_type": None, "template_name": None, "file_path": None,
+             "mime_type": None, "file_size": None, "kb_articles": None,
+             "render_key": None, **d}
+            for d in docs
+        ),
+    )
+
+
+def list_documents(conn: sqlite3.Connection, case_id: int) -> list[sqlite3.Row]:
+    # idx_docs_case_id
+    return conn.execute(
+        "SELECT * FROM Documents WHERE case_id = ? ORDER BY id", (case_id,)
+    ).fetchall()
+
+
+# =========================
+# Сроки/этапы
+# =========================
+def insert_deadlines(conn: sqlite3.Connection, deadlines: Iterable[DeadlineRow]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO Deadlines (case_id, title, due_date, status, source)
+        VALUES (:case_id, :title, :due_date, :status, :source)
+        """,
+        ({"status": "planned", "source": None, **d} for d in deadlines),
+    )
+
+
+def upsert_deadlines(conn: sqlite3.Connection, deadlines: Iterable[DeadlineRow], today: str) -> None:
+    # Сроки по правилам (source не NULL): пересчёт обновляет строку, а не добавляет
+    # новую; выполненный срок остаётся 'done', прошедший сразу помечается 'overdue'
+    conn.executemany(
+        """
+        INSERT INTO Deadlines (case_id, title, due_date, status, source)
+        VALUES (:case_id, :title, :due_date,
+                CASE WHEN :due_date < :today THEN 'overdue' ELSE 'planned' END, :source)
+        ON CONFLICT(case_id, source) WHERE source IS NOT NULL DO UPDATE SET
+          title = excluded.title,
+          due_date = excluded.due_date,
+          status = CASE WHEN status = 'done' THEN 'done' ELSE excluded.status END,
+          updated_at = datetime('now')
+        WHERE title IS NOT excluded.title OR due_date IS NOT excluded.due_date
+        """,
+        ({**d, "today": today} for d in deadlines),
+    )
+
+
+def list_deadlines(conn: sqlite3.Connection, case_id: int) -> list[sqlite3.Row]:
+    # idx_dead_case_due
+    return conn.execute(
+        "SELECT * FROM Deadlines WHERE case_id = ? ORDER BY due_date", (case_id,)
+    ).fetchall()
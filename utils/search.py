@@ -0,0 +1,306 @@
+# utils/search.py
+from __future__ import annotations
+from functools import lru_cache
+from typing import Optional
+import sqlite3
+import sys
+
+from utils import metrics
+from utils.db import get_pool
+from utils.text import SEARCH_COLUMNS, opponent_key, search_columns, tokenize
+
+# Поиск по делам: ответчик и описание (CasesFts, миграции 10 и 12) и повторяющиеся
+# ответчики (OpponentStats). Запрос нормализуется тем же стеммером, что и текст
+# при индексации (utils/text.py); недописанное последнее слово ищется по началу.
+# FTS5 отдаёт совпадения в порядке убывания rowid и дальше не читает, поэтому
+# выборка ограничена WINDOW последних совпавших дел. bm25 же для IDF обходит весь
+# список дел каждого слова: слово из половины дел («товар») стоит ~20 мс на 1 млн
+# дел, а ранжирует не лучше даты. Поэтому по bm25 сортируем, только если все слова
+# запроса редкие (RANK_MAX_SHARE), иначе — новые дела первыми. Число дел со словом
+# берётся из CasesFtsVocab и кешируется на процесс.
+
+FIELDS = ("opponent", "description")
+WINDOW = 2000
+LIMIT = 20
+RANK_MAX_SHARE = 0.05   # слово из большей доли дел не ранжирует (и дорого для bm25)...
+RANK_MIN_DOCS = 1000    # ...но в небольшой базе ранжируем всегда: обход дешёвый
+SIMILAR_TERMS = 8       # похожие дела ищутся по стольким самым редким словам описания
+MIN_CASES = 2  # ответчик «повторяется», если дел против него не меньше
+REFRESH_CHUNK = 5000  # дел на пачку при пересчёте колонок поиска
+
+# Веса bm25 для колонок CasesFts: opponent, description
+_RANK = "bm25(CasesFts, 4.0, 1.0)"
+
+_CASE_COLUMNS = "c.id, c.opponent_name, c.category, c.doc_type, c.status, c.amount, c.created_at, c.description"
+
+
+# =========================
+# Частоты слов
+# =========================
+def _count_docs(conn: sqlite3.Connection, term: str, prefix: bool) -> int:
+    if prefix:
+        # Все термы с этим началом: [term, term с увеличенной последней буквой)
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        row = conn.execute(
+            "SELECT total(doc) FROM CasesFtsVocab WHERE term >= ? AND term < ?", (term, upper)
+        ).fetchone()
+    else:
+        row = conn.execute("SELECT doc FROM CasesFtsVocab WHERE term = ?", (term,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+@lru_cache(maxsize=65536)
+def _doc_freq_cached(db_file: str, term: str, prefix: bool) -> int:
+    # Частоты меняются медленно, для выбора редких слов точность не нужна
+    with get_pool(db_file).connection() as conn:
+        return _count_docs(conn, term, prefix)
+
+
+def doc_freq(conn: sqlite3.Connection, term: str, prefix: bool = False) -> int:
+    # -> число дел, в которых есть терм (основа слова)
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not db_file:  # база в памяти — без кеша
+        return _count_docs(conn, term, prefix)
+    return _doc_freq_cached(db_file, term, prefix)
+
+
+def _max_ranked_docs(conn: sqlite3.Connection) -> float:
+    # Порог «редкого» слова; число дел оцениваем по max(id), без прохода по таблице
+    total = conn.execute("SELECT coalesce(max(id), 0) FROM Cases").fetchone()[0]
+    return max(RANK_MAX_SHARE * total, RANK_MIN_DOCS)
+
+
+# =========================
+# Поиск
+# =========================
+def match_query(query: str, field: Optional[str] = None, prefix: bool = False) -> Optional[str]:
+    # Текст запроса -> выражение MATCH (все слова); prefix — последнее слово по началу.
+    # None — искать нечего
+    if field is not None and field not in FIELDS:
+        raise ValueError(f"неизвестное поле поиска: {field} ({', '.join(FIELDS)})")
+    stems = tokenize(query)
+    if not stems:
+        return None
+    terms = [f'"{s}"' for s in stems]
+    if prefix:
+        terms[-1] += "*"
+    expr = " AND ".join(terms)
+    return f"{field} : ({expr})" if field else expr
+
+
+def _window(conn: sqlite3.Connection, match: str, ranked: bool, limit: int, window: int,
+            exclude: Optional[int] = None) -> list[dict]:
+    # Сортировка и LIMIT — до соединения с Cases: строки дел читаются только для выдачи
+    order = "score, rowid DESC" if ranked else "rowid DESC"
+    rows = conn.execute(
+        f"""
+        SELECT {_CASE_COLUMNS}, f.score
+        FROM (
+          SELECT rowid, score FROM (
+            SELECT rowid, {_RANK if ranked else "NULL"} AS score
+            FROM CasesFts
+            WHERE CasesFts MATCH ? AND rowid IS NOT ?
+            ORDER BY rowid DESC
+            LIMIT ?
+          )
+          ORDER BY {order}
+          LIMIT ?
+        ) f
+        JOIN Cases c ON c.id = f.rowid
+        ORDER BY {order.replace("rowid", "c.id")}
+        """,
+        (match, exclude, window, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+@metrics.timed("search.search_cases")
+def search_cases(
+    conn: sqlite3.Connection,
+    query: str,
+    field: Optional[str] = None,
+    limit: int = LIMIT,
+    window: int = WINDOW,
+) -> list[dict]:
+    # -> дела, все слова запроса; score — bm25 (меньше — лучше) или None, если
+    # в запросе есть частые слова и дела отсортированы от новых к старым
+    stems = tokenize(query)
+    if not stems:
+        return []
+    freqs = [doc_freq(conn, s) for s in stems]
+    # Последнего слова нет в индексе — скорее всего, оно недописано: ищем по началу.
+    # Всегда так не делаем: FTS5 собирает все термы с этим началом целиком
+    prefix = freqs[-1] == 0
+    if prefix:
+        freqs[-1] = doc_freq(conn, stems[-1], prefix=True)
+    max_docs = _max_ranked_docs(conn)
+    ranked = all(df <= max_docs for df in freqs)
+    match = match_query(query, field, prefix)
+    return _window(conn, match, ranked, limit, window)
+
+
+@metrics.timed("search.similar_cases")
+def similar_cases(
+    conn: sqlite3.Connection,
+    text: str,
+    limit: int = 10,
+    exclude: Optional[int] = None,
+    window: int = WINDOW,
+) -> list[dict]:
+    # Дела с похожим описанием: любое из SIMILAR_TERMS самых редких слов текста,
+    # по bm25. Слова из большой доли дел не различают описания и отбрасываются.
+    max_docs = _max_ranked_docs(conn)
+    freqs = {s: doc_freq(conn, s) for s in set(tokenize(text))}
+    rare = sorted((df, s) for s, df in freqs.items() if 0 < df <= max_docs)[:SIMILAR_TERMS]
+    if not rare:
+        return []
+    match = "description : (" + " OR ".join(f'"{s}"' for _, s in rare) + ")"
+    return _window(conn, match, True, limit, window, exclude)
+
+
+# =========================
+# Повторяющиеся ответчики
+# =========================
+def top_opponents(conn: sqlite3.Connection, min_cases: int = MIN_CASES, limit: int = 50) -> list[dict]:
+    # Ответчики с наибольшим числом дел — по индексу idx_opponent_stats_cases
+    rows = conn.execute(
+        """
+        SELECT opponent_key, name, cases, amount_sum
+        FROM OpponentStats
+        WHERE cases >= ?
+        ORDER BY cases DESC
+        LIMIT ?
+        """,
+        (min_cases, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def opponent_cases(conn: sqlite3.Connection, name_or_key: str, limit: int = 100) -> list[dict]:
+    # Дела против ответчика: наименование в любом написании («Ромашка, ООО») или ключ
+    key = opponent_key(name_or_key)
+    if key is None:
+        return []
+    rows = conn.execute(
+        """
+        SELECT id, opponent_name, category, doc_type, status, amount, created_at
+        FROM Cases
+        WHERE opponent_key = ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (key, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+# =========================
+# Обслуживание
+# =========================
+def refresh_columns(conn: sqlite3.Connection, chunk: int = REFRESH_CHUNK) -> int:
+    # Пересчёт колонок поиска Cases (SEARCH_COLUMNS) в Python: после изменения
+    # стеммера или правки дел в обход приложения. Триггеры переносят изменения
+    # в CasesFts и OpponentStats. -> изменено дел
+    columns = ", ".join(SEARCH_COLUMNS)
+    assign = ", ".join(f"{c} = :{c}" for c in SEARCH_COLUMNS)
+    changed, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, opponent_name, description, {columns} FROM Cases WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk),
+        ).fetchall()
+        if not rows:
+            return changed
+        updates = []
+        for case_id, opponent_name, description, *current in rows:  # и без row_factory (миграция)
+            values = search_columns(opponent_name, description)
+            if list(values.values()) != current:
+                updates.append({"id": case_id, **values})
+        conn.executemany(f"UPDATE Cases SET {assign} WHERE id = :id", updates)
+        changed += len(updates)
+        last_id = rows[-1][0]
+
+
+def rebuild_index(conn: sqlite3.Connection) -> int:
+    # Полное перестроение колонок поиска, CasesFts и OpponentStats из Cases (миграция,
+    # после изменения стеммера в utils/text.py). Выполнять внутри транзакции. -> дел
+    if "opponent_fts" in {r[1] for r in conn.execute("PRAGMA table_info(Cases)")}:
+        refresh_columns(conn)
+        key, name, text = SEARCH_COLUMNS
+    else:
+        # База до миграции 12: колонок ещё нет, значения считают функции utils.text,
+        # которые миграция 10 регистрирует на своём соединении
+        key, name, text = "opponent_key(opponent_name)", "fts_name(opponent_name)", "fts_text(description)"
+    conn.execute("INSERT INTO CasesFts (CasesFts) VALUES ('delete-all')")
+    cur = conn.execute(f"""
+        INSERT INTO CasesFts (rowid, opponent, description)
+        SELECT id, {name}, {text} FROM Cases
+    """)
+    conn.execute("DELETE FROM OpponentStats")
+    # name — из дела с наибольшим id (голая колонка рядом с max() в SQLite)
+    conn.execute(f"""
+        INSERT INTO OpponentStats (opponent_key, name, cases, amount_sum)
+        SELECT key, name, cases, amount_sum FROM (
+          SELECT {key} AS key, opponent_name AS name, max(id),
+                 count(*) AS cases, total(amount) AS amount_sum
+          FROM Cases
+          GROUP BY key
+        )
+        WHERE key IS NOT NULL
+    """)
+    conn.execute("INSERT INTO CasesFts (CasesFts) VALUES ('optimize')")
+    _doc_freq_cached.cache_clear()
+    return cur.rowcount
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.search cases ТЕКСТ [--field opponent|description] [--limit 20]
+    # python -m utils.search similar ID_ДЕЛА | opponents [--min 2] [--limit 50] | opponent НАИМЕНОВАНИЕ
+    # python -m utils.search rebuild
+    usage = (
+        "usage: python -m utils.search cases TEXT [--field opponent|description] [--limit N]"
+        " | similar CASE_ID | opponents [--min N] [--limit N] | opponent NAME | rebuild"
+    )
+    commands = {
+        "cases": {"--field", "--limit"}, "similar": set(), "opponents": {"--min", "--limit"},
+        "opponent": set(), "rebuild": set(),
+    }
+    if not argv or argv[0] not in commands:
+        raise SystemExit(usage)
+    positional = 1 if argv[0] in ("cases", "similar", "opponent") else 0
+    rest = argv[1 + positional:]
+    opts = dict(zip(rest[::2], rest[1::2]))
+    if len(argv) < 1 + positional or len(rest) % 2 or set(opts) - commands[argv[0]]:
+        raise SystemExit(usage)
+    pool = get_pool()
+    if argv[0] == "rebuild":
+        with pool.transaction() as conn:
+            total = rebuild_index(conn)
+        print(f"indexed {total} cases")
+        return
+
+    with pool.connection() as conn:
+        if argv[0] == "opponents":
+            found = top_opponents(conn, int(opts.get("--min", MIN_CASES)), int(opts.get("--limit", 50)))
+            for r in found:
+                print(r["cases"], f"{r['amount_sum']:.2f}", r["name"], sep="\t")
+        elif argv[0] == "opponent":
+            found = opponent_cases(conn, argv[1])
+            for r in found:
+                print(r["id"], r["created_at"], r["status"], r["opponent_name"], sep="\t")
+        else:
+            if argv[0] == "cases":
+                found = search_cases(conn, argv[1], opts.get("--field"), int(opts.get("--limit", LIMIT)))
+            else:
+                case = conn.execute("SELECT description FROM Cases WHERE id = ?", (int(argv[1]),)).fetchone()
+                if case is None:
+                    raise SystemExit(f"дело {argv[1]} не найдено")
+                found = similar_cases(conn, case["description"] or "", exclude=int(argv[1]))
+            for r in found:
+                score = "-" if r["score"] is None else f"{r['score']:.2f}"
+                print(r["id"], score, r["opponent_name"], (r["description"] or "")[:80], sep="\t")
+    print(f"{len(found)} found")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
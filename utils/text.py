@@ -0,0 +1,206 @@
+# utils/text.py
+from __future__ import annotations
+from functools import lru_cache
+import re
+import sqlite3
+
+# Нормализация русского текста для полнотекстового поиска по делам (utils/search.py):
+# нижний регистр, ё -> е, стоп-слова, стемминг по алгоритму Snowball для русского
+# языка. Модуль лёгкий (без numpy): нормализованный текст считается при каждой
+# записи дела (utils/repository.py) и хранится в колонках Cases (search_columns).
+# Индекс норм (ml/kb.py) берёт отсюда words(), но стеммер у него свой, более грубый.
+# Изменение stem()/words() меняет уже проиндексированные основы: нужна миграция
+# с search.rebuild_index(), которая пересчитает колонки и CasesFts.
+
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+
+STOPWORDS = frozenset(
+    "а без в во вот для до его ее если же за и из или им их к как ко когда который "
+    "которые ли либо на над не нет но о об от по при с со так также то у чем что это "
+    "этого я мы вы он она они мне меня был была было были быть есть".split()
+)
+# Организационно-правовые формы: в ключе ответчика не учитываются,
+# чтобы «ООО «Ромашка»» и «Ромашка ООО» считались одним ответчиком
+ORG_FORMS = frozenset(
+    "ооо оао зао пао ао нао ип чп пбоюл гуп муп фгуп ано нко тсж тсн жск снт "
+    "llc ltd inc".split()
+)
+
+# =========================
+# Стеммер Snowball (russian)
+# =========================
+_VOWELS = frozenset("аеиоуыэюя")
+
+# Окончания первой группы отсекаются только после «а» или «я»
+_PERFECTIVE_GERUND = (("в", "вши", "вшись"), ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+_REFLEXIVE = ((), ("ся", "сь"))
+_ADJECTIVE = ((), (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+))
+_PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+_VERB = (
+    ("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно"),
+    (
+        "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым",
+        "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю",
+    ),
+)
+_NOUN = ((), (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий",
+    "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю",
+    "ия", "ья", "я",
+))
+_SUPERLATIVE = ((), ("ейше", "ейш"))
+_DERIVATIONAL = ((), ("ость", "ост"))
+
+
+def _by_length(group: tuple[tuple[str, ...], tuple[str, ...]]) -> tuple[tuple[str, bool], ...]:
+    # -> ((окончание, нужна ли перед ним «а»/«я»), ...) от длинных к коротким
+    return tuple(sorted(
+        [(e, True) for e in group[0]] + [(e, False) for e in group[1]],
+        key=lambda t: -len(t[0]),
+    ))
+
+
+_PERFECTIVE_GERUND_ = _by_length(_PERFECTIVE_GERUND)
+_REFLEXIVE_ = _by_length(_REFLEXIVE)
+_ADJECTIVE_ = _by_length(_ADJECTIVE)
+_PARTICIPLE_ = _by_length(_PARTICIPLE)
+_VERB_ = _by_length(_VERB)
+_NOUN_ = _by_length(_NOUN)
+_SUPERLATIVE_ = _by_length(_SUPERLATIVE)
+_DERIVATIONAL_ = _by_length(_DERIVATIONAL)
+
+
+def _strip(region: str, endings: tuple[tuple[str, bool], ...]) -> str | None:
+    # Отсекает самое длинное подходящее окончание внутри области; None — не нашлось
+    for ending, after_a in endings:
+        if region.endswith(ending):
+            rest = region[: -len(ending)]
+            if not after_a or rest.endswith(("а", "я")):
+                return rest
+    return None
+
+
+def _regions(word: str) -> tuple[int, int]:
+    # Начала областей RV и R2 (индексы в слове)
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    # Слово в нижнем регистре, ё уже заменена на е; латиница и цифры — без изменений
+    if not word or not ("а" <= word[0] <= "я" or "а" <= word[-1] <= "я"):
+        return word
+    rv, r2 = _regions(word)
+    head, region = word[:rv], word[rv:]
+
+    # Шаг 1: деепричастие, иначе возвратная частица + прилагательное / глагол / существительное
+    rest = _strip(region, _PERFECTIVE_GERUND_)
+    if rest is None:
+        unreflexive = _strip(region, _REFLEXIVE_)
+        if unreflexive is not None:
+            region = unreflexive
+        rest = _strip(region, _ADJECTIVE_)
+        if rest is not None:
+            participle = _strip(rest, _PARTICIPLE_)
+            rest = rest if participle is None else participle
+        else:
+            rest = _strip(region, _VERB_)
+            if rest is None:
+                rest = _strip(region, _NOUN_)
+    region = region if rest is None else rest
+
+    # Шаг 2: «и» на конце
+    if region.endswith("и"):
+        region = region[:-1]
+
+    # Шаг 3: словообразовательный суффикс в R2
+    r2_in_region = max(0, r2 - rv)
+    if len(region) > r2_in_region:
+        rest = _strip(region[r2_in_region:], _DERIVATIONAL_)
+        if rest is not None:
+            region = region[:r2_in_region] + rest
+
+    # Шаг 4: «нн» -> «н», превосходная степень, мягкий знак
+    if region.endswith("нн"):
+        region = region[:-1]
+    else:
+        rest = _strip(region, _SUPERLATIVE_)
+        if rest is not None:
+            region = rest[:-1] if rest.endswith("нн") else rest
+        elif region.endswith("ь"):
+            region = region[:-1]
+    return head + region
+
+
+def words(text: str | None) -> list[str]:
+    # Слова без стоп-слов и однобуквенных, нижний регистр, ё -> е
+    found = _WORD_RE.findall((text or "").lower().replace("ё", "е"))
+    return [w for w in found if w not in STOPWORDS and len(w) > 1]
+
+
+def tokenize(text: str | None) -> list[str]:
+    return [stem(w) for w in words(text)]
+
+
+# =========================
+# Колонки поиска в Cases (триггеры CasesFts, OpponentStats и индекс по ключу ответчика)
+# =========================
+SEARCH_COLUMNS = ("opponent_key", "opponent_fts", "description_fts")
+
+
+def fts_text(text: str | None) -> str | None:
+    # Текст -> основы через пробел: так его индексирует CasesFts
+    return " ".join(tokenize(text)) if text else None
+
+
+def fts_name(name: str | None) -> str | None:
+    # Наименование ответчика -> слова и их основы: стеммер ошибается на фамилиях
+    # («Петрова» -> «петров», «Петров» -> «петр»), а слово целиком находится всегда
+    if not name:
+        return None
+    found = []
+    for w in words(name):
+        found.append(w)
+        if stem(w) != w:
+            found.append(stem(w))
+    return " ".join(found)
+
+
+def opponent_key(name: str | None) -> str | None:
+    # «ООО «Ромашка»», «Ромашка, ООО» -> «ромашка». Слова без стемминга (иначе
+    # «Петров» и «Петрова» склеились бы) и без учёта порядка; None — ключа нет.
+    key = " ".join(sorted({w for w in words(name) if w not in ORG_FORMS}))
+    return key or None
+
+
+def search_columns(opponent_name: str | None, description: str | None) -> dict:
+    # -> значения SEARCH_COLUMNS для дела; пишутся в Cases вместе с самим делом
+    return {
+        "opponent_key": opponent_key(opponent_name),
+        "opponent_fts": fts_name(opponent_name),
+        "description_fts": fts_text(description),
+    }
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    # Функции SQL для миграции 10 (utils/db_init.py): её триггеры и индекс по выражению
+    # заменены колонками SEARCH_COLUMNS в миграции 12, приложение их не регистрирует
+    conn.create_function("fts_text", 1, fts_text, deterministic=True)
+    conn.create_function("fts_name", 1, fts_name, deterministic=True)
+    conn.create_function("opponent_key", 1, opponent_key, deterministic=True)
@@ -0,0 +1,117 @@
+# utils/users.py
+from __future__ import annotations
+from typing import Optional
+import re
+import sqlite3
+import sys
+
+from utils.db import get_pool
+
+# Один человек — одна строка Users. Ключи идентичности — нормализованные email и
+# телефон (Users.email_key / Users.phone_key, уникальные частичные индексы);
+# сами email и phone хранятся в том виде, в каком их ввёл пользователь.
+
+_NON_DIGITS = re.compile(r"\D+")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email if _EMAIL_RE.match(email) else None
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    # -> E.164: «8 (900) 000-00-00», «+7 900 0000000» и «9000000000» — один ключ +79000000000
+    digits = _NON_DIGITS.sub("", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and digits[0] == "9":
+        digits = "7" + digits
+    return f"+{digits}" if 10 <= len(digits) <= 15 else None
+
+
+# =========================
+# Слияние дублей (разовая задача и шаг миграции)
+# =========================
+_PROFILE = ("fio", "email", "phone", "resident_region", "resident_city", "resident_address")
+
+
+def _find(parent: dict[int, int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def merge_duplicates(conn: sqlite3.Connection) -> tuple[int, int]:
+    # Пересчитывает ключи и сливает пользователей с общим email или телефоном
+    # (транзитивно: A~B по email, B~C по телефону -> одна группа). Остаётся самая
+    # старая строка с самыми новыми данными; Cases.user_id переносится одним UPDATE.
+    # Выполнять внутри транзакции. -> (групп слито, строк удалено)
+    rows = conn.execute(f"SELECT id, {', '.join(_PROFILE)} FROM Users ORDER BY id").fetchall()
+    keys = {r[0]: (normalize_email(r[2]), normalize_phone(r[3])) for r in rows}
+    parent = {user_id: user_id for user_id in keys}
+    first_by_key: dict[tuple[str, str], int] = {}
+    for user_id, (email_key, phone_key) in keys.items():
+        for key in (("email", email_key), ("phone", phone_key)):
+            if key[1] is None:
+                continue
+            other = first_by_key.setdefault(key, user_id)
+            parent[_find(parent, user_id)] = _find(parent, other)
+
+    groups: dict[int, list[int]] = {}
+    for user_id in keys:
+        groups.setdefault(_find(parent, user_id), []).append(user_id)
+    merges = [(old, min(ids)) for ids in groups.values() if len(ids) > 1 for old in ids if old != min(ids)]
+
+    # Ключи пишутся заново после слияния, чтобы не упереться в уникальные индексы
+    conn.execute("UPDATE Users SET email_key = NULL, phone_key = NULL")
+    if merges:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _user_merge (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+        conn.execute("DELETE FROM _user_merge")
+        conn.executemany("INSERT INTO _user_merge VALUES (?, ?)", merges)
+        conn.execute("""
+            UPDATE Cases
+            SET user_id = (SELECT new_id FROM _user_merge WHERE old_id = Cases.user_id)
+            WHERE user_id IN (SELECT old_id FROM _user_merge)
+        """)
+        # Профиль: по каждому полю — самое новое непустое значение в группе
+        by_id = {r[0]: r for r in rows}
+        profiles = []
+        for ids in groups.values():
+            if len(ids) > 1:
+                newest_first = [by_id[i] for i in sorted(ids, reverse=True)]
+                profiles.append((
+                    *(next((r[n] for r in newest_first if r[n]), None) for n in range(1, len(_PROFILE) + 1)),
+                    min(ids),
+                ))
+        conn.executemany(
+            f"UPDATE Users SET {', '.join(f'{c} = ?' for c in _PROFILE)} WHERE id = ?", profiles
+        )
+        conn.execute("DELETE FROM Users WHERE id IN (SELECT old_id FROM _user_merge)")
+        conn.execute("DROP TABLE _user_merge")
+
+    # Ключи — по итоговым email/телефону. Ключи разных групп не пересекаются,
+    # поэтому уникальные индексы не нарушаются.
+    conn.executemany(
+        "UPDATE Users SET email_key = ?, phone_key = ? WHERE id = ?",
+        (
+            (normalize_email(r[1]), normalize_phone(r[2]), r[0])
+            for r in conn.execute("SELECT id, email, phone FROM Users").fetchall()
+            if r[1] or r[2]
+        ),
+    )
+    return sum(1 for ids in groups.values() if len(ids) > 1), len(merges)
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.users dedup
+    if argv[:1] != ["dedup"]:
+        raise SystemExit("usage: python -m utils.users dedup")
+    with get_pool().transaction() as conn:
+        groups, removed = merge_duplicates(conn)
+    print(f"merged {groups} groups, removed {removed} duplicate users")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,370 @@
+# utils/validation.py
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING, Collection, Iterator, Mapping, Optional
+import sqlite3
+import sys
+
+from utils import repository
+from utils.db import get_pool
+from utils.evidence import EvidenceRegistry, get_registry
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Правила анкеты дела — общие для формы (app/app.py), массового импорта
+# (utils/bulk.py) и API. Правило объявлено один раз и проверяет либо одну анкету
+# (validate), либо DataFrame анкет целиком, по колонкам (validate_frame) —
+# так после изменения правил перепроверяется вся база без цикла по делам.
+#
+# Анкета — словарь с полями формы: fio, email, phone, region, city, address,
+# court_id, court_name_override, opponent_name, amount, event_date, description,
+# category, doc_type, evidence (id отмеченных доказательств: коллекция или
+# строка «id1;id2»). Ошибки — {ключ: сообщение}; ключи — те же, что у полей формы.
+# pandas импортируется только в пакетном режиме: форме он не нужен.
+
+FRAME_CHUNK_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class Context:
+    registry: EvidenceRegistry
+    today: date
+    courts: Optional[Collection[int]] = None  # id судов справочника; None — не проверять
+
+
+def _blank(value: object) -> bool:
+    return value is None or (isinstance(value, float) and value != value) or not str(value).strip()
+
+
+def _blank_column(column: pd.Series) -> pd.Series:
+    return column.isna() | (column.astype(str).str.strip() == "")
+
+
+def evidence_ids(value: object) -> frozenset[str]:
+    # «id1;id2», {id: 0/1} или коллекция id -> множество отмеченных
+    if isinstance(value, str):
+        return frozenset(v.strip() for v in value.split(";") if v.strip())
+    if isinstance(value, Mapping):
+        return frozenset(k for k, v in value.items() if v)
+    if value is None or isinstance(value, float):
+        return frozenset()
+    return frozenset(value)
+
+
+# =========================
+# Правила
+# =========================
+@dataclass(frozen=True)
+class Rule(ABC):
+    # Правило без одного из режимов проверки не создаётся (TypeError при объявлении RULES)
+    key: str
+    message: str
+
+    @abstractmethod
+    def failed(self, form: Mapping, ctx: Context) -> bool: ...
+
+    @abstractmethod
+    def failed_frame(self, df: pd.DataFrame, ctx: Context) -> pd.Series: ...
+
+
+@dataclass(frozen=True)
+class Required(Rule):
+    field: str
+
+    def failed(self, form, ctx):
+        return _blank(form.get(self.field))
+
+    def failed_frame(self, df, ctx):
+        return _blank_column(df[self.field])
+
+
+@dataclass(frozen=True)
+class Positive(Rule):
+    field: str
+
+    def failed(self, form, ctx):
+        try:
+            return not float(form.get(self.field)) > 0
+        except (TypeError, ValueError):
+            return True
+
+    def failed_frame(self, df, ctx):
+        import pandas as pd
+
+        return ~(pd.to_numeric(df[self.field], errors="coerce") > 0)
+
+
+def _as_date(value: object) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class NotFuture(Rule):
+    field: str
+
+    def failed(self, form, ctx):
+        day = _as_date(form.get(self.field))
+        return day is not None and day > ctx.today
+
+    def failed_frame(self, df, ctx):
+        import pandas as pd
+
+        days = pd.to_datetime(df[self.field].astype(str).str[:10], errors="coerce", format="%Y-%m-%d")
+        return days > pd.Timestamp(ctx.today)
+
+
+@dataclass(frozen=True)
+class CourtChosen(Rule):
+    # Суд из справочника или название, введённое вручную
+    def failed(self, form, ctx):
+        return _blank(form.get("court_id")) and _blank(form.get("court_name_override"))
+
+    def failed_frame(self, df, ctx):
+        return _blank_column(df["court_id"]) & _blank_column(df["court_name_override"])
+
+
+@dataclass(frozen=True)
+class CourtKnown(Rule):
+    def failed(self, form, ctx):
+        court_id = form.get("court_id")
+        return ctx.courts is not None and not _blank(court_id) and int(court_id) not in ctx.courts
+
+    def failed_frame(self, df, ctx):
+        import pandas as pd
+
+        if ctx.courts is None:
+            return pd.Series(False, index=df.index)
+        court_id = pd.to_numeric(df["court_id"], errors="coerce")
+        return court_id.notna() & ~court_id.isin(list(ctx.courts))
+
+
+@dataclass(frozen=True)
+class CategoryKnown(Rule):
+    def failed(self, form, ctx):
+        category = form.get("category")
+        return not _blank(category) and category not in ctx.registry.categories
+
+    def failed_frame(self, df, ctx):
+        return ~_blank_column(df["category"]) & ~df["category"].isin(list(ctx.registry.categories))
+
+
+def _doc_types(registry: EvidenceRegistry) -> list[str]:
+    return [f"{c.id}/{d}" for c in registry.categories.values() for d in c.doc_types]
+
+
+@dataclass(frozen=True)
+class DocTypeChosen(Rule):
+    # Проверяется, только когда категория известна
+    def failed(self, form, ctx):
+        return form.get("category") in ctx.registry.categories and _blank(form.get("doc_type"))
+
+    def failed_frame(self, df, ctx):
+        return df["category"].isin(list(ctx.registry.categories)) & _blank_column(df["doc_type"])
+
+
+@dataclass(frozen=True)
+class DocTypeKnown(Rule):
+    def failed(self, form, ctx):
+        category = ctx.registry.categories.get(form.get("category"))
+        doc_type = form.get("doc_type")
+        return category is not None and not _blank(doc_type) and doc_type not in category.doc_types
+
+    def failed_frame(self, df, ctx):
+        pair = df["category"].astype(str) + "/" + df["doc_type"].astype(str)
+        return (
+            df["category"].isin(list(ctx.registry.categories))
+            & ~_blank_column(df["doc_type"])
+            & ~pair.isin(_doc_types(ctx.registry))
+        )
+
+
+# Порядок — порядок сообщений под формой. Для одного ключа выводится
+# первое нарушенное правило.
+RULES: tuple[Rule, ...] = (
+    Required("category", "Выберите категорию спора.", "category"),
+    CategoryKnown("category", "Неизвестная категория спора."),
+    DocTypeChosen("doc_type", "Выберите тип документа."),
+    DocTypeKnown("doc_type", "Неизвестный тип документа."),
+    Required("fio", "Укажите ФИО истца.", "fio"),
+    Required("region", "Укажите регион истца.", "region"),
+    Required("city", "Укажите город истца.", "city"),
+    Required("address", "Укажите адрес истца.", "address"),
+    CourtChosen("court_idx", "Выберите суд из справочника или укажите его вручную."),
+    CourtKnown("court_idx", "Суда нет в справочнике."),
+    Required("opponent_name", "Укажите наименование ответчика.", "opponent_name"),
+    Positive("amount", "Сумма требований должна быть больше 0.", "amount"),
+    Required("event_date", "Укажите дату события.", "event_date"),
+    NotFuture("event_date", "Дата события не может быть в будущем.", "event_date"),
+    Required("description", "Опишите ситуацию (минимум 1–2 предложения).", "description"),
+)
+# Обязательные доказательства — из kb/evidence_schema.yaml (см. _evidence_errors)
+EVIDENCE_MESSAGE = "Обязательное доказательство не отмечено: «{label}»."
+UNKNOWN_EVIDENCE_MESSAGE = "Неизвестные доказательства: {ids}."
+
+
+def make_context(
+    registry: Optional[EvidenceRegistry] = None,
+    today: Optional[date] = None,
+    courts: Optional[Collection[int]] = None,
+) -> Context:
+    return Context(registry or get_registry(), today or date.today(), courts)
+
+
+# =========================
+# Одна анкета
+# =========================
+def validate(form: Mapping, ctx: Optional[Context] = None) -> dict[str, str]:
+    ctx = ctx or make_context()
+    errors: dict[str, str] = {}
+    for rule in RULES:
+        if rule.key not in errors and rule.failed(form, ctx):
+            errors[rule.key] = rule.message
+    schema = ctx.registry.doc_type(form.get("category"), form.get("doc_type"))
+    if schema is not None:
+        present = evidence_ids(form.get("evidence"))
+        for item in schema.required:
+            if item.id not in present:
+                errors[f"ev_required_{item.id}"] = EVIDENCE_MESSAGE.format(label=item.label)
+        unknown = sorted(present - schema.items.keys())
+        if unknown:
+            errors["evidence"] = UNKNOWN_EVIDENCE_MESSAGE.format(ids=", ".join(unknown))
+    return errors
+
+
+# =========================
+# Пачка анкет (DataFrame, по колонкам)
+# =========================
+def _evidence_long(column: pd.Series) -> pd.Series:
+    # Колонка evidence -> по строке на отмеченное доказательство (индекс — строка анкеты)
+    import pandas as pd
+
+    if pd.api.types.infer_dtype(column, skipna=True) in ("string", "empty"):
+        parts = column.fillna("").str.split(";")
+    else:
+        parts = column.map(lambda v: sorted(evidence_ids(v)))
+    long = parts.explode().dropna().astype(str).str.strip()
+    return long[long != ""]
+
+
+def _errors(rows: pd.Index, key: str, message: object) -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.DataFrame({"row": rows, "key": key, "message": message})
+
+
+def _evidence_errors(df: pd.DataFrame, ctx: Context) -> Iterator[pd.DataFrame]:
+    import pandas as pd
+
+    long = _evidence_long(df["evidence"]) if "evidence" in df else pd.Series(dtype=object)
+    pair = df["category"].astype(str) + "/" + df["doc_type"].astype(str)
+    for category in ctx.registry.categories.values():
+        for doc_type in category.doc_types.values():
+            rows = pair == f"{category.id}/{doc_type.id}"
+            if not rows.any():
+                continue
+            for item in doc_type.required:
+                missing = rows & ~df.index.isin(long.index[long == item.id])
+                if missing.any():
+                    yield _errors(df.index[missing.to_numpy()], f"ev_required_{item.id}",
+                                  EVIDENCE_MESSAGE.format(label=item.label))
+    # Неизвестные id: «категория/тип/id» нет в реестре (у известного типа документа)
+    if len(long):
+        long_pair = pair.reindex(long.index)
+        known = [f"{c}/{d}/{i}" for c, d, i in ctx.registry.items]
+        bad = long[long_pair.isin(_doc_types(ctx.registry)) & ~(long_pair + "/" + long).isin(known)]
+        if len(bad):
+            ids = bad.groupby(level=0, sort=False).agg(lambda s: ", ".join(sorted(set(s))))
+            yield _errors(ids.index, "evidence", ids.map(lambda j: UNKNOWN_EVIDENCE_MESSAGE.format(ids=j)).to_numpy())
+
+
+def _no_errors() -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.DataFrame({"row": pd.Series(dtype=object), "key": pd.Series(dtype=str), "message": pd.Series(dtype=str)})
+
+
+def validate_frame(df: pd.DataFrame, ctx: Optional[Context] = None) -> pd.DataFrame:
+    # -> DataFrame (row, key, message): по строке на ошибку, row — индекс df.
+    # Каждое правило — одна векторная операция над колонками.
+    import pandas as pd
+
+    ctx = ctx or make_context()
+    for column in ("court_id", "court_name_override", "category", "doc_type"):
+        if column not in df:
+            df = df.assign(**{column: None})
+    failed_keys: dict[str, pd.Series] = {}
+    frames = []
+    for rule in RULES:
+        mask = rule.failed_frame(df, ctx).fillna(False).astype(bool)
+        if rule.key in failed_keys:
+            mask &= ~failed_keys[rule.key]
+            failed_keys[rule.key] |= mask
+        else:
+            failed_keys[rule.key] = mask
+        if mask.any():
+            frames.append(_errors(df.index[mask.to_numpy()], rule.key, rule.message))
+    frames.extend(_evidence_errors(df, ctx))
+    if not frames:
+        return _no_errors()
+    # Внутри строки — порядок правил, как под формой
+    return pd.concat(frames, ignore_index=True).sort_values("row", kind="stable", ignore_index=True)
+
+
+def errors_by_row(errors: pd.DataFrame) -> dict[object, dict[str, str]]:
+    return {
+        row: dict(zip(group["key"], group["message"]))
+        for row, group in errors.groupby("row", sort=False)
+    }
+
+
+# =========================
+# Перепроверка базы
+# =========================
+def case_frames(conn: sqlite3.Connection, chunk_size: int = FRAME_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    # Дела в виде анкет (repository.CASE_FORMS_SQL), индекс — Cases.id
+    import pandas as pd
+
+    for chunk in pd.read_sql_query(
+        repository.CASE_FORMS_SQL, conn, params={"category": None, "status": None},
+        index_col="id", chunksize=chunk_size,
+    ):
+        yield chunk
+
+
+def validate_cases(conn: sqlite3.Connection, ctx: Optional[Context] = None) -> pd.DataFrame:
+    # Все дела базы по текущим правилам -> (case_id, key, message)
+    import pandas as pd
+
+    ctx = ctx or make_context(courts={r[0] for r in conn.execute("SELECT id FROM Courts")})
+    frames = [validate_frame(chunk, ctx) for chunk in case_frames(conn)]
+    errors = pd.concat(frames, ignore_index=True) if frames else _no_errors()
+    return errors.rename(columns={"row": "case_id"})
+
+
+def main(argv: list[str]) -> None:
+    # python -m utils.validation check [--out errors.csv]
+    usage = "usage: python -m utils.validation check [--out FILE.csv]"
+    if not argv or argv[0] != "check" or len(argv) not in (1, 3) or (len(argv) == 3 and argv[1] != "--out"):
+        raise SystemExit(usage)
+    with get_pool().connection() as conn:
+        errors = validate_cases(conn)
+    for key, n in errors["key"].value_counts().items():
+        print(f"{key}\t{n}")
+    print(f"{errors['case_id'].nunique()} cases violate current rules")
+    if len(argv) == 3:
+        errors.to_csv(Path(argv[2]), index=False, encoding="utf-8-sig")
+    if len(errors):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])